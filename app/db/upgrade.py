@@ -0,0 +1,76 @@
+"""
+Columns added to tables that existing databases already have.
+
+`Base.metadata.create_all` only creates missing tables, so a database created
+before a column was added to a model would fail every query on that table.
+At startup, upgrade_schema adds each missing column below with
+ALTER TABLE ... ADD COLUMN and then runs the backfills. Both are safe to run
+on every start.
+"""
+import secrets
+
+from sqlalchemy import inspect, text
+
+from app.db.base import Base
+
+# (table, column, SQL default for existing rows or None to leave them NULL)
+ADDED_COLUMNS = [
+    # Per-chatbot chunking
+    ("chat_bots", "chunk_size_tokens", None),
+    ("chat_bots", "chunk_overlap_tokens", None),
+    # Public widget embed codes; added nullable, filled in by backfill_embed_codes
+    ("chat_bots", "embed_code", None),
+    # Per-chatbot rate limits; NULL uses the configured defaults
+    ("chat_bots", "rate_limit_per_minute", None),
+    ("chat_bots", "visitor_rate_limit_per_minute", None),
+    # Direct-to-storage uploads; documents from before them were ingested already
+    ("documents", "status", "'ready'"),
+    ("documents", "storage_key", None),
+    # Conversation starts; NULL for older messages, which analytics backfill infers from idle gaps
+    ("chat_messages", "starts_conversation", None),
+    # Ingestion progress; unknown for documents ingested before it was recorded
+    ("documents", "pages_total", None),
+    ("documents", "pages_indexed", None),
+    ("documents", "chunks_indexed", None),
+    ("documents", "first_chunk_seconds", None),
+    ("documents", "indexed_at", None),
+    # Start of the last (re-)indexing; NULL falls back to uploaded_at
+    ("documents", "processing_started_at", None),
+]
+
+
+def backfill_embed_codes(connection):
+    """Gives chatbots created before embed codes one each, then enforces their uniqueness."""
+    rows = connection.execute(text("SELECT id FROM chat_bots WHERE embed_code IS NULL")).fetchall()
+    for (chatbot_id,) in rows:
+        connection.execute(
+            text("UPDATE chat_bots SET embed_code = :code WHERE id = :id"),
+            {"code": secrets.token_urlsafe(12), "id": chatbot_id},
+        )
+    connection.exec_driver_sql("CREATE UNIQUE INDEX IF NOT EXISTS ix_chat_bots_embed_code ON chat_bots (embed_code)")
+
+
+# Run after the columns are added, for every existing table; each only touches rows that need it
+BACKFILLS = [
+    ("chat_bots", backfill_embed_codes),
+]
+
+
+def upgrade_schema(connection):
+    """Adds the model columns missing from existing tables, then backfills them."""
+    inspector = inspect(connection)
+    tables = set(inspector.get_table_names())
+    for table_name, column_name, default in ADDED_COLUMNS:
+        if table_name not in tables:
+            continue  # created with every column by create_all
+        if column_name in {column["name"] for column in inspector.get_columns(table_name)}:
+            continue
+        column = Base.metadata.tables[table_name].c[column_name]
+        ddl = f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column.type.compile(dialect=connection.dialect)}"
+        if default is not None:
+            ddl += f" NOT NULL DEFAULT {default}"
+        connection.exec_driver_sql(ddl)
+        print(f"Added column {table_name}.{column_name}")
+    for table_name, backfill in BACKFILLS:
+        if table_name in tables:
+            backfill(connection)
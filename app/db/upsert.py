@@ -0,0 +1,28 @@
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+
+def increment_rows(db: Session, model, rows: list, keys: tuple, counters: tuple):
+    """
+    Inserts `rows`, or adds their `counters` to the existing row with the same `keys`.
+    One INSERT ... ON CONFLICT DO UPDATE on SQLite and Postgres; the caller commits.
+    """
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = insert(model).values(rows)
+        table = model.__table__
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={name: table.c[name] + stmt.excluded[name] for name in counters},
+        ))
+        return
+    for row in rows:  # other databases: read-modify-write
+        existing = db.get(model, tuple(row[key] for key in keys))
+        if existing is None:
+            db.add(model(**row))
+        else:
+            for name in counters:
+                setattr(existing, name, getattr(existing, name) + row[name])
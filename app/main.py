@@ -1,12 +1,21 @@
-from fastapi import FastAPI
+from fastapi import BackgroundTasks, FastAPI, Header, HTTPException
+from fastapi.responses import FileResponse
 from app.db.base import Base
 from app.db.session import engine
+from app.db.upgrade import upgrade_schema
 from app.routes.user import router as user_router
 from app.routes.document import router as document_router
+from app.routes.widget import router as widget_router
 from fastapi import Depends
 from sqlalchemy.orm import Session
 from app.db.session import get_db
 from app.models.models import User
+from app.utils.metrics import metrics
+from app.utils.profiling import ProfilingMiddleware, request_profiler
+from app.utils.search import install_search_index
+from app.utils.usage import usage_meter
+from app.utils.vector_gc import vector_gc
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 
 # Add CORS middleware to allow frontend at http://localhost:5173
@@ -15,27 +24,49 @@ origins = [
 ]
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Buffered usage counters are flushed periodically, and once more on shutdown
+    usage_meter.start()
+    vector_gc.start()
+    yield
+    vector_gc.stop()
+    usage_meter.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Profile-Id"],
 )
+# Installed only when configured, so unprofiled deployments pay nothing
+if request_profiler.enabled:
+    app.add_middleware(ProfilingMiddleware, profiler=request_profiler)
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
+# Tables created before a column was added to their model get it here
+with engine.begin() as connection:
+    upgrade_schema(connection)
+# Tables created before full-text search existed get their index here
+with engine.begin() as connection:
+    install_search_index(connection)
 
 # Include routers
 app.include_router(user_router, prefix="/users", tags=["users"])
 app.include_router(document_router, prefix="/chatbots", tags=["chatbots"])
+app.include_router(widget_router, prefix="/widget", tags=["widget"])
 
 @app.delete("/reset")
-def reset_database():
+def reset_database(background_tasks: BackgroundTasks):
     """
     Reset the database by dropping all tables except the users table,
-    then recreating the dropped tables.
+    then recreating the dropped tables. The dropped documents' chunks are
+    removed from the vector store in the background.
     """
     # Get all table names except 'users'
     tables_to_drop = [table.name for table in Base.metadata.sorted_tables if table.name != "users"]
@@ -45,19 +76,22 @@ def reset_database():
     # Recreate the dropped tables
     if tables_to_drop:
         Base.metadata.create_all(bind=engine, tables=[table for table in Base.metadata.sorted_tables if table.name in tables_to_drop])
+    background_tasks.add_task(vector_gc.collect)
     return {"status": "Database reset successfully (except users table)."}
 
 
 @app.delete("/reset/all")
-def reset_all_database():
+def reset_all_database(background_tasks: BackgroundTasks):
     """
     Reset the database by dropping all tables including the users table,
-    then recreating all tables.
+    then recreating all tables. All chunks are removed from the vector store
+    in the background.
     """
     # Drop all tables
     Base.metadata.drop_all(bind=engine)
     # Recreate all tables
     Base.metadata.create_all(bind=engine)
+    background_tasks.add_task(vector_gc.collect)
     return {"status": "Database fully reset (all tables dropped and recreated)."}
 
 @app.get("/users", tags=["users"])
@@ -66,7 +100,42 @@ def get_all_users(db: Session = Depends(get_db)):
     return users
 
 
+@app.get("/metrics")
+def get_metrics():
+    """
+    Process-local counters, gauges and component statistics for this worker.
+    """
+    return metrics.snapshot()
+
+
+def require_profiling_token(x_profile: str | None):
+    if not request_profiler.authorized(x_profile):
+        raise HTTPException(status_code=403, detail="A valid X-Profile token is required.")
+
+
+@app.get("/profiles")
+def list_profiles(x_profile: str | None = Header(None)):
+    """
+    Request profiles kept by this worker, newest first.
+    """
+    require_profiling_token(x_profile)
+    return request_profiler.store.list()
+
+
+@app.get("/profiles/{profile_id}")
+def download_profile(profile_id: str, x_profile: str | None = Header(None)):
+    """
+    A profile as collapsed stacks, for speedscope or flamegraph.pl.
+    """
+    require_profiling_token(x_profile)
+    path = request_profiler.store.path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found; it may have been rotated out.")
+    return FileResponse(path, media_type="text/plain", filename=f"{profile_id}.folded")
+
+
 @app.get("/")
-def check_health():
+async def check_health():
+    # Served on the event loop, so it answers even while every worker thread is busy
     return {"status": "ok"}
 
@@ -1,8 +1,9 @@
 import uuid
+import secrets
 from datetime import datetime, timezone
 
 from sqlalchemy import (
-    Column, String, Text, Boolean, DateTime, ForeignKey, Table
+    Column, String, Text, Boolean, DateTime, ForeignKey, Table, Integer, BigInteger, Float, UniqueConstraint
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID
@@ -42,6 +43,17 @@ class Document(Base):
     filepath = Column(String, nullable=False)
     file_type = Column(String, nullable=False)
     uploaded_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    # "pending_upload" -> "processing" -> "ready" | "failed" for direct-to-storage uploads
+    status = Column(String, nullable=False, default="ready")
+    storage_key = Column(String, nullable=True)
+    # Ingestion progress; chunks are queryable as soon as they are counted here
+    pages_total = Column(Integer, nullable=True)
+    pages_indexed = Column(Integer, nullable=True)
+    chunks_indexed = Column(Integer, nullable=True)
+    first_chunk_seconds = Column(Float, nullable=True)  # from the start of ingestion to the first queryable chunk
+    indexed_at = Column(DateTime, nullable=True)
+    # When the document last became "processing"; re-indexing starts long after the upload
+    processing_started_at = Column(DateTime, nullable=True)
 
     user = relationship("User", back_populates="documents")
     chatbots = relationship("ChatBot", secondary=chatbot_document_association, back_populates="documents")
@@ -57,6 +69,8 @@ class ChatMessage(Base):
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     chatbot_id = Column(String, ForeignKey("chat_bots.id"), nullable=True)
+    # True for the first user message of a conversation; NULL on rows saved before it was recorded
+    starts_conversation = Column(Boolean, nullable=True)
 
     user = relationship("User", back_populates="chat_messages")
     chatbot = relationship("ChatBot", backref="chat_messages")
@@ -74,7 +88,90 @@ class ChatBot(Base):
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
     last_trained = Column(DateTime, nullable=True)
+    embed_code = Column(String, unique=True, index=True, nullable=False, default=lambda: secrets.token_urlsafe(12))
+    chunk_size_tokens = Column(Integer, nullable=True)
+    chunk_overlap_tokens = Column(Integer, nullable=True)
+    rate_limit_per_minute = Column(Integer, nullable=True)
+    visitor_rate_limit_per_minute = Column(Integer, nullable=True)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
 
     user = relationship("User", back_populates="chatbots")
     documents = relationship("Document", secondary=chatbot_document_association, back_populates="chatbots")
+
+# ----------------------- ChatRollup Model -----------------------
+class ChatRollup(Base):
+    """Per-chatbot message counts for one hour or one day (UTC), kept up to date as messages are saved."""
+    __tablename__ = "chat_rollups"
+
+    chatbot_id = Column(String, ForeignKey("chat_bots.id"), primary_key=True)
+    granularity = Column(String, primary_key=True)  # "hour" or "day"
+    bucket_start = Column(DateTime, primary_key=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    user_messages = Column(Integer, nullable=False, default=0)
+    bot_messages = Column(Integer, nullable=False, default=0)
+    conversations = Column(Integer, nullable=False, default=0)
+    user_chars = Column(Integer, nullable=False, default=0)
+    bot_chars = Column(Integer, nullable=False, default=0)
+
+# ----------------------- UsageRecord Model -----------------------
+class UsageRecord(Base):
+    """Metered usage per user and chatbot for one UTC hour; chatbot_id is "" for usage outside a chatbot."""
+    __tablename__ = "usage_records"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    chatbot_id = Column(String, primary_key=True, default="")
+    bucket_start = Column(DateTime, primary_key=True)
+    requests = Column(BigInteger, nullable=False, default=0)
+    latency_ms = Column(BigInteger, nullable=False, default=0)
+    llm_calls = Column(BigInteger, nullable=False, default=0)
+    llm_latency_ms = Column(BigInteger, nullable=False, default=0)
+    prompt_tokens = Column(BigInteger, nullable=False, default=0)
+    completion_tokens = Column(BigInteger, nullable=False, default=0)
+    embedding_tokens = Column(BigInteger, nullable=False, default=0)
+
+# ----------------------- Embedding migration Models -----------------------
+class EmbeddingRoute(Base):
+    """The Chroma collection (and embedding model) serving a tenant; tenant "*" covers everyone else."""
+    __tablename__ = "embedding_routes"
+
+    tenant = Column(String, primary_key=True)
+    collection_name = Column(String, nullable=False)
+    provider = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+
+class EmbeddingMigration(Base):
+    """Progress of re-embedding one tenant's chunks into a new collection."""
+    __tablename__ = "embedding_migrations"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    tenant = Column(String, nullable=False)
+    source_collection = Column(String, nullable=False)
+    target_collection = Column(String, nullable=False)
+    provider = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending, copying, copied, switched, failed
+    checkpoint = Column(Integer, nullable=False, default=0)  # source chunks read so far
+    chunks_done = Column(Integer, nullable=False, default=0)
+    chunks_total = Column(Integer, nullable=True)
+    copy_seconds = Column(Float, nullable=False, default=0.0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (UniqueConstraint("tenant", "target_collection"),)
+
+# ----------------------- AnswerBank Model -----------------------
+class AnswerBank(Base):
+    """State of a chatbot's precomputed question/answer pairs; chatbots without a row have no bank."""
+    __tablename__ = "answer_banks"
+
+    chatbot_id = Column(String, ForeignKey("chat_bots.id"), primary_key=True)
+    status = Column(String, nullable=False, default="pending")  # pending, building, ready, failed
+    version = Column(String, nullable=True)  # tags the entries of the current build in the vector store
+    document_ids = Column(Text, nullable=True)  # JSON list of the (sorted) documents it was built from
+    entries = Column(Integer, nullable=False, default=0)
+    built_at = Column(DateTime, nullable=True)
+    error = Column(Text, nullable=True)
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
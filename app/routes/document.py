@@ -1,18 +1,60 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, BackgroundTasks, Form
+from fastapi import (APIRouter, UploadFile, File, HTTPException, Depends, BackgroundTasks, Form, Query, Request, Response,
+                     WebSocket, WebSocketDisconnect, status)
 from sqlalchemy.orm import Session
 from app.db.session import get_db
-from app.models.models import Document, ChatBot, ChatMessage
-from app.utils import precess_pdf, save_pdf, get_current_user
-from typing import Annotated
+from app.models.models import AnswerBank, Document, ChatBot, ChatMessage
+from app.schemas import PresignUploadRequest, PresignUploadOut, UploadStatusOut
+from app.utils import precess_pdf, save_pdf, document_store, get_current_user
+from app.setting import current_config
+from app.utils.singleflight import SingleFlight, normalize_query
+from app.utils.rate_limit import chat_rate_limiter, llm_gate, too_many_requests
+from app.utils.llm_scheduler import LLMQueueTimeout, LLMTimeout, LLMUnavailable
+from app.routes.widget import widget_cache
+from app.utils.export import gzip_chunks, iter_csv, iter_ndjson
+from app.utils.analytics import chatbot_stats, rebuild_days, record_message, utc_naive
+from app.utils.search import SearchUnavailable, search_messages
+from app.utils.usage import usage_meter
+from app.utils.answer_bank import answer_bank, fingerprint
+from app.utils.chunking import estimate_tokens
+from app.utils.ingestion import ingestion_executor, ingestion_tracker, progress_out
+from app.utils.circuit_breaker import CircuitOpen
+from app.utils.deadline import Deadline, DeadlineExceeded
+from app.utils.message_writer import message_writer
+from app.utils.metrics import metrics
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from concurrent.futures import as_completed
+from typing import Annotated, Literal
+from datetime import datetime, timezone
 from pydantic import BaseModel
+import asyncio
 import uuid
 import json
+import os
+import time
 
 router = APIRouter()
 
+# Identical first questions to the same chatbot share one retrieval and LLM call
+chat_flight = SingleFlight("chat")
+
 # --- Utility Function ---
 
-def handle_pdf_upload(files, user_id, db, background_tasks) -> list:
+def validate_chunking(chunk_size: int | None, chunk_overlap: int | None):
+    """
+    Validates per-chatbot chunking settings (in tokens).
+    """
+    if chunk_size is not None and chunk_size <= 0:
+        raise HTTPException(status_code=400, detail="chunkSize must be a positive number of tokens.")
+    if chunk_overlap is not None and chunk_overlap < 0:
+        raise HTTPException(status_code=400, detail="chunkOverlap cannot be negative.")
+    size = chunk_size if chunk_size is not None else current_config.CHUNK_SIZE_TOKENS
+    overlap = chunk_overlap if chunk_overlap is not None else current_config.CHUNK_OVERLAP_TOKENS
+    if overlap >= size:
+        raise HTTPException(status_code=400, detail="chunkOverlap must be smaller than chunkSize.")
+
+
+def handle_pdf_upload(files, user_id, db, background_tasks, chunk_size: int = None, chunk_overlap: int = None) -> list:
     """
     Handles PDF validation, storage, DB persistence, and async processing.
 
@@ -23,26 +65,26 @@ def handle_pdf_upload(files, user_id, db, background_tasks) -> list:
     for file in files:
         if not file.filename.endswith(".pdf"):
             raise HTTPException(status_code=400, detail=f"File {file.filename} is not a PDF. Only PDF files are allowed.")
-        
-        # Store PDF to cloud/local storage
-        file_url = save_pdf.concurrent_upload(file.file, file.filename, file.content_type, user_id)
+
+    # Store all PDFs in document storage in parallel, each under its own key
+    document_ids = [str(uuid.uuid4()) for _ in files]
+    storage_keys = [f"{user_id}/{document_id}/{file.filename}" for document_id, file in zip(document_ids, files)]
+    document_store.put_many([(key, file.file, file.content_type) for key, file in zip(storage_keys, files)])
+
+    for file, document_id, storage_key in zip(files, document_ids, storage_keys):
+        file_url = save_pdf.file_url(storage_key)
         file_type_simple = file.content_type.split("/")[-1] if "/" in file.content_type else file.content_type
 
-        # Persist document metadata
+        # Persist document metadata; the background task marks it "ready" or "failed"
         doc = Document(
-            id=str(uuid.uuid4()),
+            id=document_id,
             user_id=user_id,
             filename=file.filename,
             filepath=file_url,
             file_type=file_type_simple,
-        )
-        
-        # Schedule background task for further processing (e.g., embedding)
-        background_tasks.add_task(
-            precess_pdf.process_pdf,
-            user_id=user_id,
-            file_name=file.filename,
-            file_id=doc.id,
+            storage_key=storage_key,
+            status="processing",
+            processing_started_at=datetime.now(timezone.utc),
         )
         
         db.add(doc)
@@ -56,11 +98,20 @@ def handle_pdf_upload(files, user_id, db, background_tasks) -> list:
         })
 
     db.commit()
+    # One background task indexes all the files in parallel (e.g., embedding)
+    background_tasks.add_task(
+        ingest_uploaded_documents,
+        list(zip(document_ids, storage_keys, [file.filename for file in files])),
+        user_id,
+        chunk_size,
+        chunk_overlap,
+    )
     return results
 
-def save_chat_message(user_id: str, chatbot_id: str, content: str, sender: str, db: Session):
+def save_chat_message(user_id: str, chatbot_id: str, content: str, sender: str, db: Session,
+                      starts_conversation: bool = None):
     """
-    Saves a chat message to the database.
+    Saves a chat message to the database and adds it to the chatbot's analytics rollups.
     """
     
     message = ChatMessage(
@@ -68,11 +119,163 @@ def save_chat_message(user_id: str, chatbot_id: str, content: str, sender: str,
         user_id=user_id,
         chatbot_id=chatbot_id,
         text=content,
-        sender=sender
+        sender=sender,
+        created_at=datetime.now(timezone.utc),
+        starts_conversation=starts_conversation,
     )
     
     db.add(message)
+    record_message(db, message)
     db.commit()
+
+
+class DegradedAnswer(str):
+    """An answer made of retrieved passages, given when the LLM could not be used."""
+
+
+def degraded_answer(context) -> DegradedAnswer | None:
+    passages = context[0] if context and isinstance(context[0], list) else context or []
+    passages = [passage for passage in passages if passage][:current_config.CHAT_DEGRADED_PASSAGES]
+    if not passages:
+        return None
+    return DegradedAnswer(
+        "The assistant is temporarily unavailable. These passages from your documents may answer your question:\n\n"
+        + "\n\n---\n\n".join(passages)
+    )
+
+
+# Failures of the answering stage, reported with chat_http_error (or replaced by a degraded answer)
+CHAT_ERRORS = (CircuitOpen, LLMTimeout, LLMUnavailable, DeadlineExceeded)
+
+
+def degrade(error: Exception, context) -> DegradedAnswer:
+    """The degraded answer standing in for a failed LLM call; re-raises `error` when there is none."""
+    # A full queue is local overload, answered with 429 rather than passages
+    if not current_config.CHAT_DEGRADED_MODE or isinstance(error, LLMQueueTimeout):
+        raise error
+    answer = degraded_answer(context)
+    if answer is None:
+        raise error
+    metrics.incr("chat_degraded_total", reason=type(error).__name__)
+    return answer
+
+
+def chat_http_error(error: Exception) -> HTTPException:
+    if isinstance(error, LLMQueueTimeout):
+        return too_many_requests("The assistant is busy, please retry shortly.", 1, "queue_timeout")
+    if isinstance(error, (LLMTimeout, DeadlineExceeded)):
+        return HTTPException(status_code=504, detail="The assistant took too long to answer, please retry.")
+    return HTTPException(status_code=503, detail=str(error), headers={"Retry-After": str(int(error.retry_after))})
+
+
+def retrieve_context(user_id, query: str, document_ids: list, deadline: Deadline, chatbot_id: str = None,
+                     query_vector=None):
+    """
+    The passages for a query, embedding it within the deadline's embedding budget unless
+    `query_vector` (from an answer bank lookup, already metered) is given.
+    """
+    if query_vector is None:
+        usage_meter.record(user_id, chatbot_id, embedding_tokens=estimate_tokens(query))
+    try:
+        return precess_pdf.query_collection(
+            query=query,
+            filter={
+                "$and": [
+                    {"user_id": {"$eq": str(user_id)}},
+                    {"id": {"$in": document_ids}}
+                ]
+            },
+            tenant=str(user_id),
+            timeout=deadline.budget("embedding", current_config.CHAT_EMBEDDING_BUDGET_SECONDS),
+            query_vector=query_vector,
+        )
+    except TimeoutError:
+        metrics.incr("deadline_exceeded_total", stage="embedding")
+        raise DeadlineExceeded("Embedding the query took longer than its budget")
+
+
+def answer_query(user_id, query: str, document_ids: list, message_history: list, chatbot_id: str = None,
+                 deadline: Deadline = None, query_vector=None) -> str:
+    """
+    Retrieves context for a query and asks the LLM for an answer, within the request's deadline.
+    If the LLM fails fast, times out or is unavailable, degraded mode answers with the top passages instead.
+    """
+    deadline = deadline or Deadline(current_config.CHAT_DEADLINE_SECONDS)
+    context = retrieve_context(user_id, query, document_ids, deadline, chatbot_id, query_vector)
+    try:
+        return precess_pdf.get_ai_response(
+            query=query,
+            context=context,
+            message_history=message_history,
+            tenant=str(user_id),
+            chatbot_id=chatbot_id,
+            timeout=deadline.budget("generation"),
+        )
+    except CHAT_ERRORS as e:
+        return degrade(e, context)
+
+
+def stream_answer(user_id, query: str, document_ids: list, message_history: list, chatbot_id: str,
+                  deadline: Deadline, query_vector=None):
+    """
+    Like answer_query, but yields the answer's text as it is generated. A degraded answer is
+    yielded whole; once text has been sent, a failure is raised instead.
+    """
+    context = retrieve_context(user_id, query, document_ids, deadline, chatbot_id, query_vector)
+    started = False
+    try:
+        for text in precess_pdf.stream_ai_response(
+            query, context, message_history, tenant=str(user_id), chatbot_id=chatbot_id,
+            timeout=deadline.budget("generation"),
+        ):
+            started = True
+            yield text
+    except CHAT_ERRORS as e:
+        if started:
+            raise
+        yield degrade(e, context)
+
+
+def ingest_uploaded_document(document_id: str, user_id, storage_key: str, filename: str,
+                             chunk_size: int = None, chunk_overlap: int = None):
+    """
+    Indexes an uploaded PDF from storage and records the outcome, with a database session of its own.
+    """
+    count = precess_pdf.process_pdf(
+        user_id=user_id,
+        file_name=filename,
+        file_id=document_id,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        storage_key=storage_key,
+    )
+
+    with ingestion_tracker.session_factory() as db:
+        doc = db.query(Document).filter(Document.id == document_id).first()
+        if doc is not None:
+            doc.status = "ready" if count is not None else "failed"
+            db.commit()
+            for chatbot in doc.chatbots:
+                answer_bank.refresh(chatbot.id)
+
+
+def ingest_uploaded_documents(uploads: list, user_id, chunk_size: int = None, chunk_overlap: int = None):
+    """
+    Background task: indexes the (document_id, storage_key, filename) uploads of one request in parallel
+    on the shared ingestion executor, and waits for all of them.
+    """
+    futures = {
+        ingestion_executor.submit(
+            ingest_uploaded_document, document_id, user_id, storage_key, filename, chunk_size, chunk_overlap
+        ): document_id
+        for document_id, storage_key, filename in uploads
+    }
+    for future in as_completed(futures):
+        try:
+            future.result()
+        except Exception as e:
+            print(f"[ERROR] Could not ingest document {futures[future]}: {e}")
+
 # --- Endpoints ---
 
 
@@ -86,13 +289,107 @@ async def upload_pdf(
     """
     Endpoint to upload one or multiple PDF documents for processing.
     """
-    results = handle_pdf_upload(files, user_id, db, background_tasks)
+    results = await run_in_threadpool(handle_pdf_upload, files, user_id, db, background_tasks)
     return {
         "files": results,
         "message": "Upload successful",
         "count": len(results)
     }
 
+@router.post("/uploads/presign", response_model=PresignUploadOut)
+def presign_upload(
+    upload: PresignUploadRequest,
+    user_id: Annotated[str, Depends(get_current_user)],
+    db: Session = Depends(get_db),
+):
+    """
+    Records a pending document and returns a presigned POST for uploading the PDF
+    straight to S3. Call /uploads/{document_id}/complete once the upload finishes.
+    """
+    if not current_config.S3_UPLOADS_ENABLED:
+        raise HTTPException(status_code=400, detail="Direct uploads require S3_UPLOADS_ENABLED.")
+    filename = os.path.basename(upload.filename)
+    if not filename.endswith(".pdf"):
+        raise HTTPException(status_code=400, detail=f"File {upload.filename} is not a PDF. Only PDF files are allowed.")
+    max_bytes = current_config.DIRECT_UPLOAD_MAX_MB * 1024 * 1024
+    if not 0 < upload.size <= max_bytes:
+        raise HTTPException(status_code=400, detail=f"File size must be between 1 byte and {current_config.DIRECT_UPLOAD_MAX_MB} MB.")
+
+    chatbot = None
+    if upload.chatbot_id:
+        chatbot = db.query(ChatBot).filter(ChatBot.id == upload.chatbot_id, ChatBot.user_id == user_id).first()
+        if not chatbot:
+            raise HTTPException(status_code=404, detail="Chatbot not found or access denied.")
+
+    document_id = str(uuid.uuid4())
+    storage_key = f"{user_id}/uploads/{document_id}/{filename}"
+    doc = Document(
+        id=document_id,
+        user_id=user_id,
+        filename=filename,
+        filepath=save_pdf.file_url(storage_key),
+        file_type="pdf",
+        status="pending_upload",
+        storage_key=storage_key,
+    )
+    db.add(doc)
+    if chatbot is not None:
+        chatbot.documents.append(doc)
+    db.commit()
+
+    presigned = save_pdf.presign_upload(
+        storage_key, upload.content_type, max_bytes, current_config.PRESIGNED_UPLOAD_EXPIRES_SECONDS
+    )
+    return PresignUploadOut(
+        document_id=document_id,
+        url=presigned["url"],
+        fields=presigned["fields"],
+        expires_in=current_config.PRESIGNED_UPLOAD_EXPIRES_SECONDS,
+        max_bytes=max_bytes,
+    )
+
+
+@router.post("/uploads/{document_id}/complete", response_model=UploadStatusOut)
+def complete_upload(
+    document_id: str,
+    user_id: Annotated[str, Depends(get_current_user)],
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+):
+    """
+    Confirms a direct upload and queues ingestion from S3. Safe to retry.
+    """
+    doc = db.query(Document).filter(Document.id == document_id, Document.user_id == user_id).first()
+    if not doc or not doc.storage_key:
+        raise HTTPException(status_code=404, detail="Upload not found or access denied.")
+    if doc.status != "pending_upload":
+        return UploadStatusOut(document_id=doc.id, status=doc.status)
+
+    head = save_pdf.head_object(doc.storage_key)
+    if head is None:
+        raise HTTPException(status_code=400, detail="The file has not been uploaded yet.")
+    too_large = head["ContentLength"] > current_config.DIRECT_UPLOAD_MAX_MB * 1024 * 1024
+    if too_large or save_pdf.read_head(doc.storage_key, 5) != b"%PDF-":
+        save_pdf.delete_object(doc.storage_key)
+        raise HTTPException(status_code=400, detail="The uploaded file is not a valid PDF.")
+
+    chatbot = doc.chatbots[0] if doc.chatbots else None
+    doc.status = "processing"
+    doc.processing_started_at = datetime.now(timezone.utc)
+    db.commit()
+
+    background_tasks.add_task(
+        ingest_uploaded_document,
+        document_id=doc.id,
+        user_id=user_id,
+        storage_key=doc.storage_key,
+        filename=doc.filename,
+        chunk_size=chatbot.chunk_size_tokens if chatbot else None,
+        chunk_overlap=chatbot.chunk_overlap_tokens if chatbot else None,
+    )
+    return UploadStatusOut(document_id=doc.id, status=doc.status)
+
+
 @router.get("/documents")
 async def get_documents(
     user_id: Annotated[str, Depends(get_current_user)],
@@ -102,7 +399,32 @@ async def get_documents(
     Retrieves all documents uploaded by the current user.
     """
     documents = db.query(Document).filter(Document.user_id == user_id).all()
-    return [{"id": doc.id, "filename": doc.filename, "filepath": doc.filepath} for doc in documents]
+    return [
+        {
+            "id": doc.id,
+            "filename": doc.filename,
+            "filepath": doc.filepath,
+            "status": doc.status,
+            "pages_total": doc.pages_total,
+            "pages_indexed": doc.pages_indexed,
+        }
+        for doc in documents
+    ]
+
+
+@router.get("/documents/{document_id}/progress")
+def get_document_progress(
+    document_id: str,
+    user_id: Annotated[str, Depends(get_current_user)],
+    db: Session = Depends(get_db),
+):
+    """
+    Ingestion progress of a document. Indexed pages are already answerable in chat while the rest are processed.
+    """
+    doc = db.query(Document).filter(Document.id == document_id, Document.user_id == user_id).first()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found or access denied.")
+    return progress_out(doc)
 
 
 class ChatWithDocument(BaseModel):
@@ -111,40 +433,79 @@ class ChatWithDocument(BaseModel):
     messageHistory: list[dict] = []
     chatbot_id: str
 
+def validate_rate_limits(*limits):
+    for limit in limits:
+        if limit is not None and limit <= 0:
+            raise HTTPException(status_code=400, detail="Rate limits must be positive.")
+
+
+async def answer_query_gated(user_id, query, document_ids, message_history, chatbot_id=None, deadline=None,
+                             query_vector=None):
+    """Runs answer_query once admitted to the LLM stage, mapping scheduler failures to HTTP errors."""
+    async with llm_gate:
+        try:
+            return await run_in_threadpool(
+                answer_query, user_id, query, document_ids, message_history, chatbot_id, deadline, query_vector
+            )
+        except CHAT_ERRORS as e:
+            raise chat_http_error(e)
+
+
 @router.post("/chat")
 async def chat_with_document(
+    request: Request,
     background_tasks: BackgroundTasks,
     user_id: Annotated[str, Depends(get_current_user)],
     chat_data: ChatWithDocument,
+    http_response: Response,
     db: Session = Depends(get_db),  # <-- add db here
 ):
     """
     Query a document collection and get AI-generated response based on user input.
+    Over-limit or overloaded requests are rejected with 429 and Retry-After. The whole answer must be ready
+    within CHAT_DEADLINE_SECONDS; answers made of passages because the LLM was unavailable carry
+    an `X-Chat-Degraded: true` header.
     """
-    
+    await run_in_threadpool(chat_rate_limiter.check, request, chat_data.chatbot_id, db)
+    deadline = Deadline(current_config.CHAT_DEADLINE_SECONDS)
+
     background_tasks.add_task(
         save_chat_message,
         user_id=user_id,
         chatbot_id=chat_data.chatbot_id,
         content=chat_data.query,
         sender="user",
-        db=db
+        db=db,
+        starts_conversation=not chat_data.messageHistory,
     )
     
-    context = precess_pdf.query_collection(
-        query=chat_data.query,
-        filter={
-            "$and": [
-                {"user_id": {"$eq": str(user_id)}},
-                {"id": {"$in": chat_data.document_id}}
-            ]
-        }
-    )
-    
-    response = precess_pdf.get_ai_response(
-        query=chat_data.query,
-        context=context,
-        message_history=chat_data.messageHistory
+    started = time.perf_counter()
+    if chat_data.messageHistory:
+        response = await answer_query_gated(
+            user_id, chat_data.query, chat_data.document_id, chat_data.messageHistory, chat_data.chatbot_id,
+            deadline,
+        )
+    else:
+        # A precomputed answer skips retrieval and the LLM call; a miss retrieves with the same query vector
+        response, query_vector = await run_in_threadpool(
+            answer_bank.lookup, db, user_id, chat_data.chatbot_id, chat_data.query, chat_data.document_id,
+            deadline.budget("embedding", current_config.CHAT_EMBEDDING_BUDGET_SECONDS),
+        )
+        if response is None:
+            key = (
+                str(user_id),
+                chat_data.chatbot_id,
+                tuple(sorted(chat_data.document_id)),
+                normalize_query(chat_data.query),
+            )
+            response = await chat_flight.do(
+                key, answer_query_gated, user_id, chat_data.query, chat_data.document_id, [], chat_data.chatbot_id,
+                deadline, query_vector,
+            )
+    if isinstance(response, DegradedAnswer):
+        http_response.headers["X-Chat-Degraded"] = "true"
+    usage_meter.record(
+        user_id, chat_data.chatbot_id, requests=1, latency_ms=(time.perf_counter() - started) * 1000
     )
     
     background_tasks.add_task(
@@ -158,6 +519,151 @@ async def chat_with_document(
     return response
 
 
+def save_chat_exchange(user_id, chatbot_id: str, query: str, answer: str | None, starts_conversation: bool,
+                       db: Session):
+    """Saves a WebSocket message and, if it was answered, its answer."""
+    save_chat_message(user_id, chatbot_id, query, "user", db, starts_conversation=starts_conversation)
+    if answer is not None:
+        save_chat_message(user_id, chatbot_id, answer, "bot", db)
+
+
+def ws_error(error: HTTPException) -> dict:
+    return {
+        "type": "error",
+        "status": error.status_code,
+        "detail": error.detail,
+        "retry_after": (error.headers or {}).get("Retry-After"),
+    }
+
+
+async def answer_ws_message(websocket: WebSocket, user_id, chatbot_id: str, query: str, document_ids: list,
+                            history: list, db: Session) -> str:
+    """Streams the answer to one WebSocket message as `token` frames, then a `done` frame; returns the answer."""
+    deadline = Deadline(current_config.CHAT_DEADLINE_SECONDS)
+    answer, query_vector = None, None
+    if not history:
+        # A precomputed answer skips retrieval and the LLM call; a miss retrieves with the same query vector
+        answer, query_vector = await run_in_threadpool(
+            answer_bank.lookup, db, user_id, chatbot_id, query, document_ids,
+            deadline.budget("embedding", current_config.CHAT_EMBEDDING_BUDGET_SECONDS),
+        )
+    if answer is not None:
+        await websocket.send_json({"type": "token", "content": answer})
+    else:
+        pieces = []
+        async with llm_gate:
+            stream = stream_answer(user_id, query, document_ids, history, chatbot_id, deadline, query_vector)
+            try:
+                async for piece in iterate_in_threadpool(stream):
+                    pieces.append(piece)
+                    await websocket.send_json({"type": "token", "content": piece})
+            except CHAT_ERRORS as e:
+                raise chat_http_error(e)
+            finally:
+                # Releases the LLM slot when the client goes away mid-answer
+                await run_in_threadpool(stream.close)
+        answer = pieces[0] if len(pieces) == 1 else "".join(pieces)
+    await websocket.send_json({"type": "done", "content": answer, "degraded": isinstance(answer, DegradedAnswer)})
+    return answer
+
+
+@router.websocket("/ws/chat")
+async def chat_websocket(
+    websocket: WebSocket,
+    chatbot_id: str,
+    user_id: Annotated[str, Depends(get_current_user)],
+    db: Session = Depends(get_db),
+):
+    """
+    Chat over one WebSocket connection. The chatbot and its documents are resolved once, when the
+    connection opens, and the conversation history is kept on the server for the connection.
+
+    Client frames: `{"type": "message", "content": "..."}`, and `{"type": "ping"}` (answered with a pong).
+    Server frames: `ready` on connect, the answer as `token` frames followed by `done` (with `degraded`),
+    `error` (with the HTTP status the POST endpoint would have used), and a `ping` every
+    CHAT_WS_HEARTBEAT_SECONDS. The connection is closed after CHAT_WS_IDLE_TIMEOUT_SECONDS without a message.
+    Messages are saved in the background once their answer has been sent.
+    """
+    chatbot = await run_in_threadpool(
+        lambda: db.query(ChatBot).filter(ChatBot.id == chatbot_id, ChatBot.user_id == user_id).first()
+    )
+    if chatbot is None:
+        db.close()
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Chatbot not found")
+        return
+    document_ids = [document.id for document in chatbot.documents]
+    welcome_message = chatbot.welcome_message
+    db.close()
+
+    await websocket.accept()
+    metrics.incr("chat_ws_connections_total")
+    await websocket.send_json({"type": "ready", "chatbot_id": chatbot_id, "welcome_message": welcome_message})
+
+    history, reason = [], "client"
+    last_message = time.monotonic()
+    try:
+        while True:
+            idle_left = current_config.CHAT_WS_IDLE_TIMEOUT_SECONDS - (time.monotonic() - last_message)
+            if idle_left <= 0:
+                reason = "idle"
+                await websocket.close(code=status.WS_1000_NORMAL_CLOSURE, reason="Idle timeout")
+                break
+            try:
+                text = await asyncio.wait_for(
+                    websocket.receive_text(), min(current_config.CHAT_WS_HEARTBEAT_SECONDS, idle_left)
+                )
+            except asyncio.TimeoutError:
+                if idle_left > current_config.CHAT_WS_HEARTBEAT_SECONDS:
+                    # Sending to a peer that is gone fails, which ends the connection
+                    await websocket.send_json({"type": "ping"})
+                continue
+
+            try:
+                frame = json.loads(text)
+                frame_type = frame["type"]
+            except (ValueError, TypeError, KeyError):
+                await websocket.send_json(ws_error(
+                    HTTPException(status_code=400, detail="Frames must be JSON objects with a type.")
+                ))
+                continue
+            if frame_type == "ping":
+                await websocket.send_json({"type": "pong"})
+                continue
+            if frame_type == "pong":
+                continue
+            query = frame.get("content")
+            if frame_type != "message" or not isinstance(query, str) or not query.strip():
+                await websocket.send_json(ws_error(
+                    HTTPException(status_code=400, detail="Expected a message with content.")
+                ))
+                continue
+
+            last_message = time.monotonic()
+            answer = None
+            started = time.perf_counter()
+            try:
+                await run_in_threadpool(chat_rate_limiter.check, websocket, chatbot_id, db)
+                answer = await answer_ws_message(websocket, user_id, chatbot_id, query, document_ids, history, db)
+                usage_meter.record(user_id, chatbot_id, requests=1,
+                                   latency_ms=(time.perf_counter() - started) * 1000)
+            except HTTPException as e:
+                await websocket.send_json(ws_error(e))
+            finally:
+                db.close()
+                message_writer.submit(save_chat_exchange, user_id, chatbot_id, query, answer, not history)
+            if answer is not None:
+                history += [{"role": "user", "content": query}, {"role": "assistant", "content": str(answer)}]
+                keep = current_config.CHAT_WS_HISTORY_MESSAGES
+                history = history[-keep:] if keep else []
+    except WebSocketDisconnect:
+        pass
+    except Exception:
+        reason = "error"
+        raise
+    finally:
+        metrics.incr("chat_ws_closed_total", reason=reason)
+
+
 @router.get("/list_collections")
 def list_collections():
     """
@@ -179,15 +685,24 @@ async def create_chatbot(
     primaryColor: str = Form(...),
     selectedDocuments: list[str] = Form([]),
     newDocument: list[UploadFile] = File(None),
+    chunkSize: int = Form(None),
+    chunkOverlap: int = Form(None),
+    rateLimitPerMinute: int = Form(None),
+    visitorRateLimitPerMinute: int = Form(None),
     db: Session = Depends(get_db),
 ):
     """
     Creates a new chatbot configuration with optional document uploads and links.
     """
+    validate_chunking(chunkSize, chunkOverlap)
+    validate_rate_limits(rateLimitPerMinute, visitorRateLimitPerMinute)
+
     # Upload new documents if present
     uploaded_files = []
     if newDocument:
-        uploaded_files = handle_pdf_upload(newDocument, user_id, db, background_tasks)
+        uploaded_files = await run_in_threadpool(
+            handle_pdf_upload, newDocument, user_id, db, background_tasks, chunkSize, chunkOverlap
+        )
     
     # Combine existing and newly uploaded document IDs
     combined_doc_ids = [doc["document_id"] for doc in uploaded_files] + selectedDocuments
@@ -204,6 +719,10 @@ async def create_chatbot(
         welcome_message=welcomeMessage,
         theme=theme,
         primary_color=primaryColor,
+        chunk_size_tokens=chunkSize,
+        chunk_overlap_tokens=chunkOverlap,
+        rate_limit_per_minute=rateLimitPerMinute,
+        visitor_rate_limit_per_minute=visitorRateLimitPerMinute,
         documents=documents,
     )
 
@@ -218,6 +737,11 @@ async def create_chatbot(
             "welcomeMessage": chatbot.welcome_message,
             "theme": chatbot.theme,
             "primaryColor": chatbot.primary_color,
+            "embedCode": chatbot.embed_code,
+            "chunkSize": chatbot.chunk_size_tokens,
+            "chunkOverlap": chatbot.chunk_overlap_tokens,
+            "rateLimitPerMinute": chatbot.rate_limit_per_minute,
+            "visitorRateLimitPerMinute": chatbot.visitor_rate_limit_per_minute,
             "documentIds": [doc.id for doc in chatbot.documents],
             "message": "Chatbot updated successfully",
             
@@ -245,6 +769,11 @@ async def get_chatbots(
             "welcomeMessage": chatbot.welcome_message,
             "theme": chatbot.theme,
             "primaryColor": chatbot.primary_color,
+            "embedCode": chatbot.embed_code,
+            "chunkSize": chatbot.chunk_size_tokens,
+            "chunkOverlap": chatbot.chunk_overlap_tokens,
+            "rateLimitPerMinute": chatbot.rate_limit_per_minute,
+            "visitorRateLimitPerMinute": chatbot.visitor_rate_limit_per_minute,
             "documentIds": [doc.id for doc in chatbot.documents],
             "message": "Chatbot updated successfully",
             "createdAt": chatbot.created_at.isoformat(),
@@ -275,7 +804,10 @@ async def add_documents_to_chatbot(
     # Upload new documents if provided
     uploaded_files = []
     if new_documents:
-        uploaded_files = handle_pdf_upload(new_documents, user_id, db, background_tasks)
+        uploaded_files = await run_in_threadpool(
+            handle_pdf_upload, new_documents, user_id, db, background_tasks,
+            chatbot.chunk_size_tokens, chatbot.chunk_overlap_tokens,
+        )
 
     # Combine document IDs
     combined_doc_ids = [doc["document_id"] for doc in uploaded_files] + existing_document_ids
@@ -290,6 +822,8 @@ async def add_documents_to_chatbot(
 
     db.commit()
     db.refresh(chatbot)
+    # Queued after the uploads' ingestion tasks, so the rebuild sees their chunks
+    background_tasks.add_task(answer_bank.refresh, chatbot.id)
 
     return {
         "id": chatbot.id,
@@ -301,21 +835,33 @@ async def add_documents_to_chatbot(
 async def update_chatbot(
     chatbot_id: str,
     user_id: Annotated[str, Depends(get_current_user)],
+    background_tasks: BackgroundTasks,
     name: str = Form(None),
     systemPrompt: str = Form(None),
     welcomeMessage: str = Form(None),
     theme: str = Form(None),
     primaryColor: str = Form(None),
     selectedDocuments: list[str] = Form([]),
+    chunkSize: int = Form(None),
+    chunkOverlap: int = Form(None),
+    rateLimitPerMinute: int = Form(None),
+    visitorRateLimitPerMinute: int = Form(None),
     db: Session = Depends(get_db),
 ):
     """
     Update chatbot configuration fields and associated documents.
+    Chunking changes apply to documents uploaded after the update; use /reindex for existing ones.
     """
     chatbot = db.query(ChatBot).filter(ChatBot.id == chatbot_id, ChatBot.user_id == user_id).first()
     if not chatbot:
         raise HTTPException(status_code=404, detail="Chatbot not found or access denied.")
 
+    validate_chunking(
+        chunkSize if chunkSize is not None else chatbot.chunk_size_tokens,
+        chunkOverlap if chunkOverlap is not None else chatbot.chunk_overlap_tokens,
+    )
+    validate_rate_limits(rateLimitPerMinute, visitorRateLimitPerMinute)
+
     if name is not None:
         chatbot.name = name
     if systemPrompt is not None:
@@ -326,14 +872,27 @@ async def update_chatbot(
         chatbot.theme = theme
     if primaryColor is not None:
         chatbot.primary_color = primaryColor
+    if chunkSize is not None:
+        chatbot.chunk_size_tokens = chunkSize
+    if chunkOverlap is not None:
+        chatbot.chunk_overlap_tokens = chunkOverlap
+    if rateLimitPerMinute is not None:
+        chatbot.rate_limit_per_minute = rateLimitPerMinute
+    if visitorRateLimitPerMinute is not None:
+        chatbot.visitor_rate_limit_per_minute = visitorRateLimitPerMinute
 
     # Update associated documents if provided
+    previous_documents = fingerprint(doc.id for doc in chatbot.documents)
     if selectedDocuments is not None:
         documents = db.query(Document).filter(Document.id.in_(selectedDocuments)).all()
         chatbot.documents = documents
 
     db.commit()
     db.refresh(chatbot)
+    widget_cache.invalidate(chatbot.embed_code)
+    chat_rate_limiter.invalidate(chatbot.id)
+    if fingerprint(doc.id for doc in chatbot.documents) != previous_documents:
+        background_tasks.add_task(answer_bank.refresh, chatbot.id)
 
     return {
         "id": chatbot.id,
@@ -342,6 +901,11 @@ async def update_chatbot(
         "welcomeMessage": chatbot.welcome_message,
         "theme": chatbot.theme,
         "primaryColor": chatbot.primary_color,
+        "embedCode": chatbot.embed_code,
+        "chunkSize": chatbot.chunk_size_tokens,
+        "chunkOverlap": chatbot.chunk_overlap_tokens,
+        "rateLimitPerMinute": chatbot.rate_limit_per_minute,
+        "visitorRateLimitPerMinute": chatbot.visitor_rate_limit_per_minute,
         "documentIds": [doc.id for doc in chatbot.documents],
         "message": "Chatbot updated successfully",
         
@@ -366,6 +930,7 @@ async def all_user_documents(
             "filename": doc.filename,
             "filepath": doc.filepath,
             "Type": doc.file_type,
+            "status": doc.status,
             "createdAt": doc.created_at.isoformat() if hasattr(doc, "created_at") and doc.created_at else None,
         }
         for doc in documents
@@ -390,6 +955,201 @@ async def get_all_messages(
         for message in messages
     ]
     
+@router.get("/messages/export")
+def export_messages(
+    user_id: Annotated[str, Depends(get_current_user)],
+    format: Literal["ndjson", "csv"] = "ndjson",
+    chatbot_id: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    gzip: bool = False,
+    db: Session = Depends(get_db),
+):
+    """
+    Stream the current user's chat messages as NDJSON or CSV, optionally gzipped.
+    Filters by chatbot and by creation time (start inclusive, end exclusive).
+    Rows are read through a server-side cursor, so memory use does not grow with history size.
+    """
+    query = db.query(
+        ChatMessage.id, ChatMessage.chatbot_id, ChatMessage.sender, ChatMessage.text, ChatMessage.created_at
+    ).filter(ChatMessage.user_id == user_id)
+    if chatbot_id:
+        query = query.filter(ChatMessage.chatbot_id == chatbot_id)
+    if start:
+        query = query.filter(ChatMessage.created_at >= utc_naive(start))
+    if end:
+        query = query.filter(ChatMessage.created_at < utc_naive(end))
+    rows = query.order_by(ChatMessage.created_at, ChatMessage.id).yield_per(1000)
+
+    chunks = iter_ndjson(rows) if format == "ndjson" else iter_csv(rows)
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    filename = f"chat-export-{datetime.now(timezone.utc):%Y%m%d%H%M%S}.{format}"
+    if gzip:
+        chunks, media_type, filename = gzip_chunks(chunks), "application/gzip", filename + ".gz"
+
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/messages/search")
+def search_chat_messages(
+    user_id: Annotated[str, Depends(get_current_user)],
+    q: str = Query(..., min_length=1),
+    chatbot_id: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+):
+    """
+    Full-text search over the current user's chat messages, best match first.
+    Every word must appear (the last may be a prefix); filters by chatbot and creation time.
+    """
+    try:
+        return search_messages(db, user_id, q, chatbot_id, start, end, limit, offset)
+    except SearchUnavailable:
+        raise HTTPException(status_code=501, detail="Search is not available on this database.")
+
+
+@router.get("/chatbot/{chatbot_id}/analytics")
+def get_chatbot_analytics(
+    chatbot_id: str,
+    user_id: Annotated[str, Depends(get_current_user)],
+    granularity: Literal["hour", "day"] = "day",
+    start: datetime | None = None,
+    end: datetime | None = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Message, conversation and character counts for a chatbot, per hour or day (UTC).
+    Served from rollups, so the cost depends on the number of buckets rather than messages.
+    """
+    chatbot = db.query(ChatBot).filter(ChatBot.id == chatbot_id, ChatBot.user_id == user_id).first()
+    if not chatbot:
+        raise HTTPException(status_code=404, detail="Chatbot not found.")
+    return chatbot_stats(db, chatbot_id, granularity, start, end)
+
+
+def reindex_chatbot_documents(chatbot_id: str, user_id, documents: list, db: Session, chunk_size: int = None,
+                              chunk_overlap: int = None):
+    """
+    Background task: re-chunks (document_id, filename, storage_key) documents, records each outcome,
+    then refreshes the answer bank.
+    """
+    for document_id, filename, storage_key in documents:
+        count = precess_pdf.reindex_document(user_id, filename, document_id, chunk_size, chunk_overlap, storage_key)
+        print(f"Re-indexed document {document_id}: {count} chunks")
+        doc = db.query(Document).filter(Document.id == document_id).first()
+        if doc is not None:
+            doc.status = "ready" if count is not None else "failed"
+            db.commit()
+    answer_bank.refresh(chatbot_id)
+
+
+@router.post("/chatbot/{chatbot_id}/reindex", status_code=202)
+def reindex_chatbot(
+    chatbot_id: str,
+    user_id: Annotated[str, Depends(get_current_user)],
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+):
+    """
+    Re-chunks and re-embeds the chatbot's documents with its current chunking settings.
+    Page text extracted at upload is reused, so the PDFs are not parsed again. Documents that
+    failed to process are retried.
+    """
+    chatbot = db.query(ChatBot).filter(ChatBot.id == chatbot_id, ChatBot.user_id == user_id).first()
+    if not chatbot:
+        raise HTTPException(status_code=404, detail="Chatbot not found.")
+    documents = []
+    for doc in chatbot.documents:
+        if doc.status in ("ready", "failed"):
+            # The garbage collector deletes the chunks of "failed" documents, including freshly written ones
+            doc.status = "processing"
+            doc.processing_started_at = datetime.now(timezone.utc)
+            documents.append((doc.id, doc.filename, doc.storage_key))
+    db.commit()
+    background_tasks.add_task(
+        reindex_chatbot_documents, chatbot.id, user_id, documents, db,
+        chatbot.chunk_size_tokens, chatbot.chunk_overlap_tokens,
+    )
+    return {
+        "id": chatbot.id,
+        "document_ids": [document_id for document_id, _, _ in documents],
+        "message": "Re-indexing queued",
+    }
+
+
+def answer_bank_status(bank: AnswerBank, chatbot: ChatBot) -> dict:
+    return {
+        "chatbot_id": bank.chatbot_id,
+        "status": bank.status,
+        "entries": bank.entries,
+        "built_at": bank.built_at.isoformat() if bank.built_at else None,
+        "stale": bank.document_ids != fingerprint(doc.id for doc in chatbot.documents),
+        "error": bank.error,
+    }
+
+
+@router.post("/chatbot/{chatbot_id}/answer_bank", status_code=202)
+def build_answer_bank(
+    chatbot_id: str,
+    user_id: Annotated[str, Depends(get_current_user)],
+    db: Session = Depends(get_db),
+):
+    """
+    Enables the chatbot's precomputed answer bank and (re)builds it in the background.
+    It is rebuilt whenever the chatbot's documents change.
+    """
+    chatbot = db.query(ChatBot).filter(ChatBot.id == chatbot_id, ChatBot.user_id == user_id).first()
+    if not chatbot:
+        raise HTTPException(status_code=404, detail="Chatbot not found.")
+    bank = db.get(AnswerBank, chatbot_id)
+    if bank is None:
+        bank = AnswerBank(chatbot_id=chatbot_id)
+        db.add(bank)
+        db.commit()
+    answer_bank.refresh(chatbot_id)
+    return answer_bank_status(bank, chatbot)
+
+
+@router.get("/chatbot/{chatbot_id}/answer_bank")
+def get_answer_bank(
+    chatbot_id: str,
+    user_id: Annotated[str, Depends(get_current_user)],
+    db: Session = Depends(get_db),
+):
+    """
+    Build status of the chatbot's answer bank; `stale` means its documents changed since the last build.
+    """
+    chatbot = db.query(ChatBot).filter(ChatBot.id == chatbot_id, ChatBot.user_id == user_id).first()
+    bank = db.get(AnswerBank, chatbot_id) if chatbot else None
+    if not bank:
+        raise HTTPException(status_code=404, detail="Answer bank not found.")
+    return answer_bank_status(bank, chatbot)
+
+
+@router.delete("/chatbot/{chatbot_id}/answer_bank")
+def delete_answer_bank(
+    chatbot_id: str,
+    user_id: Annotated[str, Depends(get_current_user)],
+    db: Session = Depends(get_db),
+):
+    """
+    Disables the chatbot's answer bank and deletes its entries.
+    """
+    chatbot = db.query(ChatBot).filter(ChatBot.id == chatbot_id, ChatBot.user_id == user_id).first()
+    bank = db.get(AnswerBank, chatbot_id) if chatbot else None
+    if not bank:
+        raise HTTPException(status_code=404, detail="Answer bank not found.")
+    answer_bank.remove(db, bank)
+    return {"message": "Answer bank deleted."}
+
+
 @router.get("/chatbot/{chatbot_id}/messages")
 async def get_messages_by_chatbot(
     chatbot_id: str,
@@ -421,6 +1181,8 @@ async def clear_user_chat_for_chatbot(
 ):
     """
     Delete all chat messages for a specific chatbot belonging to the current user.
+    The analytics rollups of the days they were sent on are rebuilt from the messages left,
+    in the same transaction.
     """
     messages = db.query(ChatMessage).filter(
         ChatMessage.user_id == user_id,
@@ -428,5 +1190,7 @@ async def clear_user_chat_for_chatbot(
     ).all()
     for message in messages:
         db.delete(message)
+    db.flush()
+    rebuild_days(db, chatbot_id, [message.created_at for message in messages])
     db.commit()
     return {"message": "All chat messages for this chatbot have been deleted."}
\ No newline at end of file
@@ -7,8 +7,9 @@ from app.schemas.user_schema import Token, UserOut
 from app.utils import authenticate_user, create_access_token, get_current_user, get_password_hash
 from app.utils.auth import get_current_user_from_db
 from app.setting import current_config
+from app.utils.usage import usage_meter, usage_summary
 from fastapi.security import OAuth2PasswordRequestForm
-from datetime import timedelta
+from datetime import datetime, timedelta
 from typing import Annotated
 from fastapi import status
 
@@ -83,4 +84,19 @@ async def update_user_profile(
         current_user.bio = profile_data.bio
     db.commit()
     db.refresh(current_user)
-    return current_user
\ No newline at end of file
+    return current_user
+
+
+@router.get("/usage")
+def get_usage(
+    user_id: Annotated[str, Depends(get_current_user)],
+    start: datetime | None = None,
+    end: datetime | None = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Metered usage of the current user, in total and per chatbot, by UTC hour.
+    Other workers' counters appear within USAGE_FLUSH_SECONDS.
+    """
+    usage_meter.flush()
+    return usage_summary(db, user_id, start, end)
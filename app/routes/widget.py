@@ -0,0 +1,88 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.orm import Session
+from app.db.session import get_db
+from app.models.models import ChatBot
+from app.schemas import WidgetConfigOut
+from app.setting import current_config
+from app.utils.cache import TTLCache
+from app.utils.metrics import metrics
+import hashlib
+
+router = APIRouter()
+
+# embed_code -> (etag, body) or None for unknown codes; bounds DB reads per worker
+widget_cache = TTLCache(ttl=current_config.WIDGET_CACHE_TTL_SECONDS, maxsize=50000)
+_UNCACHED = object()
+
+
+def widget_etag(chatbot: ChatBot) -> str:
+    """
+    Strong ETag derived from the chatbot's identity and last update time.
+    """
+    version = f"{chatbot.id}:{chatbot.embed_code}:{chatbot.updated_at.isoformat()}"
+    return '"' + hashlib.sha256(version.encode()).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so W/"x" matches "x"
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates
+
+
+def load_widget(embed_code: str, db: Session):
+    """
+    Returns (etag, body) for an embed code, reading the database only on a cache miss.
+    """
+    entry = widget_cache.get(embed_code, _UNCACHED)
+    if entry is not _UNCACHED:
+        metrics.incr("widget_config_cache_total", result="hit")
+        return entry
+
+    metrics.incr("widget_config_cache_total", result="miss")
+    chatbot = db.query(ChatBot).filter(ChatBot.embed_code == embed_code).first()
+    if chatbot is None:
+        widget_cache.set(embed_code, None)
+        return None
+
+    payload = WidgetConfigOut(
+        embed_code=chatbot.embed_code,
+        name=chatbot.name,
+        welcome_message=chatbot.welcome_message,
+        theme=chatbot.theme,
+        primary_color=chatbot.primary_color,
+    )
+    entry = (widget_etag(chatbot), payload.model_dump_json().encode())
+    widget_cache.set(embed_code, entry)
+    return entry
+
+
+@router.get("/{embed_code}/config", response_model=WidgetConfigOut)
+def get_widget_config(embed_code: str, request: Request, db: Session = Depends(get_db)):
+    """
+    Public, read-only bootstrap config for the embedded chat widget.
+    Supports conditional GETs with If-None-Match.
+    """
+    entry = load_widget(embed_code, db)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Widget not found.")
+
+    etag, body = entry
+    headers = {
+        "ETag": etag,
+        "Cache-Control": (
+            f"public, max-age={current_config.WIDGET_MAX_AGE_SECONDS}, "
+            f"stale-while-revalidate={current_config.WIDGET_MAX_AGE_SECONDS}"
+        ),
+        "Access-Control-Allow-Origin": "*",
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        metrics.incr("widget_config_responses_total", status="304")
+        return Response(status_code=304, headers=headers)
+
+    metrics.incr("widget_config_responses_total", status="200")
+    return Response(content=body, media_type="application/json", headers=headers)
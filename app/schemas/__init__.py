@@ -1,5 +1,5 @@
 from .user_schema import UserBase, UserCreate, UserOut, Token, TokenData, User, UserProfileUpdate
-from .document_schema import DocumentBase, DocumentCreate, DocumentOut
+from .document_schema import DocumentBase, DocumentCreate, DocumentOut, PresignUploadRequest, PresignUploadOut, UploadStatusOut
 from .chat_schema import ChatBase, ChatCreate, ChatOut
-from .embed_schema import EmbedBotBase, EmbedBotCreate, EmbedBotOut
+from .embed_schema import EmbedBotBase, EmbedBotCreate, EmbedBotOut, WidgetConfigOut
 
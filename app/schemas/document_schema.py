@@ -19,3 +19,23 @@ class DocumentOut(DocumentBase):
 
     class Config:
         from_attributes = True
+
+
+class PresignUploadRequest(BaseModel):
+    filename: str
+    size: int
+    content_type: str = "application/pdf"
+    chatbot_id: str | None = None
+
+
+class PresignUploadOut(BaseModel):
+    document_id: str
+    url: str
+    fields: dict
+    expires_in: int
+    max_bytes: int
+
+
+class UploadStatusOut(BaseModel):
+    document_id: str
+    status: str
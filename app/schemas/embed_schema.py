@@ -17,3 +17,11 @@ class EmbedBotOut(EmbedBotBase):
 
     class Config:
         from_attributes = True
+
+
+class WidgetConfigOut(BaseModel):
+    embed_code: str
+    name: str
+    welcome_message: str
+    theme: str
+    primary_color: str
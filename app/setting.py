@@ -10,6 +10,24 @@ class Config:
     AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
     AWS_REGION = os.getenv("AWS_REGION", "us-west-2")
     S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME", "my-bucket")
+    # Uploads only go to S3 when enabled; S3_ENDPOINT_URL points at MinIO/localstack in development
+    S3_UPLOADS_ENABLED = os.getenv("S3_UPLOADS_ENABLED", "false").lower() == "true"
+    S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+    # Files above the threshold go up as parallel multipart uploads (parts must be >= 5 MB)
+    S3_MULTIPART_THRESHOLD_MB = int(os.getenv("S3_MULTIPART_THRESHOLD_MB", "8"))
+    S3_MULTIPART_CHUNK_MB = int(os.getenv("S3_MULTIPART_CHUNK_MB", "8"))
+    S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "8"))
+    UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "16"))
+    # Direct browser-to-S3 uploads: largest accepted file and presigned POST lifetime
+    DIRECT_UPLOAD_MAX_MB = int(os.getenv("DIRECT_UPLOAD_MAX_MB", "100"))
+    PRESIGNED_UPLOAD_EXPIRES_SECONDS = int(os.getenv("PRESIGNED_UPLOAD_EXPIRES_SECONDS", "900"))
+    # Documents live in S3 when uploads are enabled, otherwise under LOCAL_STORAGE_DIR;
+    # ingestion reads them through a content-addressed disk cache bounded by size
+    LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", "storage")
+    DOCUMENT_CACHE_DIR = os.getenv("DOCUMENT_CACHE_DIR", "document_cache")
+    DOCUMENT_CACHE_MAX_MB = int(os.getenv("DOCUMENT_CACHE_MAX_MB", "2048"))
+    # Extracted page text per document (gzipped JSON lines), so re-chunking skips PDF parsing
+    TEXT_CACHE_DIR = os.getenv("TEXT_CACHE_DIR", "text_cache")
     SECRET_KEY = os.getenv("SECRET_KEY")
     ALGORITHM = os.getenv("ALGORITHM")
     ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
@@ -19,6 +37,119 @@ class Config:
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     COLLECTION_NAME = os.getenv("COLLECTION_NAME", "user_documents")
     OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL")
+    # "openai" or "local"; each provider writes to its own, tagged Chroma collection
+    EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai")
+    LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    LOCAL_EMBEDDING_WORKERS = int(os.getenv("LOCAL_EMBEDDING_WORKERS", "2"))
+    LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "64"))
+    # "float32" queries Chroma directly; "float16", "int8" or "pq" search compact codes in each worker
+    # and re-score from the float vectors logged under VECTOR_LOG_DIR, without reading Chroma
+    VECTOR_STORAGE_MODE = os.getenv("VECTOR_STORAGE_MODE", "float32")
+    VECTOR_LOG_DIR = os.getenv("VECTOR_LOG_DIR", "vector_log")
+    # Candidates re-scored at full precision = top-k x factor (pq usually needs ~10)
+    VECTOR_RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", "4"))
+    PQ_SUBVECTORS = int(os.getenv("PQ_SUBVECTORS", "16"))
+    VECTOR_INDEX_REFRESH_SECONDS = float(os.getenv("VECTOR_INDEX_REFRESH_SECONDS", "30"))
+    # Public widget bootstrap: server-side cache TTL and browser/CDN max-age
+    WIDGET_CACHE_TTL_SECONDS = float(os.getenv("WIDGET_CACHE_TTL_SECONDS", "60"))
+    WIDGET_MAX_AGE_SECONDS = int(os.getenv("WIDGET_MAX_AGE_SECONDS", "300"))
+    # Defaults for chatbots that do not set their own chunking (roughly the old 500/50 characters)
+    CHUNK_SIZE_TOKENS = int(os.getenv("CHUNK_SIZE_TOKENS", "125"))
+    CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "12"))
+    # Chat admission: default token-bucket limits (chatbots may override) and burst size in seconds of rate
+    CHATBOT_RATE_LIMIT_PER_MINUTE = int(os.getenv("CHATBOT_RATE_LIMIT_PER_MINUTE", "300"))
+    VISITOR_RATE_LIMIT_PER_MINUTE = int(os.getenv("VISITOR_RATE_LIMIT_PER_MINUTE", "20"))
+    RATE_LIMIT_BURST_SECONDS = float(os.getenv("RATE_LIMIT_BURST_SECONDS", "10"))
+    # Visitors are rate limited by client address; X-Forwarded-For is only honoured from these proxies
+    # (comma-separated addresses or networks, e.g. "127.0.0.1,10.0.0.0/8")
+    TRUSTED_PROXIES = [proxy.strip() for proxy in os.getenv("TRUSTED_PROXIES", "").split(",") if proxy.strip()]
+    # "sqlite" shares buckets between the workers on a host; "memory" is per process
+    RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "sqlite")
+    RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH", "rate_limits.db")
+    # Refilled buckets are deleted every this many acquires per worker
+    RATE_LIMIT_PRUNE_EVERY = int(os.getenv("RATE_LIMIT_PRUNE_EVERY", "1000"))
+    # Host-wide LLM concurrency and wait queue, split evenly across WEB_CONCURRENCY workers.
+    # Their sum per worker should stay below the threadpool size (40), since queued calls hold a thread
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+    LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "16"))
+    LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "10"))
+    # LLM scheduler: whole-call deadline, rate-limit retries and an optional fallback model
+    LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o")
+    LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "")
+    LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "45"))
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+    LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+    LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8"))
+    # Fair-share weights per tenant (user id), e.g. "id-a:3,id-b:2"; unlisted tenants weigh 1
+    LLM_TENANT_WEIGHTS = os.getenv("LLM_TENANT_WEIGHTS", "")
+    # Query embedding micro-batching: wait up to the window (0 disables) or until max size, per worker
+    EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+    EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "64"))
+    EMBEDDING_BATCH_CONCURRENCY = int(os.getenv("EMBEDDING_BATCH_CONCURRENCY", "4"))
+    # Analytics: history without conversation markers starts a new conversation after this much silence
+    CONVERSATION_IDLE_MINUTES = float(os.getenv("CONVERSATION_IDLE_MINUTES", "30"))
+    # Postgres text search configuration used for the chat message index (changing it needs a re-index)
+    SEARCH_LANGUAGE = os.getenv("SEARCH_LANGUAGE", "english")
+    # Usage metering: buffered counters are written to usage_records this often (and on shutdown)
+    USAGE_FLUSH_SECONDS = float(os.getenv("USAGE_FLUSH_SECONDS", "10"))
+    # Chroma HNSW index (Chroma's defaults); space, M and construction ef only apply to new collections
+    HNSW_SPACE = os.getenv("HNSW_SPACE", "l2")
+    HNSW_M = int(os.getenv("HNSW_M", "16"))
+    HNSW_CONSTRUCTION_EF = int(os.getenv("HNSW_CONSTRUCTION_EF", "100"))
+    HNSW_SEARCH_EF = int(os.getenv("HNSW_SEARCH_EF", "100"))
+    RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "13"))
+    # Per-collection overrides as JSON, e.g. '{"documents": {"search_ef": 200, "top_k": 8}}'
+    HNSW_COLLECTION_SETTINGS = os.getenv("HNSW_COLLECTION_SETTINGS", "")
+    # Re-embedding migrations: tenant routes are re-read this often; copy batch size and throttle (0: none)
+    EMBEDDING_ROUTE_TTL_SECONDS = float(os.getenv("EMBEDDING_ROUTE_TTL_SECONDS", "5"))
+    REEMBED_BATCH_SIZE = int(os.getenv("REEMBED_BATCH_SIZE", "100"))
+    REEMBED_MAX_CHUNKS_PER_SECOND = float(os.getenv("REEMBED_MAX_CHUNKS_PER_SECOND", "200"))
+    # Orphan chunk garbage collection: scheduled every N hours (0 disables) in one process per lock file, paged scan
+    VECTOR_GC_INTERVAL_HOURS = float(os.getenv("VECTOR_GC_INTERVAL_HOURS", "24"))
+    VECTOR_GC_LOCK_FILE = os.getenv("VECTOR_GC_LOCK_FILE", "vector_gc.lock")
+    # Documents still "processing" this long after upload were abandoned by a worker that died
+    VECTOR_GC_STALE_PROCESSING_HOURS = float(os.getenv("VECTOR_GC_STALE_PROCESSING_HOURS", "6"))
+    VECTOR_GC_DRY_RUN = os.getenv("VECTOR_GC_DRY_RUN", "false").lower() == "true"
+    VECTOR_GC_PAGE_SIZE = int(os.getenv("VECTOR_GC_PAGE_SIZE", "1000"))
+    VECTOR_GC_DELETE_BATCH_SIZE = int(os.getenv("VECTOR_GC_DELETE_BATCH_SIZE", "500"))
+    # Answer banks: minimum cosine similarity to serve a stored answer; generation sample size
+    ANSWER_BANK_MIN_SIMILARITY = float(os.getenv("ANSWER_BANK_MIN_SIMILARITY", "0.92"))
+    ANSWER_BANK_QUESTIONS_PER_CHUNK = int(os.getenv("ANSWER_BANK_QUESTIONS_PER_CHUNK", "3"))
+    ANSWER_BANK_MAX_CHUNKS = int(os.getenv("ANSWER_BANK_MAX_CHUNKS", "40"))
+    # Progressive ingestion: chunks per embedded and committed batch; progress row updates at most this often
+    INGEST_BATCH_CHUNKS = int(os.getenv("INGEST_BATCH_CHUNKS", "64"))
+    INGEST_PROGRESS_INTERVAL_SECONDS = float(os.getenv("INGEST_PROGRESS_INTERVAL_SECONDS", "1"))
+    # Documents indexed at once per process, across all uploads
+    INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+    # Circuit breakers around the LLM, query embeddings and indexing embeddings: open for N seconds once, of the
+    # last WINDOW calls (at least MIN_CALLS), this share failed or was slower than the service's slow-call threshold
+    CIRCUIT_BREAKER_WINDOW = int(os.getenv("CIRCUIT_BREAKER_WINDOW", "20"))
+    CIRCUIT_BREAKER_MIN_CALLS = int(os.getenv("CIRCUIT_BREAKER_MIN_CALLS", "5"))
+    CIRCUIT_BREAKER_FAILURE_RATE = float(os.getenv("CIRCUIT_BREAKER_FAILURE_RATE", "0.5"))
+    CIRCUIT_BREAKER_OPEN_SECONDS = float(os.getenv("CIRCUIT_BREAKER_OPEN_SECONDS", "30"))
+    LLM_SLOW_CALL_SECONDS = float(os.getenv("LLM_SLOW_CALL_SECONDS", "20"))
+    EMBEDDING_SLOW_CALL_SECONDS = float(os.getenv("EMBEDDING_SLOW_CALL_SECONDS", "2"))
+    EMBEDDING_BATCH_SLOW_CALL_SECONDS = float(os.getenv("EMBEDDING_BATCH_SLOW_CALL_SECONDS", "30"))
+    # Per-request timeout of the OpenAI embedding client (its default is ten minutes)
+    EMBEDDING_TIMEOUT_SECONDS = float(os.getenv("EMBEDDING_TIMEOUT_SECONDS", "60"))
+    # End-to-end chat deadline; query embedding may use at most its budget, generation gets the rest
+    CHAT_DEADLINE_SECONDS = float(os.getenv("CHAT_DEADLINE_SECONDS", "30"))
+    CHAT_EMBEDDING_BUDGET_SECONDS = float(os.getenv("CHAT_EMBEDDING_BUDGET_SECONDS", "3"))
+    # When the LLM is unavailable, answer with the top retrieved passages instead of an error
+    CHAT_DEGRADED_MODE = os.getenv("CHAT_DEGRADED_MODE", "true").lower() == "true"
+    CHAT_DEGRADED_PASSAGES = int(os.getenv("CHAT_DEGRADED_PASSAGES", "3"))
+    # On-demand request profiling: requests with `X-Profile: <token>` or this share of all requests (both off
+    # by default) are sampled every N ms; the newest PROFILING_MAX_PROFILES profiles are kept in PROFILING_DIR
+    PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+    PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+    PROFILING_INTERVAL_MS = float(os.getenv("PROFILING_INTERVAL_MS", "5"))
+    PROFILING_DIR = os.getenv("PROFILING_DIR", "profiles")
+    PROFILING_MAX_PROFILES = int(os.getenv("PROFILING_MAX_PROFILES", "50"))
+    # WebSocket chat: server heartbeat interval, close after this long without a chat message,
+    # and the number of recent messages kept as conversation history per connection
+    CHAT_WS_HEARTBEAT_SECONDS = float(os.getenv("CHAT_WS_HEARTBEAT_SECONDS", "25"))
+    CHAT_WS_IDLE_TIMEOUT_SECONDS = float(os.getenv("CHAT_WS_IDLE_TIMEOUT_SECONDS", "600"))
+    CHAT_WS_HISTORY_MESSAGES = int(os.getenv("CHAT_WS_HISTORY_MESSAGES", "20"))
 
 class DevelopmentConfig(Config):
     DEBUG = True
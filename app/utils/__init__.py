@@ -1,2 +1,2 @@
 from .auth import verify_password, get_password_hash, get_user, authenticate_user, create_access_token, get_current_user, get_current_user_from_db
-from .process_pdf import precess_pdf, save_pdf
\ No newline at end of file
+from .process_pdf import precess_pdf, save_pdf, document_store
\ No newline at end of file
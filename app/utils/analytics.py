@@ -0,0 +1,202 @@
+"""
+Per-chatbot conversation statistics, answered from hourly and daily rollups.
+
+Every saved message increments its hour and day buckets in the same transaction
+(an INSERT ... ON CONFLICT DO UPDATE), so reads cost one row per bucket no
+matter how much history a chatbot has. Deleting messages rebuilds only the UTC
+days they fall in (rebuild_days). Rollups for existing history are built with:
+
+    python -m app.utils.analytics backfill [--chatbot-id ID]
+"""
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.db.upsert import increment_rows
+from app.models.models import ChatMessage, ChatRollup
+from app.setting import current_config
+
+GRANULARITIES = ("hour", "day")
+COUNTERS = ("user_messages", "bot_messages", "conversations", "user_chars", "bot_chars")
+
+
+def utc_naive(timestamp: datetime) -> datetime:
+    """Timestamps are stored as naive UTC."""
+    if timestamp.tzinfo is None:
+        return timestamp
+    return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    """Start of the UTC hour or day containing `timestamp`, as a naive UTC datetime."""
+    timestamp = utc_naive(timestamp).replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0) if granularity == "day" else timestamp
+
+
+def message_counts(sender: str, text: str, starts_conversation: bool) -> dict:
+    is_bot = sender == "bot"
+    return {
+        "user_messages": 0 if is_bot else 1,
+        "bot_messages": 1 if is_bot else 0,
+        "conversations": 1 if starts_conversation and not is_bot else 0,
+        "user_chars": 0 if is_bot else len(text),
+        "bot_chars": len(text) if is_bot else 0,
+    }
+
+
+def record_message(db: Session, message: ChatMessage):
+    """Adds a message to its hour and day rollups; the caller commits."""
+    if not message.chatbot_id:
+        return
+    counts = message_counts(message.sender, message.text, message.starts_conversation)
+    increment_rows(db, ChatRollup, [
+        {
+            "chatbot_id": message.chatbot_id,
+            "granularity": granularity,
+            "bucket_start": bucket_start(message.created_at, granularity),
+            "user_id": message.user_id,
+            **counts,
+        }
+        for granularity in GRANULARITIES
+    ], keys=("chatbot_id", "granularity", "bucket_start"), counters=COUNTERS)
+
+
+def chatbot_stats(db: Session, chatbot_id: str, granularity: str = "day",
+                  start: datetime = None, end: datetime = None) -> dict:
+    """Totals and a per-bucket series for one chatbot; `start` is inclusive, `end` exclusive."""
+    query = db.query(ChatRollup).filter(
+        ChatRollup.chatbot_id == chatbot_id, ChatRollup.granularity == granularity
+    )
+    if start:
+        query = query.filter(ChatRollup.bucket_start >= bucket_start(start, granularity))
+    if end:
+        query = query.filter(ChatRollup.bucket_start < utc_naive(end))
+    series = [
+        {"bucket_start": rollup.bucket_start.isoformat(), **{name: getattr(rollup, name) for name in COUNTERS}}
+        for rollup in query.order_by(ChatRollup.bucket_start)
+    ]
+    totals = {name: sum(bucket[name] for bucket in series) for name in COUNTERS}
+    totals["bot_user_ratio"] = (
+        totals["bot_messages"] / totals["user_messages"] if totals["user_messages"] else None
+    )
+    return {"chatbot_id": chatbot_id, "granularity": granularity, "totals": totals, "series": series}
+
+
+def backfill(db: Session, chatbot_id: str = None, batch_size: int = 1000) -> int:
+    """
+    Rebuilds the rollups of one chatbot (or all of them) from the message table, in one transaction.
+    Messages saved before conversations were recorded count as a new conversation when they are a
+    user message after CONVERSATION_IDLE_MINUTES without any message in that chatbot.
+    Returns the number of messages read.
+    """
+    idle = timedelta(minutes=current_config.CONVERSATION_IDLE_MINUTES)
+    rollups = db.query(ChatRollup)
+    messages = message_rows(db).filter(ChatMessage.chatbot_id.isnot(None))
+    if chatbot_id:
+        rollups = rollups.filter(ChatRollup.chatbot_id == chatbot_id)
+        messages = messages.filter(ChatMessage.chatbot_id == chatbot_id)
+    rollups.delete(synchronize_session=False)
+
+    buckets, current, last_seen, read = {}, None, None, 0
+
+    def flush():
+        if buckets:
+            db.bulk_insert_mappings(ChatRollup, list(buckets.values()))
+            buckets.clear()
+
+    for bot_id, user_id, sender, text, created_at, starts in (
+        messages.order_by(ChatMessage.chatbot_id, ChatMessage.created_at).yield_per(batch_size)
+    ):
+        if bot_id != current:
+            flush()  # rows arrive grouped by chatbot, so only one chatbot's buckets are held at a time
+            current, last_seen = bot_id, None
+        if starts is None:
+            starts = last_seen is None or created_at - last_seen > idle
+        last_seen = created_at
+        read += 1
+        add_to_buckets(buckets, bot_id, user_id, created_at, message_counts(sender, text, starts))
+    flush()
+    db.commit()
+    return read
+
+
+def rebuild_days(db: Session, chatbot_id: str, timestamps) -> int:
+    """
+    Rebuilds the hour and day rollups of one chatbot for the UTC days containing `timestamps` (e.g. of
+    deleted messages) from the messages left in them; the caller commits. Consecutive days are rebuilt
+    as one range. Conversations of messages from before they were recorded are inferred as in `backfill`,
+    starting from the last message before the range. Returns the number of messages read.
+    """
+    idle = timedelta(minutes=current_config.CONVERSATION_IDLE_MINUTES)
+    ranges = []
+    for day in sorted({bucket_start(timestamp, "day") for timestamp in timestamps}):
+        if ranges and ranges[-1][1] == day:
+            ranges[-1][1] = day + timedelta(days=1)
+        else:
+            ranges.append([day, day + timedelta(days=1)])
+
+    read = 0
+    for start, end in ranges:
+        db.query(ChatRollup).filter(
+            ChatRollup.chatbot_id == chatbot_id, ChatRollup.bucket_start >= start, ChatRollup.bucket_start < end
+        ).delete(synchronize_session=False)
+        last_seen = db.query(func.max(ChatMessage.created_at)).filter(
+            ChatMessage.chatbot_id == chatbot_id, ChatMessage.created_at < start
+        ).scalar()
+        buckets = {}
+        for bot_id, user_id, sender, text, created_at, starts in message_rows(db).filter(
+            ChatMessage.chatbot_id == chatbot_id, ChatMessage.created_at >= start, ChatMessage.created_at < end
+        ).order_by(ChatMessage.created_at):
+            if starts is None:
+                starts = last_seen is None or created_at - last_seen > idle
+            last_seen = created_at
+            read += 1
+            add_to_buckets(buckets, bot_id, user_id, created_at, message_counts(sender, text, starts))
+        if buckets:
+            db.bulk_insert_mappings(ChatRollup, list(buckets.values()))
+    return read
+
+
+def message_rows(db: Session):
+    return db.query(
+        ChatMessage.chatbot_id, ChatMessage.user_id, ChatMessage.sender, ChatMessage.text,
+        ChatMessage.created_at, ChatMessage.starts_conversation,
+    )
+
+
+def add_to_buckets(buckets: dict, chatbot_id: str, user_id, created_at: datetime, counts: dict):
+    """Adds one message's counts to its hour and day rollup rows in `buckets`."""
+    for granularity in GRANULARITIES:
+        key = (granularity, bucket_start(created_at, granularity))
+        bucket = buckets.setdefault(key, {
+            "chatbot_id": chatbot_id, "granularity": key[0], "bucket_start": key[1], "user_id": user_id,
+            **{name: 0 for name in COUNTERS},
+        })
+        for name in COUNTERS:
+            bucket[name] += counts[name]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat analytics rollups")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subcommands.add_parser("backfill", help="rebuild rollups from existing messages")
+    backfill_parser.add_argument("--chatbot-id", help="only this chatbot (default: all)")
+    args = parser.parse_args()
+
+    from app.db.base import Base
+    from app.db.session import SessionLocal, engine
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        count = backfill(db, chatbot_id=args.chatbot_id)
+        rollups = db.query(func.count()).select_from(ChatRollup).scalar()
+        print(f"Backfilled {count} messages into {rollups} rollup rows.")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Precomputed question/answer pairs per chatbot, served without an LLM call.
+
+Building a bank samples chunks from the chatbot's documents, asks the model
+for the questions each chunk answers, and answers every question through the
+normal retrieval path, all in the scheduler's batch lane. The questions are
+embedded into an "answer_bank" collection tagged with the chatbot and a build
+version. A first question in chat is looked up there first and, when the
+nearest stored question is at least ANSWER_BANK_MIN_SIMILARITY (cosine)
+similar, its stored answer is returned without retrieval or an LLM call.
+
+Entries of a new build are written before the bank switches to its version,
+so lookups never see a half-built bank. A bank only answers chats over exactly
+the documents it was built from; it is rebuilt when they change.
+
+    python -m app.utils.answer_bank build CHATBOT_ID
+"""
+import argparse
+import json
+import re
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from datetime import datetime, timezone
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.models.models import AnswerBank, ChatBot
+from app.setting import current_config
+from app.utils.chunking import estimate_tokens
+from app.utils.index_settings import IndexSettings
+from app.utils.llm_scheduler import llm_scheduler
+from app.utils.metrics import metrics
+from app.utils.process_pdf import precess_pdf
+from app.utils.singleflight import normalize_query
+from app.utils.usage import usage_meter
+
+QUESTION_PROMPT = (
+    "You write the questions that users of a support chatbot are likely to ask. "
+    "Given an excerpt of the chatbot's documents, list up to {count} short, self-contained questions "
+    "that the excerpt answers, one per line, without numbering or commentary."
+)
+
+
+def fingerprint(document_ids) -> str:
+    return json.dumps(sorted(set(document_ids)))
+
+
+def parse_questions(text: str, limit: int) -> list:
+    """Question lines from the model's reply, with any list markers removed."""
+    questions = []
+    for line in text.splitlines():
+        line = re.sub(r"^\s*(?:[-*•]|\d+[.)])\s*", "", line).strip()
+        if line.endswith("?"):
+            questions.append(line)
+    return questions[:limit]
+
+
+class AnswerBankBuilder:
+    def __init__(self, store, session_factory, min_similarity: float = None, questions_per_chunk: int = None,
+                 max_chunks: int = None):
+        self.store = store  # HandleChromadb
+        self.session_factory = session_factory
+        self.min_similarity = (
+            current_config.ANSWER_BANK_MIN_SIMILARITY if min_similarity is None else min_similarity
+        )
+        self.questions_per_chunk = questions_per_chunk or current_config.ANSWER_BANK_QUESTIONS_PER_CHUNK
+        self.max_chunks = max_chunks or current_config.ANSWER_BANK_MAX_CHUNKS
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="answer-bank")
+        self._queued = set()
+        self._lock = threading.Lock()
+
+    def collection(self, tenant: str):
+        """The tenant's bank collection (for its embedding model) and query embedder; cosine space."""
+        _, provider, embedder = self.store.resolve(tenant)
+        name = provider.collection_name("answer_bank")
+        collection = self.store.client.get_or_create_collection(
+            name=name,
+            embedding_function=provider.function,
+            metadata=provider.collection_metadata(),
+            configuration=replace(IndexSettings.for_collection(name), space="cosine").configuration(),
+        )
+        return collection, provider, embedder
+
+    # --- Chat time ---
+
+    def lookup(self, db: Session, user_id, chatbot_id: str, query: str, document_ids: list,
+               timeout: float = None) -> tuple:
+        """
+        (answer, query vector): the stored answer for the nearest bank question, or None below the
+        similarity threshold (or if embedding the query takes longer than `timeout`). The query vector,
+        None if the query was not embedded, is embedded with the tenant's query embedder, so retrieval
+        on a miss passes it to `query_collection` instead of embedding the query again. Only the
+        chatbot's owner is answered from its bank: banks of other tenants' chatbots may share the collection.
+        """
+        bank = db.get(AnswerBank, chatbot_id) if chatbot_id else None
+        # The last completed build keeps answering while a rebuild runs (or after one failed)
+        if bank is None or bank.version is None or bank.document_ids != fingerprint(document_ids):
+            return None, None
+        chatbot = db.get(ChatBot, chatbot_id)
+        if chatbot is None or str(chatbot.user_id) != str(user_id):
+            metrics.incr("answer_bank_lookups_total", outcome="forbidden")
+            return None, None
+        usage_meter.record(user_id, chatbot_id, embedding_tokens=estimate_tokens(query))
+        query_vector = None
+        try:
+            collection, _, embedder = self.collection(str(user_id))
+            query_vector = self.store.embedding_breaker.call(embedder.embed, query, timeout=timeout)
+            result = collection.query(
+                query_embeddings=[query_vector],
+                n_results=1,
+                where={"$and": [{"chatbot_id": chatbot_id}, {"version": bank.version}]},
+                include=["metadatas", "distances"],
+            )
+        except Exception as e:  # the regular path still answers
+            metrics.incr("answer_bank_lookups_total", outcome="error")
+            print(f"[WARN] Answer bank lookup failed: {e}")
+            return None, query_vector
+        if result["ids"][0] and 1 - result["distances"][0][0] >= self.min_similarity:
+            metrics.incr("answer_bank_lookups_total", outcome="hit")
+            return result["metadatas"][0][0]["answer"], query_vector
+        metrics.incr("answer_bank_lookups_total", outcome="miss")
+        return None, query_vector
+
+    # --- Building ---
+
+    def refresh(self, chatbot_id: str):
+        """Queues a rebuild if the chatbot has a bank; a rebuild already waiting covers this one."""
+        with self.session_factory() as db:
+            if db.get(AnswerBank, chatbot_id) is None:
+                return
+        with self._lock:
+            if chatbot_id in self._queued:
+                return
+            self._queued.add(chatbot_id)
+        self._executor.submit(self._build_queued, chatbot_id)
+
+    def _build_queued(self, chatbot_id: str):
+        with self._lock:
+            self._queued.discard(chatbot_id)
+        try:
+            self.build(chatbot_id)
+        except Exception as e:
+            print(f"[ERROR] Answer bank build for chatbot {chatbot_id} failed: {e}")
+
+    def build(self, chatbot_id: str) -> int:
+        """Generates, embeds and switches to a new set of entries; returns their number."""
+        with self.session_factory() as db:
+            bank, chatbot = db.get(AnswerBank, chatbot_id), db.get(ChatBot, chatbot_id)
+            if bank is None or chatbot is None:
+                return 0
+            tenant = str(chatbot.user_id)
+            document_ids = sorted(document.id for document in chatbot.documents)
+            bank.status, bank.error = "building", None
+            db.commit()
+            try:
+                pairs = self.generate(tenant, chatbot_id, document_ids)
+                version = uuid.uuid4().hex
+                collection, provider, _ = self.collection(tenant)
+                for start in range(0, len(pairs), 100):
+                    batch = pairs[start:start + 100]
+                    questions = [question for question, _ in batch]
+                    collection.add(
+                        ids=[f"{chatbot_id}_{version}_{start + i}" for i in range(len(batch))],
+                        documents=questions,
+                        embeddings=self.store.embedding_batch_breaker.call(provider.function, questions),
+                        metadatas=[
+                            {"chatbot_id": chatbot_id, "version": version, "answer": answer} for _, answer in batch
+                        ],
+                    )
+                    usage_meter.record(tenant, chatbot_id, embedding_tokens=sum(map(estimate_tokens, questions)))
+                bank.version, bank.document_ids, bank.entries = version, fingerprint(document_ids), len(pairs)
+                bank.status, bank.built_at = "ready", datetime.now(timezone.utc)
+                db.commit()
+                collection.delete(where={"$and": [{"chatbot_id": chatbot_id}, {"version": {"$ne": version}}]})
+            except Exception as e:
+                db.rollback()
+                bank.status, bank.error = "failed", str(e)
+                db.commit()
+                raise
+            metrics.incr("answer_bank_builds_total")
+            print(f"Built answer bank for chatbot {chatbot_id}: {len(pairs)} entries")
+            return len(pairs)
+
+    def generate(self, tenant: str, chatbot_id: str, document_ids: list) -> list:
+        """(question, answer) pairs for chunks spread evenly over the documents."""
+        if not document_ids:
+            return []
+        document_filter = {"$and": [{"user_id": {"$eq": tenant}}, {"id": {"$in": document_ids}}]}
+        collection_name, provider, _ = self.store.resolve(tenant)
+        chunks = self.store.client.get_collection(collection_name, embedding_function=provider.function)
+        ids = chunks.get(where=document_filter, include=[])["ids"]
+        step = max(len(ids) / self.max_chunks, 1)
+        sample = [ids[int(i * step)] for i in range(min(len(ids), self.max_chunks))]
+        texts = chunks.get(ids=sample, include=["documents"])["documents"] if sample else []
+
+        questions = {}
+        for text in texts:
+            for question in self.questions_for(tenant, chatbot_id, text):
+                questions.setdefault(normalize_query(question), question)
+
+        pairs = []
+        for question in questions.values():
+            context = self.store.query_collection(question, filter=document_filter, tenant=tenant)
+            answer = self.store.get_ai_response(question, context, tenant=tenant, priority="batch",
+                                                chatbot_id=chatbot_id)
+            pairs.append((question, answer))
+        return pairs
+
+    def questions_for(self, tenant: str, chatbot_id: str, text: str) -> list:
+        messages = [
+            SystemMessage(content=QUESTION_PROMPT.format(count=self.questions_per_chunk)),
+            HumanMessage(content=text),
+        ]
+        response = llm_scheduler.invoke([self.store.llm, *self.store.fallback_llms], messages, tenant=tenant,
+                                        priority="batch")
+        usage = getattr(response, "usage_metadata", None) or {}
+        usage_meter.record(tenant, chatbot_id, llm_calls=1, prompt_tokens=usage.get("input_tokens", 0),
+                           completion_tokens=usage.get("output_tokens", 0))
+        return parse_questions(response.content, self.questions_per_chunk)
+
+    def remove(self, db: Session, bank: AnswerBank):
+        """Deletes a chatbot's bank and its entries."""
+        chatbot = db.get(ChatBot, bank.chatbot_id)
+        if chatbot is not None:
+            collection, _, _ = self.collection(str(chatbot.user_id))
+            collection.delete(where={"chatbot_id": bank.chatbot_id})
+        db.delete(bank)
+        db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"queued_builds": len(self._queued)}
+
+
+answer_bank = AnswerBankBuilder(precess_pdf, SessionLocal)
+metrics.register_collector("answer_bank", answer_bank.stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a chatbot's precomputed answer bank")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("build", help="enable (if needed) and rebuild the bank now").add_argument("chatbot_id")
+    args = parser.parse_args()
+
+    from app.db.base import Base
+    from app.db.session import engine
+
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        if db.get(AnswerBank, args.chatbot_id) is None:
+            db.add(AnswerBank(chatbot_id=args.chatbot_id))
+            db.commit()
+    print(f"{answer_bank.build(args.chatbot_id)} entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import re
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator
+
+from app.setting import current_config
+
+# OpenAI tokenizers average roughly four characters per token on English text.
+# Estimating keeps chunking at thousands of pages per second; pass a real
+# tokenizer as `token_counter` when exact counts matter.
+CHARS_PER_TOKEN = 4
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])[\"')\]]*\s+(?=[\"'(\[]?[A-Z0-9])")
+NUMBERED_HEADING = re.compile(r"^(\d+(\.\d+)*\.?|[IVXLC]+\.|chapter\s+\d+|section\s+\d+)\s+\S", re.IGNORECASE)
+TERMINAL_PUNCTUATION = (".", "!", "?", ":", ";", ",", '"', "'", ")")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of a piece of text."""
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+def is_heading(line: str) -> bool:
+    """Heuristic heading detection for a single line of extracted PDF text."""
+    line = line.strip()
+    if not line or len(line) > 80 or line.endswith(TERMINAL_PUNCTUATION):
+        return False
+    if line.startswith("#") or NUMBERED_HEADING.match(line):
+        return True
+    words = line.split()
+    if len(words) > 10:
+        return False
+    if line.isupper() and any(c.isalpha() for c in line):
+        return True
+    capitalized = sum(1 for word in words if word[:1].isupper())
+    return capitalized == len(words)
+
+
+@dataclass
+class Chunk:
+    text: str
+    page_start: int
+    page_end: int
+    tokens: int
+
+
+@dataclass
+class _Unit:
+    text: str
+    page_start: int
+    page_end: int
+    tokens: int
+    heading: bool = False
+
+
+class StructuredChunker:
+    """
+    Streams page text into token-bounded chunks.
+
+    Text is carried across page boundaries so sentences cut by a page break stay
+    whole, headings start a new chunk, sentences are never split unless a single
+    sentence is larger than the chunk size, and a tiny trailing chunk is merged
+    into its predecessor.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = None,
+        chunk_overlap: int = None,
+        min_chunk_size: int = None,
+        token_counter: Callable[[str], int] = estimate_tokens,
+    ):
+        self.chunk_size = chunk_size or current_config.CHUNK_SIZE_TOKENS
+        self.chunk_overlap = current_config.CHUNK_OVERLAP_TOKENS if chunk_overlap is None else chunk_overlap
+        if self.chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+        if not 0 <= self.chunk_overlap < self.chunk_size:
+            raise ValueError("chunk_overlap must be at least 0 and smaller than chunk_size")
+        self.min_chunk_size = min_chunk_size if min_chunk_size is not None else max(1, self.chunk_size // 4)
+        self.count_tokens = token_counter
+
+    def split_text(self, text: str) -> list:
+        """Chunk a single block of text, returning only the chunk strings."""
+        return [chunk.text for chunk in self.chunk_pages([(1, text)])]
+
+    def chunk_pages(self, pages: Iterable) -> Iterator[Chunk]:
+        """Chunk an iterable of (page_number, text) pairs, yielding chunks as soon as they are complete."""
+        current, carried = [], 0  # carried: leading units repeated from the previous chunk
+        pending = None  # held back one step so a tiny tail can be merged into it
+
+        for unit in self._units(pages):
+            if unit.heading:
+                if sum(u.tokens for u in current[carried:]) >= self.min_chunk_size:
+                    if pending:
+                        yield pending
+                    pending = self._build(current)
+                    current, carried = [], 0
+                elif carried == len(current):
+                    current, carried = [], 0
+
+            for piece in self._fit(unit):
+                if current and sum(u.tokens for u in current) + piece.tokens > self.chunk_size:
+                    if pending:
+                        yield pending
+                    pending = self._build(current)
+                    current = self._overlap(current)
+                    carried = len(current)
+                current.append(piece)
+
+        fresh = current[carried:]
+        if pending and fresh and sum(u.tokens for u in fresh) < self.min_chunk_size:
+            pending = self._build([pending] + fresh)
+            fresh = []
+        if pending:
+            yield pending
+        if fresh:
+            yield self._build(current)
+
+    def _units(self, pages: Iterable) -> Iterator[_Unit]:
+        """Yield headings and complete sentences, joining sentences that straddle pages."""
+        carry, carry_start = "", None
+        for page_number, text in pages:
+            paragraph = []
+            for line in (text or "").splitlines():
+                line = line.strip()
+                if not line:
+                    continue
+                if is_heading(line):
+                    yield from self._sentences(" ".join(paragraph), carry, carry_start, page_number)
+                    carry, carry_start, paragraph = "", None, []
+                    yield _Unit(line, page_number, page_number, self.count_tokens(line), heading=True)
+                else:
+                    paragraph.append(line)
+            if paragraph:
+                sentences = list(self._sentences(" ".join(paragraph), carry, carry_start, page_number))
+                if sentences and sentences[-1].text.endswith((".", "!", "?")):
+                    carry, carry_start = "", None
+                    yield from sentences
+                elif sentences:
+                    yield from sentences[:-1]
+                    carry, carry_start = sentences[-1].text, sentences[-1].page_start
+        if carry:
+            yield _Unit(carry, carry_start, carry_start, self.count_tokens(carry))
+
+    def _sentences(self, text, carry, carry_start, page_number):
+        if carry:
+            text = f"{carry} {text}".strip()
+        if not text:
+            return
+        parts = SENTENCE_BOUNDARY.split(text)
+        for index, sentence in enumerate(parts):
+            start = carry_start if index == 0 and carry_start is not None else page_number
+            yield _Unit(sentence, start, page_number, self.count_tokens(sentence))
+
+    def _fit(self, unit: _Unit) -> Iterator[_Unit]:
+        """Hard-split a unit that is larger than a whole chunk, on word boundaries."""
+        if unit.tokens <= self.chunk_size:
+            yield unit
+            return
+        words, piece = unit.text.split(), []
+        for word in words:
+            candidate = " ".join(piece + [word])
+            if piece and self.count_tokens(candidate) > self.chunk_size:
+                text = " ".join(piece)
+                yield _Unit(text, unit.page_start, unit.page_end, self.count_tokens(text))
+                piece = [word]
+            else:
+                piece.append(word)
+        if piece:
+            text = " ".join(piece)
+            yield _Unit(text, unit.page_start, unit.page_end, self.count_tokens(text))
+
+    def _overlap(self, units: list) -> list:
+        if not self.chunk_overlap:
+            return []
+        kept, tokens = [], 0
+        for unit in reversed(units):
+            if unit.heading or tokens + unit.tokens > self.chunk_overlap:
+                break
+            kept.insert(0, unit)
+            tokens += unit.tokens
+        return kept
+
+    def _build(self, units: list) -> Chunk:
+        text = " ".join(unit.text for unit in units)
+        return Chunk(
+            text=text,
+            page_start=min(unit.page_start for unit in units),
+            page_end=max(unit.page_end for unit in units),
+            tokens=self.count_tokens(text),
+        )
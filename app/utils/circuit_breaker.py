@@ -0,0 +1,164 @@
+import threading
+import time
+from collections import deque
+
+from app.setting import current_config
+from app.utils.metrics import metrics
+
+STATES = ("closed", "open", "half_open")
+
+
+class CircuitOpen(Exception):
+    """The upstream is failing; the call was rejected without being made."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"The {name} service is unavailable, please retry shortly.")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast while an upstream is unhealthy.
+
+    The outcomes of the last `window` calls are kept. Once at least `min_calls`
+    are known and the share of failures, or of calls slower than `slow_seconds`,
+    reaches `failure_rate`, the breaker opens and rejects calls with CircuitOpen
+    for `open_seconds`. It then lets one trial call through (half-open): success
+    closes it again, failure reopens it. Exceptions in `ignore` are neither
+    failures nor successes (for example waiting for a local slot).
+    """
+
+    def __init__(self, name: str, slow_seconds: float, window: int = None, min_calls: int = None,
+                 failure_rate: float = None, open_seconds: float = None, ignore: tuple = ()):
+        self.name = name
+        self.slow_seconds = slow_seconds
+        self.window = window or current_config.CIRCUIT_BREAKER_WINDOW
+        self.min_calls = min_calls or current_config.CIRCUIT_BREAKER_MIN_CALLS
+        self.failure_rate = failure_rate or current_config.CIRCUIT_BREAKER_FAILURE_RATE
+        self.open_seconds = current_config.CIRCUIT_BREAKER_OPEN_SECONDS if open_seconds is None else open_seconds
+        self.ignore = ignore
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=self.window)  # (failed, slow)
+        self._state = "closed"
+        self._opened_at = None
+        self._trial_running = False
+        self._counts = {"calls": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "opened": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == "open" and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = "half_open"
+        return self._state
+
+    def _admit(self):
+        with self._lock:
+            state = self._current_state()
+            if state == "closed":
+                return
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return
+            self._counts["rejected"] += 1
+            retry_after = self.open_seconds - (time.monotonic() - self._opened_at) if state == "open" else 1.0
+        metrics.incr("circuit_breaker_rejected_total", breaker=self.name)
+        raise CircuitOpen(self.name, max(retry_after, 1.0))
+
+    def reject_if_open(self):
+        """Raises CircuitOpen while the breaker is open, without taking a half-open trial."""
+        with self._lock:
+            if self._current_state() != "open":
+                return
+            self._counts["rejected"] += 1
+            retry_after = self.open_seconds - (time.monotonic() - self._opened_at)
+        metrics.incr("circuit_breaker_rejected_total", breaker=self.name)
+        raise CircuitOpen(self.name, max(retry_after, 1.0))
+
+    def _record(self, failed: bool, slow: bool):
+        with self._lock:
+            self._counts["calls"] += 1
+            self._counts["failures"] += failed
+            self._counts["slow_calls"] += slow
+            if self._state == "half_open":
+                self._trial_running = False
+                if failed or slow:
+                    self._open()
+                else:
+                    self._state = "closed"
+                    self._outcomes.clear()
+                    print(f"[CIRCUIT] {self.name} closed")
+                return
+            self._outcomes.append((failed, slow))
+            if self._state == "closed" and len(self._outcomes) >= self.min_calls:
+                failures = sum(failed for failed, _ in self._outcomes)
+                slow_calls = sum(slow for _, slow in self._outcomes)
+                if max(failures, slow_calls) >= self.failure_rate * len(self._outcomes):
+                    self._open()
+
+    def _open(self):
+        self._state, self._opened_at = "open", time.monotonic()
+        self._counts["opened"] += 1
+        metrics.incr("circuit_breaker_opened_total", breaker=self.name)
+        print(f"[CIRCUIT] {self.name} opened for {self.open_seconds:.0f}s")
+
+    def call(self, func, *args, **kwargs):
+        self._admit()
+        started = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except self.ignore:
+            with self._lock:
+                self._trial_running = False
+            raise
+        except Exception:
+            self._record(failed=True, slow=False)
+            raise
+        self._record(failed=False, slow=time.monotonic() - started >= self.slow_seconds)
+        return result
+
+    def iterate(self, func, *args, **kwargs):
+        """Like `call`, for a function returning an iterator; the call is slow if its first item is."""
+        self._admit()
+        started, slow, outcome = time.monotonic(), None, None
+        try:
+            for item in func(*args, **kwargs):
+                if slow is None:
+                    slow = time.monotonic() - started >= self.slow_seconds
+                yield item
+            outcome = "ok"
+        except self.ignore:
+            raise
+        except Exception:
+            outcome = "failed"
+            raise
+        finally:
+            if outcome == "failed":
+                self._record(failed=True, slow=False)
+            elif outcome == "ok" or slow is not None:  # a consumer that stops early still saw the upstream work
+                self._record(failed=False, slow=time.monotonic() - started >= self.slow_seconds if slow is None else slow)
+            else:
+                with self._lock:
+                    self._trial_running = False
+
+    def reset(self):
+        with self._lock:
+            self._state, self._opened_at, self._trial_running = "closed", None, False
+            self._outcomes.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            state = self._current_state()
+            return {"state": state, "open": state != "closed", **self._counts}
+
+
+# The LLM breaker wraps each upstream attempt inside the scheduler, so queueing for a local slot is not timed
+llm_breaker = CircuitBreaker("llm", current_config.LLM_SLOW_CALL_SECONDS)
+embedding_breaker = CircuitBreaker("embedding", current_config.EMBEDDING_SLOW_CALL_SECONDS)
+# Indexing embeds whole batches of chunks, which are slower than single queries
+embedding_batch_breaker = CircuitBreaker("embedding_batch", current_config.EMBEDDING_BATCH_SLOW_CALL_SECONDS)
+breakers = {breaker.name: breaker for breaker in (llm_breaker, embedding_breaker, embedding_batch_breaker)}
+metrics.register_collector("circuit_breakers", lambda: {name: b.stats() for name, b in breakers.items()})
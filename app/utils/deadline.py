@@ -0,0 +1,31 @@
+import time
+
+from app.utils.metrics import metrics
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before a stage could start or finish."""
+
+
+class Deadline:
+    """
+    An end-to-end time budget for one request, shared by its stages.
+
+    Each stage asks for `budget(stage, cap)`: the time it may use, which is the
+    rest of the deadline, or less when the stage has its own cap so that later
+    stages keep enough time.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    def budget(self, stage: str, cap: float = None) -> float:
+        remaining = self.remaining()
+        if remaining <= 0:
+            metrics.incr("deadline_exceeded_total", stage=stage)
+            raise DeadlineExceeded(f"No time left for {stage} within the {self.seconds:.0f}s deadline")
+        return remaining if cap is None else min(cap, remaining)
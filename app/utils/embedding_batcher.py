@@ -0,0 +1,77 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from app.utils.metrics import metrics
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces single-text embedding calls from concurrent requests into batches.
+
+    Callers block in `embed` while a dispatcher thread gathers pending texts
+    for up to `window_ms` after the first arrives, or until `max_size` are
+    waiting, then embeds them in one call and hands each caller its vector.
+    At most `concurrency` batches are in flight; while they are busy, new
+    texts keep accumulating into the next batch. A window of 0 disables batching.
+    """
+
+    def __init__(self, function, window_ms: float = 5, max_size: int = 64, concurrency: int = 4):
+        self.function = function
+        self.window = window_ms / 1000
+        self.max_size = max_size
+        self.concurrency = concurrency
+        self._pending = []
+        self._cond = threading.Condition()
+        self._slots = threading.Semaphore(concurrency)
+        self._executor = None
+        self._thread = None
+
+    def embed(self, text: str, timeout: float = None):
+        """The text's vector; raises TimeoutError if a batch has not delivered it within `timeout`."""
+        if self.window <= 0:
+            return self.function([text])[0]
+        future = Future()
+        with self._cond:
+            if self._thread is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="embed-batch")
+                self._thread = threading.Thread(target=self._dispatch, name="embed-batcher", daemon=True)
+                self._thread.start()
+            self._pending.append((time.monotonic(), text, future))
+            self._cond.notify()
+        return future.result(timeout)
+
+    def _dispatch(self):
+        while True:
+            # Wait for a free slot first, so texts pile up while all batches are busy
+            self._slots.acquire()
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                flush_at = self._pending[0][0] + self.window
+                while len(self._pending) < self.max_size:
+                    remaining = flush_at - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.max_size]
+                del self._pending[:self.max_size]
+            self._executor.submit(self._flush, batch)
+
+    def _flush(self, batch):
+        try:
+            # Identical queries in one batch are embedded once
+            texts = list(dict.fromkeys(text for _, text, _ in batch))
+            try:
+                vectors = self.function(texts)
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                return
+            by_text = dict(zip(texts, vectors))
+            for _, text, future in batch:
+                future.set_result(by_text[text])
+            metrics.incr("query_embedding_batches_total")
+            metrics.incr("query_embedding_texts_total", len(batch))
+        finally:
+            self._slots.release()
@@ -0,0 +1,167 @@
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from chromadb.api.types import EmbeddingFunction
+from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
+
+from app.setting import current_config
+
+# Known output sizes, so OpenAI collections can be tagged without a probe request
+OPENAI_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+
+class EmbeddingProviderMismatch(ValueError):
+    """Raised when a collection holds vectors from a different embedding provider."""
+
+
+# --- Local CPU provider (runs in worker processes) ---
+
+_worker_model = None
+
+
+def _load_model(model_name: str):
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError as e:
+        raise ImportError(
+            "EMBEDDING_PROVIDER=local requires the sentence-transformers package "
+            "(pip install sentence-transformers)."
+        ) from e
+    return SentenceTransformer(model_name, device="cpu")
+
+
+def _init_worker(model_name: str):
+    global _worker_model
+    _worker_model = _load_model(model_name)
+
+
+def _embed_batch(texts: list) -> list:
+    vectors = _worker_model.encode(texts, batch_size=len(texts), normalize_embeddings=True)
+    return [vector.tolist() for vector in vectors]
+
+
+class LocalEmbeddingFunction(EmbeddingFunction):
+    """
+    Sentence-transformers model on the CPU, with batched inference spread over a
+    process pool. `workers=0` runs the model in the calling process instead.
+    """
+
+    def __init__(self, model_name: str = None, workers: int = None, batch_size: int = None):
+        self.model_name = model_name or current_config.LOCAL_EMBEDDING_MODEL
+        self.workers = current_config.LOCAL_EMBEDDING_WORKERS if workers is None else workers
+        self.batch_size = batch_size or current_config.LOCAL_EMBEDDING_BATCH_SIZE
+        self._executor = None
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.model_name,),
+            )
+        return self._executor
+
+    def __call__(self, input):
+        texts = list(input)
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if self.workers == 0:
+            if _worker_model is None:
+                _init_worker(self.model_name)
+            results = map(_embed_batch, batches)
+        else:
+            results = self._pool().map(_embed_batch, batches)
+        return [vector for batch in results for vector in batch]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @staticmethod
+    def name() -> str:
+        return "cleary-local"
+
+    def get_config(self):
+        return {"model_name": self.model_name, "workers": self.workers, "batch_size": self.batch_size}
+
+    @staticmethod
+    def build_from_config(config):
+        return LocalEmbeddingFunction(**config)
+
+
+# --- Provider selection ---
+
+class EmbeddingProvider:
+    """An embedding function plus the identity used to tag the collections it writes to."""
+
+    def __init__(self, provider: str, model: str, function, dimension: int = None):
+        self.provider = provider
+        self.model = model
+        self.function = function
+        self._dimension = dimension
+
+    @classmethod
+    def from_function(cls, function):
+        """Wrap an already-built embedding function (tests, benchmarks, custom providers)."""
+        name = function.name() if hasattr(function, "name") else type(function).__name__
+        return cls("custom", name or type(function).__name__, function, getattr(function, "dimension", None))
+
+    @property
+    def dimension(self) -> int:
+        if self._dimension is None:
+            self._dimension = len(self.function(["dimension probe"])[0])
+        return self._dimension
+
+    def collection_name(self, base: str = "documents", versioned: bool = False) -> str:
+        """
+        OpenAI keeps the original collection names; other providers get their own collections.
+        `versioned` names the collection after the model for every provider (re-embedding targets).
+        """
+        if self.provider == "openai" and not versioned:
+            return base
+        slug = re.sub(r"[^a-zA-Z0-9]+", "-", self.model).strip("-").lower()
+        return f"{base}_{self.provider}_{slug}"[:512]
+
+    def collection_metadata(self) -> dict:
+        return {
+            "embedding_provider": self.provider,
+            "embedding_model": self.model,
+            "embedding_dimension": self.dimension,
+        }
+
+    def check_collection(self, collection):
+        """Tag an untagged collection, or refuse one that was written by another provider."""
+        metadata = collection.metadata or {}
+        if "embedding_provider" not in metadata:
+            collection.modify(metadata={**metadata, **self.collection_metadata()})
+            return
+        expected = (self.provider, self.model, self.dimension)
+        found = (
+            metadata.get("embedding_provider"),
+            metadata.get("embedding_model"),
+            metadata.get("embedding_dimension"),
+        )
+        if found != expected:
+            raise EmbeddingProviderMismatch(
+                f"Collection '{collection.name}' holds {found[0]}/{found[1]} vectors "
+                f"({found[2]} dims) but the configured provider is {expected[0]}/{expected[1]} "
+                f"({expected[2]} dims). Re-embed the collection before switching providers."
+            )
+
+
+def get_embedding_provider(provider: str = None, model: str = None) -> EmbeddingProvider:
+    """Build the embedding provider selected by EMBEDDING_PROVIDER (or the arguments)."""
+    provider = (provider or current_config.EMBEDDING_PROVIDER).lower()
+    if provider == "openai":
+        model = model or current_config.OPENAI_EMBEDDING_MODEL
+        function = OpenAIEmbeddingFunction(model_name=model, api_key=current_config.OPENAI_API_KEY)
+        function.client = function.client.with_options(timeout=current_config.EMBEDDING_TIMEOUT_SECONDS)
+        return EmbeddingProvider("openai", model, function, OPENAI_DIMENSIONS.get(model))
+    if provider == "local":
+        model = model or current_config.LOCAL_EMBEDDING_MODEL
+        return EmbeddingProvider("local", model, LocalEmbeddingFunction(model_name=model))
+    raise ValueError(f"Unknown embedding provider '{provider}'. Use 'openai' or 'local'.")
@@ -0,0 +1,56 @@
+import csv
+import io
+import json
+import zlib
+
+EXPORT_FIELDS = ("id", "chatbot_id", "sender", "content", "created_at")
+
+
+def _record(row) -> dict:
+    message_id, chatbot_id, sender, content, created_at = row
+    return {
+        "id": message_id,
+        "chatbot_id": chatbot_id,
+        "sender": sender,
+        "content": content,
+        "created_at": created_at.isoformat() if created_at else None,
+    }
+
+
+def iter_ndjson(rows, flush_bytes: int = 64 * 1024):
+    """One JSON object per line, emitted in chunks of roughly flush_bytes."""
+    buffer, size = [], 0
+    for row in rows:
+        line = json.dumps(_record(row), ensure_ascii=False) + "\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= flush_bytes:
+            yield "".join(buffer).encode()
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer).encode()
+
+
+def iter_csv(rows, flush_bytes: int = 64 * 1024):
+    """CSV with a header row, emitted in chunks of roughly flush_bytes."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(_record(row))
+        if buffer.tell() >= flush_bytes:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def gzip_chunks(chunks, level: int = 6):
+    """Gzip a stream of byte chunks incrementally."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,72 @@
+import json
+from dataclasses import asdict, dataclass, replace
+
+from app.setting import current_config
+
+SPACES = ("l2", "cosine", "ip")
+
+
+@dataclass(frozen=True)
+class IndexSettings:
+    """
+    HNSW parameters and retrieval depth for one Chroma collection.
+
+    space, m and construction_ef are fixed when a collection is created;
+    search_ef and top_k can be changed at any time.
+    """
+    space: str = "l2"
+    m: int = 16
+    construction_ef: int = 100
+    search_ef: int = 100
+    top_k: int = 13
+
+    def __post_init__(self):
+        if self.space not in SPACES:
+            raise ValueError(f"HNSW space must be one of {SPACES}, got {self.space!r}")
+        for name in ("m", "construction_ef", "search_ef", "top_k"):
+            if getattr(self, name) <= 0:
+                raise ValueError(f"HNSW {name} must be positive")
+
+    @classmethod
+    def for_collection(cls, name: str) -> "IndexSettings":
+        """Defaults from the HNSW_* settings, overridden by HNSW_COLLECTION_SETTINGS[name]."""
+        settings = cls(
+            space=current_config.HNSW_SPACE,
+            m=current_config.HNSW_M,
+            construction_ef=current_config.HNSW_CONSTRUCTION_EF,
+            search_ef=current_config.HNSW_SEARCH_EF,
+            top_k=current_config.RETRIEVAL_TOP_K,
+        )
+        overrides = json.loads(current_config.HNSW_COLLECTION_SETTINGS or "{}").get(name, {})
+        unknown = set(overrides) - set(asdict(settings))
+        if unknown:
+            raise ValueError(f"Unknown HNSW settings for collection {name!r}: {sorted(unknown)}")
+        return replace(settings, **overrides)
+
+    def configuration(self) -> dict:
+        """Chroma collection configuration for creating a collection with these settings."""
+        return {
+            "hnsw": {
+                "space": self.space,
+                "max_neighbors": self.m,
+                "ef_construction": self.construction_ef,
+                "ef_search": self.search_ef,
+            }
+        }
+
+    def apply(self, collection):
+        """
+        Brings an existing collection's search_ef in line with these settings and
+        warns about build-time parameters that differ (those need a re-index).
+        An index already loaded by this process keeps its search_ef until restart.
+        """
+        hnsw = (collection.configuration or {}).get("hnsw") or {}
+        if not hnsw:
+            return
+        if hnsw.get("ef_search") != self.search_ef:
+            collection.modify(configuration={"hnsw": {"ef_search": self.search_ef}})
+        built = {"space": hnsw.get("space"), "m": hnsw.get("max_neighbors"), "construction_ef": hnsw.get("ef_construction")}
+        wanted = {"space": self.space, "m": self.m, "construction_ef": self.construction_ef}
+        if built != wanted:
+            print(f"[WARN] Collection '{collection.name}' was built with {built}, not {wanted}; "
+                  f"re-index it for those settings to take effect")
@@ -0,0 +1,98 @@
+"""
+Per-document ingestion progress.
+
+Chunks are written to the vector store in batches while the PDF is still
+being read, so a document is partly queryable long before it is finished.
+Progress (pages and chunks indexed, time to the first queryable chunk) is
+written to the document's row after a batch at most every
+INGEST_PROGRESS_INTERVAL_SECONDS, and always when ingestion ends.
+
+The documents of an upload are indexed in parallel on `ingestion_executor`,
+shared by every request so no more than INGEST_WORKERS run at once.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from app.db.session import SessionLocal
+from app.models.models import Document
+from app.setting import current_config
+from app.utils.metrics import metrics
+
+
+class IngestionProgress:
+    """Progress of one document; `update` is called after every committed batch."""
+
+    def __init__(self, tracker: "IngestionTracker", document_id: str):
+        self.tracker = tracker
+        self.document_id = document_id
+        self.started = time.monotonic()
+        self.first_chunk_seconds = None
+        self.pages_total = None
+        self.pages_indexed = 0
+        self._written_at = 0.0
+
+    def start(self, pages_total: int = None):
+        """Resets the counts; a page total that cannot be known up front is filled in by `finish`."""
+        self.pages_total = pages_total
+        values = {"pages_indexed": 0, "chunks_indexed": 0, "first_chunk_seconds": None, "indexed_at": None}
+        if pages_total is not None:
+            values["pages_total"] = pages_total
+        self._write(**values)
+
+    def update(self, pages_indexed: int, chunks_indexed: int):
+        self.pages_indexed = pages_indexed
+        values = {"pages_indexed": pages_indexed, "chunks_indexed": chunks_indexed}
+        if self.first_chunk_seconds is None:
+            # Always written at once: the document has just become queryable
+            self.first_chunk_seconds = time.monotonic() - self.started
+            metrics.incr("ingest_first_chunk_seconds_total", self.first_chunk_seconds)
+            metrics.incr("ingest_first_chunk_total")
+            values["first_chunk_seconds"] = round(self.first_chunk_seconds, 3)
+        elif time.monotonic() - self._written_at < self.tracker.interval:
+            return
+        self._write(**values)
+
+    def finish(self, chunks_indexed: int):
+        """Records the final counts; every page that was read is now indexed."""
+        pages = self.pages_total or self.pages_indexed
+        self._write(pages_total=pages, pages_indexed=pages, chunks_indexed=chunks_indexed,
+                    indexed_at=datetime.now(timezone.utc))
+        metrics.incr("ingest_documents_total")
+        metrics.incr("ingest_seconds_total", time.monotonic() - self.started)
+
+    def _write(self, **values):
+        self._written_at = time.monotonic()
+        try:
+            with self.tracker.session_factory() as db:
+                db.query(Document).filter(Document.id == self.document_id).update(values)
+                db.commit()
+        except Exception as e:  # progress is informational; never fail ingestion over it
+            print(f"[WARN] Could not record ingestion progress for {self.document_id}: {e}")
+
+
+class IngestionTracker:
+    def __init__(self, session_factory, interval: float):
+        self.session_factory = session_factory
+        self.interval = interval
+
+    def track(self, document_id: str) -> IngestionProgress:
+        return IngestionProgress(self, document_id)
+
+
+def progress_out(document: Document) -> dict:
+    total, indexed = document.pages_total, document.pages_indexed
+    return {
+        "document_id": document.id,
+        "status": document.status,
+        "pages_total": total,
+        "pages_indexed": indexed,
+        "chunks_indexed": document.chunks_indexed,
+        "percent": round(100 * min(indexed or 0, total) / total, 1) if total else None,
+        "first_chunk_seconds": document.first_chunk_seconds,
+        "indexed_at": document.indexed_at.isoformat() if document.indexed_at else None,
+    }
+
+
+ingestion_tracker = IngestionTracker(SessionLocal, current_config.INGEST_PROGRESS_INTERVAL_SECONDS)
+ingestion_executor = ThreadPoolExecutor(max_workers=current_config.INGEST_WORKERS, thread_name_prefix="ingest")
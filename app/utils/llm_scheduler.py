@@ -0,0 +1,355 @@
+import random
+import threading
+import time
+from collections import defaultdict, deque
+
+import openai
+
+from app.setting import current_config
+from app.utils.circuit_breaker import CircuitOpen, llm_breaker
+from app.utils.metrics import metrics
+from app.utils.rate_limit import worker_share
+
+LANES = ("interactive", "batch")
+# Transient upstream failures: retried with backoff, then sent to the fallback model.
+# openai.APITimeoutError is an APIConnectionError too, but ends the call (its deadline is spent)
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+
+
+class LLMTimeout(Exception):
+    """The call's deadline passed before the model answered."""
+
+
+class LLMQueueTimeout(LLMTimeout):
+    """The call waited too long for a free slot."""
+
+
+class LLMUnavailable(Exception):
+    """Retries of transient upstream errors and the fallback model were exhausted."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_weights(spec: str) -> dict:
+    """'tenant-a:3,tenant-b:2' -> {'tenant-a': 3.0, 'tenant-b': 2.0}"""
+    weights = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        tenant, _, weight = item.rpartition(":")
+        weights[tenant] = float(weight)
+    return weights
+
+
+class _Ticket:
+    __slots__ = ("tenant", "lane", "enqueued", "granted")
+
+    def __init__(self, tenant: str, lane: str):
+        self.tenant = tenant
+        self.lane = lane
+        self.enqueued = time.monotonic()
+        self.granted = False
+
+
+class LLMScheduler:
+    """
+    Orders LLM calls from this worker through a fixed number of slots.
+
+    Waiting calls are served interactive lane first, then batch. Inside a lane,
+    tenants are served by start-time fair queuing: each grant advances the
+    tenant's virtual time by 1/weight, and the tenant with the smallest virtual
+    time goes next. One busy tenant then gets its share without starving the
+    others. The calling thread runs the model once its ticket is granted.
+
+    With a `breaker`, each upstream attempt goes through it once the slot is
+    granted, so only the model's own latency and errors count towards opening
+    it; calls are rejected before queueing while it is open.
+    """
+
+    def __init__(self, slots: int, max_retries: int = 3, backoff_base: float = 0.5,
+                 backoff_max: float = 8.0, weights: dict = None, breaker=None):
+        self.slots = slots
+        self.breaker = breaker
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.weights = dict(weights or {})
+        self._cond = threading.Condition()
+        self._free = slots
+        self._queues = {lane: defaultdict(deque) for lane in LANES}
+        self._vtime = {}
+        self._clock = 0.0
+        self._stats = defaultdict(lambda: {
+            "calls": 0, "retries": 0, "fallbacks": 0, "timeouts": 0,
+            "queue_seconds": 0.0, "max_queue_seconds": 0.0, "service_seconds": 0.0,
+        })
+        self._stats_lock = threading.Lock()
+
+    # --- Slots ---
+
+    def _next_ticket(self):
+        for lane in LANES:
+            queues = self._queues[lane]
+            if not queues:
+                continue
+            tenant = min(
+                queues,
+                key=lambda t: (max(self._clock, self._vtime.get(t, 0.0)), queues[t][0].enqueued),
+            )
+            ticket = queues[tenant].popleft()
+            if not queues[tenant]:
+                del queues[tenant]
+            return ticket
+        return None
+
+    def _dispatch(self):
+        granted = False
+        while self._free > 0:
+            ticket = self._next_ticket()
+            if ticket is None:
+                break
+            start = max(self._clock, self._vtime.get(ticket.tenant, 0.0))
+            self._vtime[ticket.tenant] = start + 1.0 / self.weights.get(ticket.tenant, 1.0)
+            self._clock = start
+            ticket.granted = True
+            self._free -= 1
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def acquire(self, tenant: str, lane: str = "interactive", wait_until: float = None) -> float:
+        """Blocks until a slot is granted; returns the seconds spent queued."""
+        if lane not in LANES:
+            raise ValueError(f"Unknown priority lane {lane!r}, expected one of {LANES}")
+        ticket = _Ticket(tenant, lane)
+        with self._cond:
+            self._queues[lane][tenant].append(ticket)
+            self._dispatch()
+            while not ticket.granted:
+                remaining = None if wait_until is None else wait_until - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    queue = self._queues[lane].get(tenant)
+                    if queue is not None and ticket in queue:
+                        queue.remove(ticket)
+                        if not queue:
+                            del self._queues[lane][tenant]
+                    raise LLMQueueTimeout(f"No LLM slot within the deadline for tenant {tenant}")
+                self._cond.wait(remaining)
+        return time.monotonic() - ticket.enqueued
+
+    def release(self):
+        with self._cond:
+            self._free += 1
+            self._dispatch()
+
+    def queued(self, lane: str = None) -> int:
+        with self._cond:
+            lanes = [lane] if lane else LANES
+            return sum(len(q) for name in lanes for q in self._queues[name].values())
+
+    # --- Calls ---
+
+    def _backoff(self, attempt: int, error) -> float:
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get("retry-after"))
+            except (TypeError, ValueError):
+                retry_after = None
+        delay = retry_after if retry_after is not None else self.backoff_base * (2 ** attempt)
+        # Full jitter keeps retrying workers from synchronising
+        return random.uniform(0, min(self.backoff_max, delay))
+
+    def _unavailable(self, error) -> tuple:
+        """The outcome label and LLMUnavailable for a call whose retries and fallbacks all failed."""
+        if isinstance(error, openai.RateLimitError):
+            return "rate_limited", LLMUnavailable("The language model is rate limited, please retry shortly.",
+                                                  retry_after=self.backoff_max)
+        return "upstream_error", LLMUnavailable("The language model is unavailable, please retry shortly.",
+                                                retry_after=self.backoff_max)
+
+    def _attempts(self, models: list) -> list:
+        """(model, attempt) pairs: the primary model with its retries, then each fallback once."""
+        attempts = [(models[0], attempt) for attempt in range(self.max_retries + 1)]
+        return attempts + [(model, 0) for model in models[1:]]
+
+    def _admit(self, tenant: str, priority: str, deadline: float, queue_timeout: float) -> float:
+        """Waits for a slot until the deadline or the queue timeout; returns the seconds spent queued."""
+        if self.breaker is not None:
+            try:
+                self.breaker.reject_if_open()  # rather than queue for a call that would be rejected
+            except CircuitOpen:
+                metrics.incr("llm_calls_total", lane=priority, outcome="circuit_open")
+                raise
+        queue_timeout = current_config.LLM_QUEUE_TIMEOUT_SECONDS if queue_timeout is None else queue_timeout
+        try:
+            return self.acquire(tenant, priority, min(deadline, time.monotonic() + queue_timeout))
+        except LLMTimeout:
+            self._record(tenant, timeouts=1)
+            metrics.incr("llm_calls_total", lane=priority, outcome="queue_timeout")
+            raise
+
+    def invoke(self, models: list, messages, tenant: str, priority: str = "interactive",
+               timeout: float = None, queue_timeout: float = None):
+        """
+        Runs `messages` on models[0], retrying rate-limit, server and connection
+        errors with exponential backoff, then once on each fallback model. The whole call, queueing
+        included, must finish within `timeout` seconds.
+        """
+        timeout = current_config.LLM_TIMEOUT_SECONDS if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        queued = self._admit(tenant, priority, deadline, queue_timeout)
+
+        started = time.monotonic()
+        outcome = "error"
+        try:
+            attempts = self._attempts(models)
+            last_error = None
+            for index, (model, attempt) in enumerate(attempts):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                if index > self.max_retries:
+                    self._record(tenant, fallbacks=1)
+                elif index > 0:
+                    self._record(tenant, retries=1)
+                try:
+                    if self.breaker is not None:
+                        response = self.breaker.call(model.invoke, messages, timeout=remaining)
+                    else:
+                        response = model.invoke(messages, timeout=remaining)
+                    outcome = "ok" if index <= self.max_retries else "fallback"
+                    return response
+                except openai.APITimeoutError as e:
+                    last_error = e
+                    break
+                except RETRYABLE_ERRORS as e:
+                    last_error = e
+                    if index < self.max_retries:
+                        # The slot is kept while backing off so retries do not add load upstream
+                        time.sleep(min(self._backoff(attempt, e), max(0.0, deadline - time.monotonic())))
+
+            if time.monotonic() >= deadline or isinstance(last_error, openai.APITimeoutError):
+                outcome = "timeout"
+                self._record(tenant, timeouts=1)
+                raise LLMTimeout(f"LLM call for tenant {tenant} exceeded its {timeout:.0f}s deadline")
+            outcome, error = self._unavailable(last_error)
+            raise error
+        except CircuitOpen:
+            outcome = "circuit_open"  # opened by an earlier attempt of this call
+            raise
+        finally:
+            self.release()
+            self._record(tenant, calls=1, queue_seconds=queued, service_seconds=time.monotonic() - started)
+            metrics.incr("llm_calls_total", lane=priority, outcome=outcome)
+
+    def stream(self, models: list, messages, tenant: str, priority: str = "interactive",
+               timeout: float = None, queue_timeout: float = None):
+        """
+        Like `invoke`, but yields the answer's chunks as the model produces them. Retries
+        and fallbacks only happen before the first chunk; once text has been sent it cannot
+        be taken back. The slot is held until the stream ends or is closed.
+        """
+        timeout = current_config.LLM_TIMEOUT_SECONDS if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        queued = self._admit(tenant, priority, deadline, queue_timeout)
+
+        started = time.monotonic()
+        outcome = "error"
+        streamed = False
+        try:
+            last_error = None
+            for index, (model, attempt) in enumerate(self._attempts(models)):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                if index > self.max_retries:
+                    self._record(tenant, fallbacks=1)
+                elif index > 0:
+                    self._record(tenant, retries=1)
+                chunks = (
+                    self.breaker.iterate(model.stream, messages, timeout=remaining) if self.breaker is not None
+                    else model.stream(messages, timeout=remaining)
+                )
+                try:
+                    for chunk in chunks:
+                        streamed = True
+                        yield chunk
+                        if time.monotonic() >= deadline:
+                            outcome = "timeout"
+                            self._record(tenant, timeouts=1)
+                            raise LLMTimeout(f"LLM stream for tenant {tenant} exceeded its {timeout:.0f}s deadline")
+                    outcome = "ok" if index <= self.max_retries else "fallback"
+                    return
+                except openai.APITimeoutError as e:
+                    if streamed:
+                        raise
+                    last_error = e
+                    break
+                except RETRYABLE_ERRORS as e:
+                    if streamed:
+                        raise
+                    last_error = e
+                    if index < self.max_retries:
+                        time.sleep(min(self._backoff(attempt, e), max(0.0, deadline - time.monotonic())))
+
+            if time.monotonic() >= deadline or isinstance(last_error, openai.APITimeoutError):
+                outcome = "timeout"
+                self._record(tenant, timeouts=1)
+                raise LLMTimeout(f"LLM stream for tenant {tenant} exceeded its {timeout:.0f}s deadline")
+            outcome, error = self._unavailable(last_error)
+            raise error
+        except CircuitOpen:
+            outcome = "circuit_open"
+            raise
+        except GeneratorExit:
+            outcome = "closed"  # the consumer stopped reading, e.g. a disconnected client
+            raise
+        finally:
+            self.release()
+            self._record(tenant, calls=1, queue_seconds=queued, service_seconds=time.monotonic() - started)
+            metrics.incr("llm_calls_total", lane=priority, outcome=outcome)
+
+    # --- Statistics ---
+
+    def _record(self, tenant: str, **values):
+        with self._stats_lock:
+            stats = self._stats[tenant]
+            for name, value in values.items():
+                stats[name] += value
+            if "queue_seconds" in values:
+                stats["max_queue_seconds"] = max(stats["max_queue_seconds"], values["queue_seconds"])
+
+    def stats(self) -> dict:
+        """Per-tenant counts plus mean queue and service time, for /metrics."""
+        with self._stats_lock:
+            tenants = {}
+            for tenant, stats in self._stats.items():
+                calls = stats["calls"] or 1
+                tenants[tenant] = {
+                    **stats,
+                    "mean_queue_seconds": stats["queue_seconds"] / calls,
+                    "mean_service_seconds": stats["service_seconds"] / calls,
+                }
+        return {
+            "slots": self.slots,
+            "busy": self.slots - self._free,
+            "queued": {lane: self.queued(lane) for lane in LANES},
+            "tenants": tenants,
+        }
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats.clear()
+
+
+llm_scheduler = LLMScheduler(
+    slots=worker_share(current_config.LLM_MAX_CONCURRENCY),
+    max_retries=current_config.LLM_MAX_RETRIES,
+    backoff_base=current_config.LLM_BACKOFF_BASE_SECONDS,
+    backoff_max=current_config.LLM_BACKOFF_MAX_SECONDS,
+    weights=parse_weights(current_config.LLM_TENANT_WEIGHTS),
+    breaker=llm_breaker,
+)
+metrics.register_collector("llm_scheduler", llm_scheduler.stats)
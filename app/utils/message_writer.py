@@ -0,0 +1,56 @@
+"""
+Chat messages saved off the request path.
+
+WebSocket chat hands each exchange to the writer once its answer has been
+sent. A single thread saves them in the order they were submitted, each with
+a session of its own, so a save never shares a session with the connection
+and is not lost when the connection goes away mid-save.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.db.session import SessionLocal
+from app.utils.metrics import metrics
+
+
+class MessageWriter:
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="message-writer")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._last = None
+
+    def submit(self, write, *args):
+        """Runs `write(*args, db)` after every write submitted before it."""
+        with self._lock:
+            self._pending += 1
+            self._last = self._executor.submit(self._run, write, args)
+
+    def _run(self, write, args):
+        try:
+            with self.session_factory() as db:
+                try:
+                    write(*args, db)
+                except Exception as e:
+                    db.rollback()
+                    metrics.incr("message_writes_failed_total")
+                    print(f"[ERROR] Could not save chat messages: {e}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def flush(self, timeout: float = None):
+        """Waits until every write submitted so far has run."""
+        with self._lock:
+            last = self._last
+        if last is not None:
+            last.result(timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"pending": self._pending}
+
+
+message_writer = MessageWriter(SessionLocal)
+metrics.register_collector("message_writer", message_writer.stats)
@@ -0,0 +1,55 @@
+import threading
+from collections import defaultdict
+
+
+def _key(name: str, labels: dict) -> str:
+    if not labels:
+        return name
+    rendered = ",".join(f'{label}="{value}"' for label, value in sorted(labels.items()))
+    return f"{name}{{{rendered}}}"
+
+
+class Metrics:
+    """
+    Process-local counters and gauges, served as JSON at /metrics.
+
+    Components that keep their own statistics register a collector, a callable
+    returning a dict that is merged into the snapshot under its name.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._collectors = {}
+
+    def incr(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            self._counters[_key(name, labels)] += value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def get(self, name: str, **labels) -> float:
+        key = _key(name, labels)
+        with self._lock:
+            return self._counters.get(key, self._gauges.get(key, 0))
+
+    def register_collector(self, name: str, collector):
+        self._collectors[name] = collector
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            data = {"counters": dict(self._counters), "gauges": dict(self._gauges)}
+        for name, collector in self._collectors.items():
+            data[name] = collector()
+        return data
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+
+
+metrics = Metrics()
@@ -1,127 +1,349 @@
 import chromadb
-from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
+import pypdf
 from app.setting import current_config
 from concurrent.futures import ThreadPoolExecutor
 from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_openai import ChatOpenAI
 from app.utils.system_prompt import system_prompt
+from app.utils.chunking import StructuredChunker
+from app.utils.embeddings import EmbeddingProvider, get_embedding_provider
+from app.utils.vector_index import CompactIndexCache, CompactVectorIndex, UnsupportedFilter
+from app.utils.index_settings import IndexSettings
+from app.utils.llm_scheduler import llm_scheduler
+from app.utils.circuit_breaker import embedding_batch_breaker, embedding_breaker
+from app.utils.embedding_batcher import EmbeddingBatcher
+from app.utils.storage import DiskCache, DocumentStore, ExtractedTextCache, LocalBackend, S3Backend, sha256_file
+from app.utils.metrics import metrics
+from app.utils.usage import usage_meter
+from app.utils.reembed import embedding_router
+from app.utils.ingestion import IngestionTracker, ingestion_tracker
 
 import boto3
-import io
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config as BotoConfig
 import os
+import time
+from itertools import islice
 from uuid import uuid4
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 
 class HandleChromadb:
-    def __init__(self):
-        self.client = chromadb.PersistentClient(path="chroma_db")
-        self.embedings_function = OpenAIEmbeddingFunction(
-            model_name=current_config.OPENAI_EMBEDDING_MODEL,
-            api_key=current_config.OPENAI_API_KEY
+    def __init__(self, client=None, embedding_function=None, router=None):
+        self.client = client or chromadb.PersistentClient(path="chroma_db")
+        if embedding_function is None:
+            self.embedding_provider = get_embedding_provider()
+        else:
+            self.embedding_provider = EmbeddingProvider.from_function(embedding_function)
+        self.embedings_function = self.embedding_provider.function
+        self.query_embedder = EmbeddingBatcher(
+            self.embedings_function,
+            window_ms=current_config.EMBEDDING_BATCH_WINDOW_MS,
+            max_size=current_config.EMBEDDING_BATCH_MAX_SIZE,
+            concurrency=current_config.EMBEDDING_BATCH_CONCURRENCY,
         )
+        # Retries are handled by the scheduler, so the client itself does not retry
         self.llm = ChatOpenAI(
-            model="gpt-4o",
+            model=current_config.LLM_MODEL,
             temperature=0,
-            max_tokens=None
+            max_tokens=None,
+            max_retries=0,
+            stream_usage=True,
             )
+        self.fallback_llms = [
+            ChatOpenAI(model=current_config.LLM_FALLBACK_MODEL, temperature=0, max_tokens=None, max_retries=0,
+                       stream_usage=True)
+        ] if current_config.LLM_FALLBACK_MODEL else []
         self.system_prompt = system_prompt
-        self.collection_name = "documents"
+        # Embedding calls fail fast while the service is unhealthy; the scheduler guards the LLM
+        self.embedding_breaker = embedding_breaker
+        self.embedding_batch_breaker = embedding_batch_breaker
+        self.collection_name = self.embedding_provider.collection_name("documents")
+        self.index_settings = IndexSettings.for_collection(self.collection_name)
+        self._tuned_collections = set()
+        self.vector_storage_mode = current_config.VECTOR_STORAGE_MODE
+        self.compact_indexes = (
+            CompactIndexCache(self.vector_storage_mode) if self.vector_storage_mode != "float32" else None
+        )
+        # Tenants being re-embedded may be routed to another collection and embedding model
+        self.router = router
+        self._providers = {}
     
     
-    def get_or_create_collection(self):
-        """Create a new collection in the ChromaDB."""
+    def register_provider(self, provider: EmbeddingProvider):
+        """Make an embedding provider available to tenants routed to its collections."""
+        embedder = EmbeddingBatcher(
+            provider.function,
+            window_ms=current_config.EMBEDDING_BATCH_WINDOW_MS,
+            max_size=current_config.EMBEDDING_BATCH_MAX_SIZE,
+            concurrency=current_config.EMBEDDING_BATCH_CONCURRENCY,
+        )
+        self._providers[(provider.provider, provider.model)] = (provider, embedder)
+
+
+    def resolve(self, tenant: str = None):
+        """The collection name, embedding provider and query embedder serving a tenant."""
+        route = self.router.resolve(tenant) if self.router is not None and tenant else None
+        if route is None:
+            return self.collection_name, self.embedding_provider, self.query_embedder
+        key = (route.provider, route.model)
+        if key == (self.embedding_provider.provider, self.embedding_provider.model):
+            return route.collection_name, self.embedding_provider, self.query_embedder
+        if key not in self._providers:
+            self.register_provider(get_embedding_provider(*key))
+        provider, embedder = self._providers[key]
+        return route.collection_name, provider, embedder
+
+
+    def settings_for(self, name: str) -> IndexSettings:
+        return self.index_settings if name == self.collection_name else IndexSettings.for_collection(name)
+
+
+    def get_or_create_collection(self, name: str = None, provider: EmbeddingProvider = None):
+        """Create a new collection in the ChromaDB, tagged with the embedding provider."""
+        name = name or self.collection_name
+        provider = provider or self.embedding_provider
+        settings = self.settings_for(name)
         collection = self.client.get_or_create_collection(
-            name=self.collection_name,
-            embedding_function=self.embedings_function
+            name=name,
+            embedding_function=provider.function,
+            metadata=provider.collection_metadata(),
+            configuration=settings.configuration(),
         )
+        provider.check_collection(collection)
+        self.tune_collection(collection, settings)
         print(f"New collection created: {collection.name}")
         return collection
 
 
-    def save_vector(self, vector: list, metadata: dict):
-        """Save a vector to a specific collection."""
-        print(f"Saving vector to collection: {self.collection_name}")
+    def save_vector(self, vector: list, metadata: dict, metadatas: list = None, replace: bool = False,
+                    start: int = 0):
+        """Save a vector to a specific collection.
 
-        collection = self.client.get_or_create_collection(
-            name=self.collection_name,
-            embedding_function=self.embedings_function
-        )
+        `metadatas` optionally gives per-chunk metadata; otherwise `metadata` is shared by every chunk.
+        `start` is the index of the first chunk, for documents saved in several batches.
+        `replace` overwrites the document's earlier chunks with the same indexes.
+        """
+        metadata = metadata or {}
+        collection_name, provider, _ = self.resolve(metadata.get("user_id"))
+        print(f"Saving vector to collection: {collection_name}")
+
+        collection = self.get_or_create_collection(collection_name, provider)
         
         documents = vector
-        metadatas = [metadata] * len(documents)
-        ids = [metadata.get("id", "default_id") + f"_{i}" for i in range(len(documents))]
+        metadatas = metadatas or [metadata] * len(documents)
+        ids = [metadata.get("id", "default_id") + f"_{start + i}" for i in range(len(documents))]
+        embeddings = self.embedding_batch_breaker.call(provider.function, documents)
+        if replace:
+            collection.upsert(documents=documents, embeddings=embeddings, metadatas=metadatas, ids=ids)
+            self.vectors_written(collection_name, ids, embeddings, documents, metadatas)
+            print(f"Vectors replaced in collection {collection_name}.")
+            return
         collection.add(
             documents=documents,
+            embeddings=embeddings,
             metadatas=metadatas,
             ids=ids
         )
-        print(f"Vector added to collection {self.collection_name}.")
+        self.vectors_written(collection_name, ids, embeddings, documents, metadatas)
+        print(f"Vector added to collection {collection_name}.")
+
+    def vectors_written(self, collection_name: str, ids: list, embeddings, documents: list, metadatas: list):
+        """Log chunks written to Chroma for every worker's compact index (compact storage modes only)."""
+        if self.compact_indexes is not None:
+            self.compact_indexes.added(collection_name, ids, embeddings, documents, metadatas)
+
+    def vectors_deleted(self, collection_name: str, ids: list = None, where: dict = None):
+        """Log chunks deleted from Chroma for every worker's compact index (compact storage modes only)."""
+        if self.compact_indexes is not None:
+            self.compact_indexes.deleted(collection_name, ids, where)
+
+    def delete_chunks_from(self, metadata: dict, chunk_index: int):
+        """Delete a document's chunks from `chunk_index` on, left over from a longer earlier version."""
+        collection_name, provider, _ = self.resolve(metadata.get("user_id"))
+        collection = self.get_or_create_collection(collection_name, provider)
+        where = {"$and": [{"id": metadata.get("id")}, {"chunk_index": {"$gte": chunk_index}}]}
+        collection.delete(where=where)
+        self.vectors_deleted(collection_name, where=where)
+
+    def tune_collection(self, collection, settings: IndexSettings = None):
+        """Apply the configured search settings to a collection once per process."""
+        if collection.name in self._tuned_collections:
+            return
+        (settings or self.settings_for(collection.name)).apply(collection)
+        self._tuned_collections.add(collection.name)
 
     def list_collections(self):
         """List all collections in the ChromaDB."""
         return self.client.list_collections()
     
     
-    def query_collection(self, query: str, filter: dict = None):
-        """Query a specific collection."""
-        collection = self.client.get_collection(name=self.collection_name, embedding_function=self.embedings_function)
+    def query_collection(self, query: str, filter: dict = None, tenant: str = None, timeout: float = None,
+                         query_vector=None):
+        """
+        Query the collection serving `tenant` (the configured one by default).
+        `query_vector` is the query already embedded with the tenant's query embedder, e.g. by an answer
+        bank lookup; otherwise the query is embedded here.
+        Raises TimeoutError if the query's embedding takes longer than `timeout` seconds.
+        """
+        collection_name, provider, query_embedder = self.resolve(tenant)
+        collection = self.client.get_collection(name=collection_name, embedding_function=provider.function)
+        provider.check_collection(collection)
+        settings = self.settings_for(collection_name)
+        self.tune_collection(collection, settings)
+        top_k = settings.top_k
+        if query_vector is None:
+            # Batched with the queries of other in-flight requests
+            query_vector = self.embedding_breaker.call(query_embedder.embed, query, timeout=timeout)
+        if self.compact_indexes is not None:
+            try:
+                return [self.query_compact_index(collection, query_vector, filter, n_results=top_k)]
+            except UnsupportedFilter as e:
+                print(f"[WARN] {e}; falling back to the Chroma index")
         results = collection.query(
-            query_texts=[query],
-            n_results=13,
+            query_embeddings=[query_vector],
+            n_results=top_k,
             where=filter,
             include=["documents", "metadatas"]
         )
         
         print(results['metadatas'])
         return results['documents']
+
+
+    def query_compact_index(self, collection, query_vector, filter: dict, n_results: int):
+        """
+        Scan the worker's quantized vectors, then re-score the best candidates at full precision.
+        Neither step reads Chroma, so this worker never loads Chroma's float32 index to answer queries.
+        """
+        index = self.compact_indexes.get(collection)
+        candidates = index.search(
+            query_vector, n_results * current_config.VECTOR_RESCORE_FACTOR, where=filter
+        )
+        if not candidates:
+            return []
+
+        ids = [vector_id for vector_id, _ in candidates]
+        vectors, documents = index.stored(ids)
+        ranked = CompactVectorIndex.rescore(query_vector, ids, vectors, n_results)
+        documents = dict(zip(ids, documents))
+        return [documents[vector_id] for vector_id, _ in ranked]
         
     
-    def get_ai_response(self, query: str, context: str, message_history: list = None):
-        """Get AI response for a query."""""
-        
-        def format_message_history(message_history):
-            formatted = []
-            for msg in message_history or []:
-                if msg["role"] == "user":
-                    formatted.append(HumanMessage(content=msg["content"]))
-                elif msg["role"] == "assistant":
-                    formatted.append(AIMessage(content=msg["content"]))
-                elif msg["role"] == "system":
-                    formatted.append(SystemMessage(content=msg["content"]))
-            return formatted
-
-        messages = [
+    def get_ai_response(self, query: str, context: str, message_history: list = None,
+                        tenant: str = "default", priority: str = "interactive", chatbot_id: str = None,
+                        timeout: float = None):
+        """
+        Get AI response for a query, scheduled fairly against other tenants' calls and metered to the tenant.
+        `timeout` caps the call below LLM_TIMEOUT_SECONDS, e.g. to what is left of a request's deadline.
+        """
+        messages = self.build_messages(query, context, message_history)
+        started = time.perf_counter()
+        if timeout is not None:
+            timeout = min(timeout, current_config.LLM_TIMEOUT_SECONDS)
+        response = llm_scheduler.invoke(
+            [self.llm, *self.fallback_llms], messages, tenant=tenant, priority=priority, timeout=timeout,
+        )
+        usage = getattr(response, "usage_metadata", None) or {}
+        usage_meter.record(
+            tenant, chatbot_id,
+            llm_calls=1,
+            llm_latency_ms=(time.perf_counter() - started) * 1000,
+            prompt_tokens=usage.get("input_tokens", 0),
+            completion_tokens=usage.get("output_tokens", 0),
+        )
+        return response.content.strip()
+
+
+    def stream_ai_response(self, query: str, context: str, message_history: list = None,
+                           tenant: str = "default", chatbot_id: str = None, timeout: float = None):
+        """Like get_ai_response, but yields the answer's text as the model generates it."""
+        messages = self.build_messages(query, context, message_history)
+        started = time.perf_counter()
+        if timeout is not None:
+            timeout = min(timeout, current_config.LLM_TIMEOUT_SECONDS)
+        response = None
+        try:
+            for chunk in llm_scheduler.stream([self.llm, *self.fallback_llms], messages, tenant=tenant, timeout=timeout):
+                response = chunk if response is None else response + chunk
+                if chunk.content:
+                    yield chunk.content
+        finally:
+            # Streams cut short (a client went away) are metered for what was generated
+            if response is not None:
+                usage = getattr(response, "usage_metadata", None) or {}
+                usage_meter.record(
+                    tenant, chatbot_id,
+                    llm_calls=1,
+                    llm_latency_ms=(time.perf_counter() - started) * 1000,
+                    prompt_tokens=usage.get("input_tokens", 0),
+                    completion_tokens=usage.get("output_tokens", 0),
+                )
+
+
+    def build_messages(self, query: str, context: str, message_history: list = None) -> list:
+        """The system prompt, the conversation so far, and the query with its retrieved context."""
+        history = []
+        for msg in message_history or []:
+            if msg["role"] == "user":
+                history.append(HumanMessage(content=msg["content"]))
+            elif msg["role"] == "assistant":
+                history.append(AIMessage(content=msg["content"]))
+            elif msg["role"] == "system":
+                history.append(SystemMessage(content=msg["content"]))
+        return [
             SystemMessage(content=self.system_prompt),
-            *format_message_history(message_history),
+            *history,
             HumanMessage(content=f"{query}\n\nContext:\n{context}")
         ]
 
-        response = self.llm.invoke(messages)
-        return response.content.strip()
-        
-        
+
 class AWSHelper:
     def __init__(self):
         self.s3_bucket_name = current_config.S3_BUCKET_NAME
         self.aws_region = current_config.AWS_REGION
-        self.s3_client = boto3.client("s3", region_name=self.aws_region)
-
-    def upload_file(self, file_stream, filename: str, content_type: str, user_id: str) -> str:
-        """Upload a file to S3 and return the file URL."""
-        unique_filename = f"{user_id}/{filename}"
-
-        # self.s3_client.upload_fileobj(
-        #     Fileobj=file_stream,
-        #     Bucket=self.s3_bucket_name,
-        #     Key=unique_filename,
-        #     ExtraArgs={
-        #         "ContentType": content_type,
-        #         "ACL": "public-read"
-        #     }
-        # )
-        file_url = f"https://{self.s3_bucket_name}.s3.{self.aws_region}.amazonaws.com/{unique_filename}"
-        return file_url
+        # Every upload worker can run S3_MAX_CONCURRENCY part uploads at once
+        self.s3_client = boto3.client(
+            "s3",
+            region_name=self.aws_region,
+            endpoint_url=current_config.S3_ENDPOINT_URL,
+            config=BotoConfig(max_pool_connections=current_config.UPLOAD_WORKERS * current_config.S3_MAX_CONCURRENCY),
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=current_config.S3_MULTIPART_THRESHOLD_MB * 1024 * 1024,
+            multipart_chunksize=current_config.S3_MULTIPART_CHUNK_MB * 1024 * 1024,
+            max_concurrency=current_config.S3_MAX_CONCURRENCY,
+        )
+        # Long-lived and shared by all requests, so concurrent uploads stay bounded
+        self.executor = ThreadPoolExecutor(max_workers=current_config.UPLOAD_WORKERS, thread_name_prefix="upload")
+
+    def file_url(self, key: str) -> str:
+        return f"https://{self.s3_bucket_name}.s3.{self.aws_region}.amazonaws.com/{key}"
+
+    def presign_upload(self, key: str, content_type: str, max_bytes: int, expires_in: int) -> dict:
+        """Presigned POST that lets a browser upload one object of at most max_bytes straight to S3."""
+        return self.s3_client.generate_presigned_post(
+            Bucket=self.s3_bucket_name,
+            Key=key,
+            Fields={"Content-Type": content_type},
+            Conditions=[{"Content-Type": content_type}, ["content-length-range", 1, max_bytes]],
+            ExpiresIn=expires_in,
+        )
+
+    def head_object(self, key: str):
+        """Object metadata, or None when nothing has been uploaded under key."""
+        try:
+            return self.s3_client.head_object(Bucket=self.s3_bucket_name, Key=key)
+        except self.s3_client.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def read_head(self, key: str, length: int) -> bytes:
+        response = self.s3_client.get_object(Bucket=self.s3_bucket_name, Key=key, Range=f"bytes=0-{length - 1}")
+        return response["Body"].read()
+
+    def delete_object(self, key: str):
+        self.s3_client.delete_object(Bucket=self.s3_bucket_name, Key=key)
     
     def remove_user_documents(self, user_id: str):
         """Remove all documents for a user from the S3 bucket."""
@@ -142,60 +364,108 @@ class AWSHelper:
                     Delete={'Objects': keys_to_delete[i:i+1000]}
                 )
 
-    def save_to_local(self, file_stream, filename: str, user_id: str = None):
-        """Save a file locally."""
-        
-        # create a directory for the user if it doesn't exist
-        directory = str(user_id)
-        os.makedirs(directory, exist_ok=True)
-        
-        file_path = os.path.join(directory, filename)
-        
-        with open(file_path, 'wb') as f:
-            f.write(file_stream.read())
 
+class ProcessPdfDocument(HandleChromadb):
+    def __init__(self, client=None, embedding_function=None, document_store: DocumentStore = None, router=None,
+                 text_cache: ExtractedTextCache = None, progress: IngestionTracker = None):
+        super().__init__(client=client, embedding_function=embedding_function, router=router)
+        self.chunker = StructuredChunker()
+        self.document_store = document_store
+        self.text_cache = text_cache
+        self.progress = progress
+        self.batch_chunks = current_config.INGEST_BATCH_CHUNKS
 
-    def concurrent_upload(self, file_obj, filename: str, content_type: str, user_id: str):
-        """Upload a file to S3 and save it locally concurrently."""        
-        file_bytes = file_obj.read()
 
-        s3_stream = io.BytesIO(file_bytes)
-        local_stream = io.BytesIO(file_bytes)
+    def get_chunker(self, chunk_size: int = None, chunk_overlap: int = None):
+        """Return the default chunker, or one configured with a chatbot's token settings."""
+        if chunk_size is None and chunk_overlap is None:
+            return self.chunker
+        return StructuredChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
 
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            future_s3 = executor.submit(self.upload_file, s3_stream, filename, content_type, user_id)
-            future_local = executor.submit(self.save_to_local, local_stream, filename, user_id)
 
-            future_local.result()
-            return  future_s3.result()
+    def split_text_into_chunks(self, text: str, metadata: dict = None):
+        return self.split_pages_into_chunks([(1, text)], metadata)
 
-    
-class ProcessPdfDocument(HandleChromadb):
-    def __init__(self):
-        super().__init__()
-        self.splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
 
+    def split_pages_into_chunks(self, pages, metadata: dict = None, chunker: StructuredChunker = None,
+                                replace: bool = False, pages_total: int = None):
+        """
+        Chunk (page_number, text) pairs as one stream and save the chunks with their page ranges.
+        Chunks are embedded and saved every `batch_chunks`, so the first pages are queryable while
+        later ones are still being read, and only one batch is held in memory.
+        """
+        metadata = metadata or {}
+        progress = self.progress.track(metadata["id"]) if self.progress is not None and metadata.get("id") else None
+        if progress is not None:
+            progress.start(pages_total)
 
-    def split_text_into_chunks(self, text: str, metadata: dict = None):
-        
-        print(f"Splitting text into chunks for collection: {self.collection_name}")
-        chunks = self.splitter.split_text(text)
-        
-        self.get_or_create_collection()
-        
-        self.save_vector(
-            vector=chunks,
-            metadata=metadata
+        chunks = (chunker or self.chunker).chunk_pages(pages)
+        count = 0
+        while batch := list(islice(chunks, self.batch_chunks)):
+            self.save_vector(
+                vector=[chunk.text for chunk in batch],
+                metadata=metadata,
+                metadatas=[
+                    {**metadata, "chunk_index": count + i, "page_start": chunk.page_start, "page_end": chunk.page_end}
+                    for i, chunk in enumerate(batch)
+                ],
+                replace=replace,
+                start=count,
+            )
+            usage_meter.record(metadata.get("user_id"), embedding_tokens=sum(chunk.tokens for chunk in batch))
+            count += len(batch)
+            if progress is not None:
+                progress.update(batch[-1].page_end, count)
+
+        if replace:
+            self.delete_chunks_from(metadata, count)
+        if progress is not None:
+            progress.finish(count)
+        return count
+
+
+    @staticmethod
+    def count_pages(file_path: str):
+        """Number of pages in a PDF, read from its page tree without extracting any text."""
+        try:
+            return len(pypdf.PdfReader(file_path).pages)
+        except Exception as e:
+            print(f"[WARN] Could not count the pages of '{file_path}': {e}")
+            return None
+
+
+    @staticmethod
+    def parse_pdf(file_path: str):
+        # Stream pages from PyPDFLoader so text can flow across page breaks
+        loader = PyPDFLoader(file_path)
+        return (
+            (page.metadata.get("page", index) + 1, page.page_content)
+            for index, page in enumerate(loader.lazy_load())
         )
 
 
-    def load_pdf(self, file_path: str, metadata: dict = None):
+    def extract_pages(self, file_path: str, document_id: str = None):
+        """(page_number, text) pairs, read from the text cache if this exact file was parsed before."""
+        if self.text_cache is None or not document_id:
+            return self.parse_pdf(file_path)
+        content_hash = sha256_file(file_path)
+        cached = self.text_cache.pages(document_id, content_hash)
+        if cached is not None:
+            return cached
+        return self.text_cache.write_through(document_id, content_hash, self.parse_pdf(file_path))
+
+
+    def load_pdf(self, file_path: str, metadata: dict = None, chunk_size: int = None, chunk_overlap: int = None,
+                 cleanup: bool = True, replace: bool = False):
+        """Index a PDF; returns the number of chunks, or None if processing failed."""
         try:
-            # Load the PDF file using PyPDFLoader
-            loader = PyPDFLoader(file_path)
-            for page in loader.load():
-                print(page.page_content)
-                self.split_text_into_chunks(page.page_content, metadata)
+            pages = self.extract_pages(file_path, (metadata or {}).get("id"))
+            count = self.split_pages_into_chunks(
+                pages, metadata, self.get_chunker(chunk_size, chunk_overlap), replace=replace,
+                pages_total=self.count_pages(file_path) if self.progress is not None else None,
+            )
+            print(f"Indexed {count} chunks from {file_path}")
+            return count
                 
         except Exception as e:
             
@@ -204,21 +474,69 @@ class ProcessPdfDocument(HandleChromadb):
             
         finally:
             # Clean up the temporary file
-            if os.path.exists(file_path):
+            if cleanup and os.path.exists(file_path):
                 os.remove(file_path)
                 print(f"Removed temporary file: {file_path}")
     
     
-    def process_pdf(self, user_id: str, file_name, file_id):
+    def process_pdf(self, user_id: str, file_name, file_id, chunk_size: int = None, chunk_overlap: int = None,
+                    storage_key: str = None, replace: bool = False):
         str_user_id = str(user_id)
-        
-        self.load_pdf(
+        metadata = {"source": file_name, "user_id": str_user_id, "id": file_id}
+
+        if storage_key:
+            # Read through the local cache, so any node can (re-)process a stored document
+            try:
+                with self.document_store.local_path(storage_key) as file_path:
+                    return self.load_pdf(file_path, metadata, chunk_size, chunk_overlap, cleanup=False, replace=replace)
+            except Exception as e:
+                print(f"[ERROR] Failed to read stored document '{storage_key}': {e}")
+                return None
+
+        return self.load_pdf(
             file_path=os.path.join(str_user_id, file_name),
-            metadata={"source": file_name, "user_id": str_user_id, "id": file_id}
+            metadata=metadata,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            replace=replace,
         )
 
-precess_pdf = ProcessPdfDocument()
+
+    def reindex_document(self, user_id: str, file_name, file_id, chunk_size: int = None, chunk_overlap: int = None,
+                         storage_key: str = None):
+        """
+        Re-chunk and re-embed a document, replacing its chunks. Uses the cached page text,
+        so the PDF is only fetched and parsed when none is cached; returns the number of chunks,
+        or None if re-indexing failed.
+        """
+        pages = self.text_cache.pages(file_id) if self.text_cache is not None else None
+        if pages is None:
+            if not storage_key:
+                print(f"[ERROR] No cached text or stored file to re-index document {file_id}")
+                return None
+            return self.process_pdf(user_id, file_name, file_id, chunk_size, chunk_overlap, storage_key, replace=True)
+        metadata = {"source": file_name, "user_id": str(user_id), "id": file_id}
+        try:
+            return self.split_pages_into_chunks(
+                pages, metadata, self.get_chunker(chunk_size, chunk_overlap), replace=True
+            )
+        except Exception as e:
+            print(f"[ERROR] Failed to re-index document {file_id}: {e}")
+            return None
+
 save_pdf = AWSHelper()
+document_store = DocumentStore(
+    S3Backend(save_pdf.s3_client, save_pdf.s3_bucket_name, save_pdf.transfer_config, extra_args={"ACL": "public-read"})
+    if current_config.S3_UPLOADS_ENABLED else LocalBackend(current_config.LOCAL_STORAGE_DIR),
+    DiskCache(current_config.DOCUMENT_CACHE_DIR, current_config.DOCUMENT_CACHE_MAX_MB * 1024 * 1024),
+    executor=save_pdf.executor,
+)
+text_cache = ExtractedTextCache(current_config.TEXT_CACHE_DIR)
+metrics.register_collector("document_cache", document_store.cache.stats)
+metrics.register_collector("text_cache", text_cache.stats)
+precess_pdf = ProcessPdfDocument(
+    document_store=document_store, router=embedding_router, text_cache=text_cache, progress=ingestion_tracker
+)
 
 if __name__ == "__main__":
     
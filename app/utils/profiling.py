@@ -0,0 +1,241 @@
+"""
+On-demand profiling of single requests.
+
+A request is profiled when it carries `X-Profile: <PROFILING_TOKEN>`, or is
+picked by PROFILING_SAMPLE_RATE. While it runs, a sampler thread records the
+stacks of the event loop thread and of the threadpool workers (where the
+routes' SQLAlchemy, Chroma and OpenAI calls run) every PROFILING_INTERVAL_MS,
+keeping only stacks that pass through this application's code. Other requests
+served by the worker at the same time can show up too. Background tasks run
+before the request finishes, so their time is included.
+
+Profiles are saved as collapsed stacks ("folded" format, for speedscope or
+flamegraph.pl) in PROFILING_DIR, which keeps the last PROFILING_MAX_PROFILES.
+The response carries the profile's id in `X-Profile-Id`, and the profile can
+be downloaded from /profiles/{id}. With no token and a rate of 0 the middleware
+is not installed at all.
+"""
+import json
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+from app.setting import current_config
+from app.utils.metrics import metrics
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKER_THREAD_NAME = "AnyIO worker thread"
+_PROFILE_ID = re.compile(r"^[0-9]{20}-[0-9a-f]{12}$")
+
+
+class StackSampler:
+    """Counts the stacks of the given thread and the threadpool workers that are inside code under `root`."""
+
+    def __init__(self, loop_thread_id: int, interval: float, root: str = APP_DIR):
+        self.loop_thread_id = loop_thread_id
+        self.interval = interval
+        self.root = root
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            workers = {thread.ident for thread in threading.enumerate() if thread.name == WORKER_THREAD_NAME}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.loop_thread_id:
+                    label = "event-loop"
+                elif thread_id in workers:
+                    label = "worker"
+                else:
+                    continue
+                stack = self._stack(frame)
+                if stack is not None:
+                    self.stacks[(label, *stack)] += 1
+            self.samples += 1
+
+    def _stack(self, frame):
+        """Frames from the outermost in, or None when no frame is in this application (an idle thread)."""
+        stack, ours = [], False
+        while frame is not None:
+            code = frame.f_code
+            ours = ours or code.co_filename.startswith(self.root)
+            stack.append(f"{code.co_name} ({self._short_path(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return stack[::-1] if ours else None
+
+    @staticmethod
+    def _short_path(path: str) -> str:
+        marker = "site-packages" + os.sep
+        if marker in path:
+            return path.split(marker, 1)[1]
+        return os.path.relpath(path) if path.startswith(os.getcwd()) else path
+
+    def folded(self) -> str:
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfileStore:
+    """The newest `max_profiles` profiles on disk: `<id>.folded` plus `<id>.json` metadata."""
+
+    def __init__(self, directory: str, max_profiles: int):
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+
+    def new_id(self) -> str:
+        # Sortable by creation time, so the oldest are pruned first
+        return f"{datetime.now(timezone.utc):%Y%m%d%H%M%S%f}-{uuid.uuid4().hex[:12]}"
+
+    def save(self, profile_id: str, folded: str, meta: dict):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, f"{profile_id}.folded"), "w", encoding="utf-8") as f:
+                f.write(folded)
+            with open(os.path.join(self.directory, f"{profile_id}.json"), "w", encoding="utf-8") as f:
+                json.dump({"id": profile_id, **meta}, f)
+            for old in self._ids()[:-self.max_profiles]:
+                for ext in (".folded", ".json"):
+                    try:
+                        os.remove(os.path.join(self.directory, old + ext))
+                    except FileNotFoundError:
+                        pass
+
+    def _ids(self) -> list:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-5] for name in os.listdir(self.directory) if name.endswith(".json"))
+
+    def list(self) -> list:
+        profiles = []
+        for profile_id in reversed(self._ids()):
+            try:
+                with open(os.path.join(self.directory, f"{profile_id}.json"), encoding="utf-8") as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # pruned while listing
+        return profiles
+
+    def path(self, profile_id: str):
+        """The profile's folded stacks file, or None if it is unknown (or already pruned)."""
+        if not _PROFILE_ID.match(profile_id):
+            return None
+        path = os.path.join(self.directory, f"{profile_id}.folded")
+        return path if os.path.exists(path) else None
+
+
+class RequestProfiler:
+    def __init__(self, store: ProfileStore, token: str, sample_rate: float, interval_ms: float, root: str = APP_DIR):
+        self.store = store
+        self.token = token
+        self.sample_rate = sample_rate
+        self.interval = interval_ms / 1000
+        self.root = root
+        # One profile at a time per worker keeps the overhead bounded
+        self._busy = threading.Lock()
+        self.profiles = 0
+        self.skipped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.token) or self.sample_rate > 0
+
+    def authorized(self, token: str) -> bool:
+        return bool(self.token) and bool(token) and secrets.compare_digest(token.encode(), self.token.encode())
+
+    def wanted(self, scope: dict) -> bool:
+        if scope["path"].startswith("/profiles"):
+            return False
+        for name, value in scope["headers"]:
+            if name == b"x-profile":
+                return self.authorized(value.decode("latin-1"))
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def begin(self):
+        """Starts sampling the calling (event loop) thread and the workers; None if a profile is running."""
+        if not self._busy.acquire(blocking=False):
+            self.skipped += 1
+            return None
+        sampler = StackSampler(threading.get_ident(), self.interval, self.root)
+        sampler.start()
+        return sampler, self.store.new_id(), time.perf_counter(), time.process_time()
+
+    def end(self, session, scope: dict, status: int):
+        sampler, profile_id, started, cpu_started = session
+        try:
+            sampler.stop()
+            meta = {
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "wall_seconds": round(time.perf_counter() - started, 4),
+                "process_cpu_seconds": round(time.process_time() - cpu_started, 4),
+                "samples": sampler.samples,
+                "interval_ms": self.interval * 1000,
+            }
+            self.store.save(profile_id, sampler.folded(), meta)
+            self.profiles += 1
+            metrics.incr("profiles_total")
+        except Exception as e:
+            print(f"[WARN] Could not save profile {profile_id}: {e}")
+        finally:
+            self._busy.release()
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "sample_rate": self.sample_rate, "profiles": self.profiles,
+                "skipped_busy": self.skipped}
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling the requests `profiler.wanted` selects."""
+
+    def __init__(self, app, profiler: RequestProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.wanted(scope):
+            return await self.app(scope, receive, send)
+        session = self.profiler.begin()
+        if session is None:
+            return await self.app(scope, receive, send)
+
+        status = None
+
+        async def send_with_profile_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-profile-id", session[1].encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            self.profiler.end(session, scope, status)
+
+
+request_profiler = RequestProfiler(
+    ProfileStore(current_config.PROFILING_DIR, current_config.PROFILING_MAX_PROFILES),
+    current_config.PROFILING_TOKEN,
+    current_config.PROFILING_SAMPLE_RATE,
+    current_config.PROFILING_INTERVAL_MS,
+)
+metrics.register_collector("profiling", request_profiler.stats)
@@ -0,0 +1,280 @@
+import asyncio
+import ipaddress
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from fastapi import HTTPException, Request
+
+from app.models.models import ChatBot
+from app.setting import current_config
+from app.utils.cache import TTLCache
+from app.utils.metrics import metrics
+
+
+def too_many_requests(detail: str, retry_after: float, reason: str) -> HTTPException:
+    metrics.incr("chat_admission_total", result="rejected", reason=reason)
+    return HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+# --- Token buckets ---
+# Keys come from visitor traffic, so buckets are pruned every `prune_every` acquires once they have refilled:
+# a full bucket behaves exactly like a missing one.
+
+class MemoryBucketStore:
+    """Token buckets held in this process only (tests and single-worker runs)."""
+
+    def __init__(self, prune_every: int = None):
+        self.prune_every = prune_every or current_config.RATE_LIMIT_PRUNE_EVERY
+        self._buckets = {}
+        self._acquires = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, rate: float, capacity: float, cost: float = 1.0):
+        """Take `cost` tokens; returns (allowed, seconds until enough tokens are available)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            self._acquires += 1
+            if self._acquires % self.prune_every == 0:
+                self.prune(now)
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+    def prune(self, now: float = None):
+        """Drops the buckets that have refilled by `now`."""
+        now = time.monotonic() if now is None else now
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+
+
+class SqliteBucketStore:
+    """
+    Token buckets in a local SQLite file, so every uvicorn worker on the host
+    draws from the same buckets. Each acquire is one short IMMEDIATE transaction.
+    """
+
+    def __init__(self, path: str, prune_every: int = None):
+        self.path = path
+        self.prune_every = prune_every or current_config.RATE_LIMIT_PRUNE_EVERY
+        self._acquires = 0
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, "
+                "full_at REAL NOT NULL DEFAULT 0)"
+            )
+            if "full_at" not in {row[1] for row in conn.execute("PRAGMA table_info(buckets)")}:
+                # Files from before pruning; their buckets are reset to full by the first prune
+                conn.execute("ALTER TABLE buckets ADD COLUMN full_at REAL NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS buckets_full_at ON buckets (full_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=0.25, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def acquire(self, key: str, rate: float, capacity: float, cost: float = 1.0):
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute(
+                "INSERT INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated, "
+                "full_at = excluded.full_at",
+                (key, tokens, now, now + (capacity - tokens) / rate),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._acquires += 1
+        if self._acquires % self.prune_every == 0:
+            try:
+                self.prune(now)
+            except sqlite3.OperationalError as e:  # busy; the next prune catches up
+                print(f"[WARN] Could not prune rate limit buckets: {e}")
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+    def prune(self, now: float = None) -> int:
+        """Deletes the buckets that have refilled by `now`; returns how many."""
+        now = time.time() if now is None else now
+        return self._connect().execute("DELETE FROM buckets WHERE full_at <= ?", (now,)).rowcount
+
+
+def build_bucket_store():
+    if current_config.RATE_LIMIT_BACKEND == "memory":
+        return MemoryBucketStore()
+    return SqliteBucketStore(current_config.RATE_LIMIT_DB_PATH)
+
+
+# --- Concurrency gate for LLM calls ---
+
+class ConcurrencyGate:
+    """
+    Caps concurrent calls in this worker, with a bounded wait queue.
+    Callers beyond the queue, or waiting longer than `timeout`, are rejected.
+    """
+
+    def __init__(self, limit: int, max_waiting: int, timeout: float):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = None
+
+    def _sem(self):
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        return self._semaphore
+
+    async def __aenter__(self):
+        semaphore = self._sem()
+        if semaphore.locked():
+            if self.waiting >= self.max_waiting:
+                raise too_many_requests("The assistant is busy, please retry shortly.", 1, "queue_full")
+            self.waiting += 1
+            self._publish()
+            try:
+                await asyncio.wait_for(semaphore.acquire(), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                raise too_many_requests("The assistant is busy, please retry shortly.", 1, "queue_timeout")
+            finally:
+                self.waiting -= 1
+        else:
+            await semaphore.acquire()
+        self.in_flight += 1
+        self._publish()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.in_flight -= 1
+        self._sem().release()
+        self._publish()
+
+    def _publish(self):
+        metrics.set_gauge("llm_calls_in_flight", self.in_flight)
+        metrics.set_gauge("llm_calls_waiting", self.waiting)
+
+
+def worker_share(total: int) -> int:
+    """Per-worker part of a host-wide limit (WEB_CONCURRENCY is the uvicorn worker count)."""
+    workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+    return max(1, math.ceil(total / workers))
+
+
+# --- Chat admission ---
+
+def trusted_proxy(address: str) -> bool:
+    for proxy in current_config.TRUSTED_PROXIES:
+        if address == proxy:
+            return True
+        try:
+            if ipaddress.ip_address(address) in ipaddress.ip_network(proxy, strict=False):
+                return True
+        except ValueError:
+            continue
+    return False
+
+
+def visitor_key(request: Request) -> str:
+    """
+    The client's address. Behind a trusted proxy, the nearest address in X-Forwarded-For that is not
+    one of TRUSTED_PROXIES; anything further left was supplied by the client and cannot be trusted.
+    """
+    address = request.client.host if request.client else "unknown"
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded and trusted_proxy(address):
+        for hop in reversed(forwarded.split(",")):
+            address = hop.strip()
+            if not trusted_proxy(address):
+                break
+    return address
+
+
+class ChatRateLimiter:
+    """Per-chatbot and per-visitor token buckets for /chatbots/chat."""
+
+    def __init__(self, store=None):
+        self._store = store
+        self._limits = TTLCache(ttl=60, maxsize=20000)
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = build_bucket_store()
+        return self._store
+
+    def limits_for(self, chatbot_id: str, db) -> tuple:
+        limits = self._limits.get(chatbot_id)
+        if limits is None:
+            chatbot = db.query(ChatBot).filter(ChatBot.id == chatbot_id).first()
+            limits = (
+                (chatbot.rate_limit_per_minute if chatbot else None) or current_config.CHATBOT_RATE_LIMIT_PER_MINUTE,
+                (chatbot.visitor_rate_limit_per_minute if chatbot else None) or current_config.VISITOR_RATE_LIMIT_PER_MINUTE,
+            )
+            self._limits.set(chatbot_id, limits)
+        return limits
+
+    def invalidate(self, chatbot_id: str):
+        self._limits.invalidate(chatbot_id)
+
+    def _take(self, key: str, per_minute: int):
+        rate = per_minute / 60.0
+        capacity = max(1.0, rate * current_config.RATE_LIMIT_BURST_SECONDS)
+        try:
+            return self.store.acquire(key, rate, capacity)
+        except sqlite3.Error as e:
+            # Fail open: a locked or broken bucket file must not take chat down
+            print(f"[WARN] Rate limit store unavailable: {e}")
+            metrics.incr("chat_rate_limit_errors_total")
+            return True, 0.0
+
+    def check(self, request: Request, chatbot_id: str, db):
+        chatbot_limit, visitor_limit = self.limits_for(chatbot_id, db)
+
+        # Visitor first, so one noisy visitor cannot drain the chatbot's shared budget
+        allowed, retry_after = self._take(f"visitor:{chatbot_id}:{visitor_key(request)}", visitor_limit)
+        if not allowed:
+            raise too_many_requests("You are sending messages too quickly, please slow down.", retry_after, "visitor_rate")
+
+        allowed, retry_after = self._take(f"chatbot:{chatbot_id}", chatbot_limit)
+        if not allowed:
+            raise too_many_requests("This chatbot is receiving too many messages, please retry shortly.", retry_after, "chatbot_rate")
+
+        metrics.incr("chat_admission_total", result="admitted", reason="ok")
+
+
+chat_rate_limiter = ChatRateLimiter()
+# Bounds the calls admitted to the LLM stage (running plus queued); beyond that, reject at once.
+# Ordering within the stage is left to the fair scheduler in app.utils.llm_scheduler.
+llm_gate = ConcurrencyGate(
+    limit=worker_share(current_config.LLM_MAX_CONCURRENCY) + worker_share(current_config.LLM_MAX_QUEUE),
+    max_waiting=0,
+    timeout=current_config.LLM_QUEUE_TIMEOUT_SECONDS,
+)
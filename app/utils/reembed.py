@@ -0,0 +1,323 @@
+"""
+Online re-embedding into a new collection when the embedding model changes.
+
+Each tenant's chunks are copied from the collection that serves them into a
+shadow collection named after the new model, re-embedding the stored chunk
+text in throttled batches. Progress is checkpointed in embedding_migrations,
+so an interrupted run resumes where it stopped. Chat keeps using the old
+collection until the tenant is cut over: a reconcile pass copies chunks
+added or rewritten in the meantime (compared by a hash of their text and
+metadata), the tenant's row in embedding_routes is switched in
+one write, and a last pass after every worker has seen the new route picks up
+chunks that were still written to the old collection.
+
+    python -m app.utils.reembed run --model text-embedding-3-small [--tenant USER_ID]
+    python -m app.utils.reembed status
+    python -m app.utils.reembed finish --model text-embedding-3-small
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.models.models import Document, EmbeddingMigration, EmbeddingRoute
+from app.setting import current_config
+from app.utils.metrics import metrics
+
+DEFAULT_TENANT = "*"
+
+Route = namedtuple("Route", "collection_name provider model")
+
+
+class EmbeddingRouter:
+    """Per-tenant collection routes, re-read from the database at most every `ttl` seconds."""
+
+    def __init__(self, session_factory, ttl: float):
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self._routes = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def routes(self) -> dict:
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl:
+                try:
+                    with self.session_factory() as db:
+                        self._routes = {
+                            row.tenant: Route(row.collection_name, row.provider, row.model)
+                            for row in db.query(EmbeddingRoute)
+                        }
+                except Exception as e:  # keep serving the last known routes
+                    print(f"[WARN] Could not load embedding routes: {e}")
+                self._loaded_at = time.monotonic()
+            return self._routes
+
+    def resolve(self, tenant: str):
+        """The tenant's route, the default route, or None for the configured collection."""
+        routes = self.routes()
+        return routes.get(str(tenant)) or routes.get(DEFAULT_TENANT)
+
+    def set_route(self, db: Session, tenant: str, route: Route):
+        row = db.get(EmbeddingRoute, tenant)
+        if row is None:
+            db.add(EmbeddingRoute(tenant=tenant, **route._asdict()))
+        else:
+            row.collection_name, row.provider, row.model = route
+        db.commit()
+        self.invalidate()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+
+class EmbeddingMigrator:
+    """Copies tenants' chunks into `target`'s collection and cuts them over."""
+
+    def __init__(self, store, router: EmbeddingRouter, session_factory, target, batch_size: int = None,
+                 max_chunks_per_second: float = None, log=print):
+        self.store = store  # HandleChromadb
+        self.router = router
+        self.session_factory = session_factory
+        self.target = target  # EmbeddingProvider
+        self.target_collection = target.collection_name("documents", versioned=True)
+        self.batch_size = batch_size or current_config.REEMBED_BATCH_SIZE
+        self.max_chunks_per_second = (
+            current_config.REEMBED_MAX_CHUNKS_PER_SECOND if max_chunks_per_second is None else max_chunks_per_second
+        )
+        self.log = log
+        store.register_provider(target)
+
+    # --- Planning ---
+
+    def plan(self, db: Session, tenants: list = None) -> list:
+        """Creates a migration for each tenant that has none yet for this target; returns them all."""
+        if tenants is None:
+            tenants = sorted(str(user_id) for (user_id,) in db.query(Document.user_id).distinct())
+        migrations = []
+        for tenant in tenants:
+            migration = db.query(EmbeddingMigration).filter_by(
+                tenant=tenant, target_collection=self.target_collection
+            ).first()
+            if migration is None:
+                source, _, _ = self.store.resolve(tenant)
+                migration = EmbeddingMigration(
+                    tenant=tenant, source_collection=source, target_collection=self.target_collection,
+                    provider=self.target.provider, model=self.target.model,
+                )
+                if source == self.target_collection:
+                    migration.status = "switched"  # already served by the target
+                db.add(migration)
+            migrations.append(migration)
+        db.commit()
+        return migrations
+
+    # --- Copying ---
+
+    def _collections(self, migration: EmbeddingMigration):
+        source = self.store.client.get_collection(migration.source_collection, embedding_function=None)
+        target = self.store.get_or_create_collection(self.target_collection, self.target)
+        return source, target
+
+    def _ids(self, collection, tenant: str) -> set:
+        ids, offset = set(), 0
+        while True:
+            page = collection.get(where={"user_id": tenant}, include=[], limit=10000, offset=offset)["ids"]
+            ids.update(page)
+            if len(page) < 10000:
+                return ids
+            offset += len(page)
+
+    def _fingerprints(self, collection, tenant: str) -> dict:
+        """Chunk id -> hash of its text and metadata, so chunks rewritten in place are told apart."""
+        fingerprints, offset = {}, 0
+        while True:
+            page = collection.get(where={"user_id": tenant}, include=["documents", "metadatas"],
+                                  limit=10000, offset=offset)
+            for chunk_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                content = json.dumps([document, metadata], sort_keys=True, default=str)
+                fingerprints[chunk_id] = hashlib.sha256(content.encode()).hexdigest()
+            if len(page["ids"]) < 10000:
+                return fingerprints
+            offset += len(page["ids"])
+
+    def _write(self, target, page: dict):
+        embeddings = self.target.function(page["documents"])
+        target.upsert(ids=page["ids"], documents=page["documents"], metadatas=page["metadatas"], embeddings=embeddings)
+        self.store.vectors_written(target.name, page["ids"], embeddings, page["documents"], page["metadatas"])
+        metrics.incr("reembed_chunks_total", len(page["ids"]))
+
+    def copy(self, db: Session, migration: EmbeddingMigration):
+        """Re-embeds the tenant's chunks from the checkpoint on, throttled to max_chunks_per_second."""
+        source, target = self._collections(migration)
+        if migration.chunks_total is None:
+            migration.chunks_total = len(self._ids(source, migration.tenant))
+        migration.status = "copying"
+        db.commit()
+
+        started, copied = time.monotonic(), 0
+        while True:
+            batch_started = time.monotonic()
+            page = source.get(
+                where={"user_id": migration.tenant}, include=["documents", "metadatas"],
+                limit=self.batch_size, offset=migration.checkpoint,
+            )
+            if not page["ids"]:
+                break
+            # Upserts make a batch that was written but not checkpointed safe to repeat
+            self._write(target, page)
+            copied += len(page["ids"])
+            migration.checkpoint += len(page["ids"])
+            migration.chunks_done = min(migration.checkpoint, migration.chunks_total)
+            migration.copy_seconds += time.monotonic() - batch_started
+            db.commit()
+            self._report(migration, copied / max(time.monotonic() - started, 1e-9))
+            if self.max_chunks_per_second:
+                time.sleep(max(0.0, started + copied / self.max_chunks_per_second - time.monotonic()))
+
+        migration.status = "copied"
+        db.commit()
+
+    def reconcile(self, migration: EmbeddingMigration, delete_stale: bool) -> tuple:
+        """
+        Copies chunks missing from the target or rewritten in the source since they were copied;
+        before cutover also drops chunks gone from the source.
+        """
+        source, target = self._collections(migration)
+        source_chunks = self._fingerprints(source, migration.tenant)
+        target_chunks = self._fingerprints(target, migration.tenant)
+        missing = sorted(chunk_id for chunk_id, fingerprint in source_chunks.items()
+                         if target_chunks.get(chunk_id) != fingerprint)
+        for offset in range(0, len(missing), self.batch_size):
+            self._write(target, source.get(ids=missing[offset:offset + self.batch_size],
+                                           include=["documents", "metadatas"]))
+        stale = sorted(target_chunks.keys() - source_chunks.keys()) if delete_stale else []
+        if stale:
+            target.delete(ids=stale)
+            self.store.vectors_deleted(target.name, ids=stale)
+        return len(missing), len(stale)
+
+    # --- Cutover ---
+
+    def cutover(self, db: Session, migration: EmbeddingMigration, settle_seconds: float = None):
+        """Switches the tenant to the target collection, then copies chunks still written to the old one."""
+        copied, deleted = self.reconcile(migration, delete_stale=True)
+        self.router.set_route(db, migration.tenant, Route(self.target_collection, self.target.provider,
+                                                          self.target.model))
+        migration.status = "switched"
+        db.commit()
+        self.log(f"[{migration.tenant}] switched to {self.target_collection} "
+                 f"(reconciled +{copied}/-{deleted} chunks)")
+        # Other workers pick up the route within the router TTL
+        time.sleep(self.router.ttl if settle_seconds is None else settle_seconds)
+        late, _ = self.reconcile(migration, delete_stale=False)
+        if late:
+            self.log(f"[{migration.tenant}] copied {late} chunks written during the switch")
+
+    def run(self, tenants: list = None, cutover: bool = True, settle_seconds: float = None) -> list:
+        """Plans, copies and (optionally) cuts over every tenant; safe to re-run after an interruption."""
+        with self.session_factory() as db:
+            migrations = self.plan(db, tenants)
+            for migration in migrations:
+                if migration.status == "switched":
+                    continue
+                try:
+                    if migration.status in ("pending", "copying", "failed"):
+                        self.copy(db, migration)
+                    if cutover:
+                        self.cutover(db, migration, settle_seconds)
+                except Exception as e:
+                    db.rollback()
+                    migration.status, migration.error = "failed", str(e)
+                    db.commit()
+                    self.log(f"[{migration.tenant}] failed at chunk {migration.checkpoint}: {e}")
+            return [(m.tenant, m.status) for m in migrations]
+
+    def finish(self, db: Session):
+        """Routes tenants without a route of their own (new users) to the target collection."""
+        self.router.set_route(db, DEFAULT_TENANT, Route(self.target_collection, self.target.provider,
+                                                         self.target.model))
+
+    def _report(self, migration: EmbeddingMigration, rate: float):
+        remaining = max(migration.chunks_total - migration.chunks_done, 0)
+        eta = remaining / rate if rate else 0
+        self.log(f"[{migration.tenant}] {migration.chunks_done}/{migration.chunks_total} chunks, "
+                 f"{rate:.0f} chunks/s, ETA {eta:.0f}s")
+
+
+def migration_status(db: Session) -> list:
+    return [
+        {
+            "tenant": m.tenant,
+            "target_collection": m.target_collection,
+            "status": m.status,
+            "chunks_done": m.chunks_done,
+            "chunks_total": m.chunks_total,
+            "chunks_per_second": m.chunks_done / m.copy_seconds if m.copy_seconds else None,
+            "error": m.error,
+        }
+        for m in db.query(EmbeddingMigration).order_by(EmbeddingMigration.created_at, EmbeddingMigration.tenant)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-embed document chunks with a new embedding model")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("run", "copy (and cut over) tenants; resumes interrupted runs"),
+                            ("cutover", "switch tenants whose copy has finished"),
+                            ("finish", "route tenants without a route (new users) to the new collection")):
+        command = subcommands.add_parser(name, help=help_text)
+        command.add_argument("--provider", default=current_config.EMBEDDING_PROVIDER)
+        command.add_argument("--model", required=True)
+        command.add_argument("--tenant", action="append", help="user id (repeatable; default: every tenant)")
+    subcommands.choices["run"].add_argument("--batch-size", type=int)
+    subcommands.choices["run"].add_argument("--rate", type=float, help="max chunks per second (0: unthrottled)")
+    subcommands.choices["run"].add_argument("--no-cutover", action="store_true", help="copy only")
+    subcommands.add_parser("status", help="progress and throughput of every migration")
+    args = parser.parse_args()
+
+    from app.db.base import Base
+    from app.db.session import engine
+
+    Base.metadata.create_all(bind=engine)
+    if args.command == "status":
+        with SessionLocal() as db:
+            for row in migration_status(db):
+                rate = f"{row['chunks_per_second']:.0f}/s" if row["chunks_per_second"] else "-"
+                print(f"{row['tenant']:<38}{row['target_collection']:<48}{row['status']:<10}"
+                      f"{row['chunks_done']}/{row['chunks_total']} {rate} {row['error'] or ''}")
+        return
+
+    from app.utils.embeddings import get_embedding_provider
+    from app.utils.process_pdf import precess_pdf
+
+    migrator = EmbeddingMigrator(
+        precess_pdf, precess_pdf.router, SessionLocal, get_embedding_provider(args.provider, args.model),
+        batch_size=getattr(args, "batch_size", None), max_chunks_per_second=getattr(args, "rate", None),
+    )
+    if args.command == "run":
+        for tenant, status in migrator.run(args.tenant, cutover=not args.no_cutover):
+            print(f"{tenant}: {status}")
+    elif args.command == "cutover":
+        with SessionLocal() as db:
+            for migration in migrator.plan(db, args.tenant):
+                if migration.status == "copied":
+                    migrator.cutover(db, migration)
+    elif args.command == "finish":
+        with SessionLocal() as db:
+            migrator.finish(db)
+        print(f"New tenants now use {migrator.target_collection}; set the embedding model setting to "
+              f"{args.model} before restarting.")
+
+
+embedding_router = EmbeddingRouter(SessionLocal, current_config.EMBEDDING_ROUTE_TTL_SECONDS)
+
+
+if __name__ == "__main__":
+    main()
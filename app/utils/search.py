@@ -0,0 +1,220 @@
+"""
+Full-text search over chat messages.
+
+SQLite keeps an external-content FTS5 table, chat_messages_fts, in step with
+chat_messages through insert/update/delete triggers. Postgres keeps a generated
+tsvector column with a GIN index, so the database updates it on every write.
+Both are installed whenever chat_messages is created, and at startup for
+databases that predate them:
+
+    python -m app.utils.search rebuild   # re-index existing SQLite history
+"""
+import re
+from datetime import datetime
+
+from sqlalchemy import column, event, func, literal_column, select, table, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app.models.models import ChatMessage
+from app.setting import current_config
+from app.utils.analytics import utc_naive
+
+FTS_TABLE = "chat_messages_fts"
+
+SQLITE_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "text, content='chat_messages', content_rowid='rowid', tokenize='porter unicode61')",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON chat_messages BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.rowid, new.text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON chat_messages BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) VALUES ('delete', old.rowid, old.text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF text ON chat_messages BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) VALUES ('delete', old.rowid, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.rowid, new.text);
+    END""",
+]
+
+
+class SearchUnavailable(Exception):
+    """The database has no full-text index for chat messages."""
+
+
+def _language() -> str:
+    language = current_config.SEARCH_LANGUAGE
+    if not re.fullmatch(r"\w+", language):
+        raise ValueError(f"Invalid SEARCH_LANGUAGE {language!r}")
+    return language
+
+
+def _postgres_ddl() -> list:
+    return [
+        "ALTER TABLE chat_messages ADD COLUMN IF NOT EXISTS text_search tsvector "
+        f"GENERATED ALWAYS AS (to_tsvector('{_language()}'::regconfig, text)) STORED",
+        "CREATE INDEX IF NOT EXISTS ix_chat_messages_text_search ON chat_messages USING GIN (text_search)",
+    ]
+
+
+def install_search_index(connection):
+    """Creates the dialect's text index if it is missing; safe to run on every start."""
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        exists = connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+        ).first()
+        try:
+            for statement in SQLITE_DDL:
+                connection.exec_driver_sql(statement)
+        except OperationalError as e:  # SQLite built without FTS5
+            print(f"Full-text search disabled: {e}")
+            return
+        if not exists:
+            connection.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    elif dialect == "postgresql":
+        for statement in _postgres_ddl():
+            connection.exec_driver_sql(statement)
+
+
+def drop_search_index(connection):
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+@event.listens_for(ChatMessage.__table__, "after_create")
+def _after_create(target, connection, **kwargs):
+    install_search_index(connection)
+
+
+@event.listens_for(ChatMessage.__table__, "before_drop")
+def _before_drop(target, connection, **kwargs):
+    drop_search_index(connection)
+
+
+def rebuild_search_index(connection):
+    """Re-indexes every message; needed after a SQLite VACUUM, which may renumber rowids."""
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def fts5_query(query: str) -> str:
+    """User input as an FTS5 query: every word must match, the last one as a prefix."""
+    terms = re.findall(r"\w+", query)
+    if not terms:
+        return ""
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def _filters(user_id, chatbot_id: str, start: datetime, end: datetime) -> list:
+    filters = [ChatMessage.user_id == user_id]
+    if chatbot_id:
+        filters.append(ChatMessage.chatbot_id == chatbot_id)
+    if start:
+        filters.append(ChatMessage.created_at >= utc_naive(start))
+    if end:
+        filters.append(ChatMessage.created_at < utc_naive(end))
+    return filters
+
+
+def _sqlite_search(db: Session, query: str, filters: list, limit: int, offset: int):
+    match = fts5_query(query)
+    if not match:
+        return []
+    fts = table(FTS_TABLE, column("rowid"))
+    rank = literal_column(f"bm25({FTS_TABLE})")
+    statement = (
+        select(
+            ChatMessage.id, ChatMessage.chatbot_id, ChatMessage.sender, ChatMessage.created_at,
+            literal_column(f"snippet({FTS_TABLE}, 0, '<mark>', '</mark>', '…', 16)").label("snippet"),
+            (-rank).label("score"),
+        )
+        .select_from(fts.join(ChatMessage.__table__, literal_column("chat_messages.rowid") == fts.c.rowid))
+        .where(text(f"{FTS_TABLE} MATCH :match"), *filters)
+        .order_by(rank)
+        .limit(limit)
+        .offset(offset)
+    )
+    try:
+        return db.execute(statement, {"match": match}).all()
+    except OperationalError as e:
+        if "no such table" in str(e):
+            raise SearchUnavailable()
+        raise
+
+
+def _postgres_search(db: Session, query: str, filters: list, limit: int, offset: int):
+    tsquery = func.websearch_to_tsquery(literal_column(f"'{_language()}'::regconfig"), query)
+    document = literal_column("chat_messages.text_search")
+    page = (
+        select(
+            ChatMessage.id, ChatMessage.chatbot_id, ChatMessage.sender, ChatMessage.created_at,
+            ChatMessage.text, func.ts_rank_cd(document, tsquery).label("score"),
+        )
+        .where(document.op("@@")(tsquery), *filters)
+        .order_by(literal_column("score").desc())
+        .limit(limit)
+        .offset(offset)
+        .subquery()
+    )
+    # Highlight only the rows on this page
+    statement = select(
+        page.c.id, page.c.chatbot_id, page.c.sender, page.c.created_at,
+        func.ts_headline(
+            literal_column(f"'{_language()}'::regconfig"), page.c.text, tsquery,
+            "StartSel=<mark>, StopSel=</mark>, MaxFragments=1",
+        ).label("snippet"),
+        page.c.score,
+    ).order_by(page.c.score.desc())
+    return db.execute(statement).all()
+
+
+def search_messages(db: Session, user_id, query: str, chatbot_id: str = None, start: datetime = None,
+                    end: datetime = None, limit: int = 20, offset: int = 0) -> dict:
+    """Messages matching `query`, best match first, with a highlighted snippet."""
+    filters = _filters(user_id, chatbot_id, start, end)
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        rows = _sqlite_search(db, query, filters, limit + 1, offset)
+    elif dialect == "postgresql":
+        rows = _postgres_search(db, query, filters, limit + 1, offset)
+    else:
+        raise SearchUnavailable()
+    return {
+        "results": [
+            {
+                "id": row.id,
+                "chatbot_id": row.chatbot_id,
+                "sender": row.sender,
+                "created_at": row.created_at.isoformat() if row.created_at else None,
+                "snippet": row.snippet,
+                "score": row.score,
+            }
+            for row in rows[:limit]
+        ],
+        "limit": limit,
+        "offset": offset,
+        "has_more": len(rows) > limit,
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Chat message full-text index")
+    parser.add_argument("command", choices=["install", "rebuild"])
+    args = parser.parse_args()
+
+    from app.db.session import engine
+
+    with engine.begin() as connection:
+        install_search_index(connection)
+        if args.command == "rebuild":
+            rebuild_search_index(connection)
+    print(f"Search index {args.command} finished ({engine.dialect.name}).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import asyncio
+import re
+
+from starlette.concurrency import run_in_threadpool
+
+from app.utils.metrics import metrics
+
+
+def normalize_query(query: str) -> str:
+    """Case-fold, collapse whitespace and drop trailing punctuation so equivalent questions share a key."""
+    return re.sub(r"\s+", " ", query).strip().rstrip("?!. ").casefold()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into a single execution.
+
+    The first caller (the leader) runs the function (a coroutine function is
+    awaited, a blocking one runs in the threadpool);
+    callers arriving with the same key while it is in flight await the same
+    result. The shared work runs in its own task, so a disconnecting leader
+    does not cancel it for everyone else. Coalescing is per worker process.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+
+    async def do(self, key, func, *args, **kwargs):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._run(key, func, *args, **kwargs))
+            self._calls[key] = task
+            metrics.incr("singleflight_executions_total", flight=self.name)
+        else:
+            metrics.incr("singleflight_coalesced_total", flight=self.name)
+        return await asyncio.shield(task)
+
+    async def _run(self, key, func, *args, **kwargs):
+        try:
+            if asyncio.iscoroutinefunction(func):
+                return await func(*args, **kwargs)
+            return await run_in_threadpool(func, *args, **kwargs)
+        finally:
+            self._calls.pop(key, None)
+
+    def in_flight(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,408 @@
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+class ObjectNotFound(KeyError):
+    """No object is stored under the requested key."""
+
+
+# --- Backends ---
+
+class S3Backend:
+    """Documents stored in an S3 bucket (or an S3-compatible endpoint)."""
+
+    def __init__(self, client, bucket: str, transfer_config=None, extra_args: dict = None):
+        self.client = client
+        self.bucket = bucket
+        self.transfer_config = transfer_config
+        self.extra_args = extra_args or {}
+
+    def put(self, key: str, file_obj, content_type: str = "application/pdf"):
+        self.client.upload_fileobj(
+            Fileobj=file_obj, Bucket=self.bucket, Key=key,
+            ExtraArgs={"ContentType": content_type, **self.extra_args}, Config=self.transfer_config,
+        )
+
+    def version(self, key: str) -> str:
+        """Changes whenever the object's content changes (the ETag)."""
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)["ETag"].strip('"')
+        except self.client.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                raise ObjectNotFound(key)
+            raise
+
+    def fetch(self, key: str, path: str):
+        self.client.download_file(self.bucket, key, path, Config=self.transfer_config)
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+
+class LocalBackend:
+    """Documents stored under a local directory; stands in for S3 on single-node setups and in tests."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"Invalid storage key {key!r}")
+        return path
+
+    def put(self, key: str, file_obj, content_type: str = "application/pdf"):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            shutil.copyfileobj(file_obj, f)
+        os.replace(tmp_path, path)
+
+    def version(self, key: str) -> str:
+        try:
+            stat = os.stat(self._path(key))
+        except FileNotFoundError:
+            raise ObjectNotFound(key)
+        return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+    def fetch(self, key: str, path: str):
+        try:
+            shutil.copyfile(self._path(key), path)
+        except FileNotFoundError:
+            raise ObjectNotFound(key)
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+# --- Cache ---
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """
+    Content-addressed local file cache, evicted least-recently-used by total bytes.
+
+    Blobs are stored as blobs/<sha256>, so identical files under different keys
+    share one copy; refs/<hash of key and version> points a stored object at its
+    blob. Everything is written to a temp file and moved into place with
+    os.replace, so a crashed or concurrent writer never leaves a partial blob.
+    Readers get a private hard link to the blob, so evicting it (in this or
+    another worker) cannot pull a file out from under a PDF parser.
+
+    max_bytes bounds the directory, not the worker: eviction lists the blobs
+    on disk under a file lock, so every worker sharing the directory counts
+    the others' files and least-recent use is read from their mtimes.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._blobs = OrderedDict()  # sha -> size, oldest first
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.bytes_fetched = 0
+        self.evictions = 0
+        for name in ("blobs", "refs", "tmp", "readers"):
+            os.makedirs(os.path.join(directory, name), exist_ok=True)
+        self._load()
+
+    def _load(self):
+        self._blobs = OrderedDict((name, size) for _, name, size in self._scan())
+
+    def _scan(self) -> list:
+        """(mtime, sha, size) of every blob on disk, least recently used first."""
+        entries = []
+        for name in os.listdir(os.path.join(self.directory, "blobs")):
+            try:
+                stat = os.stat(self._blob_path(name))
+            except FileNotFoundError:
+                continue  # evicted by another worker while listing
+            entries.append((stat.st_mtime_ns, name, stat.st_size))
+        return sorted(entries)
+
+    def _blob_path(self, sha: str) -> str:
+        return os.path.join(self.directory, "blobs", sha)
+
+    def _ref_path(self, ref: str) -> str:
+        return os.path.join(self.directory, "refs", hashlib.sha256(ref.encode()).hexdigest())
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(self._blobs.values())
+
+    def _lookup(self, ref: str):
+        try:
+            with open(self._ref_path(ref)) as f:
+                sha = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return sha if os.path.exists(self._blob_path(sha)) else None
+
+    def _write_atomic(self, path: str, data: str):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.directory, "tmp"))
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _touch(self, sha: str):
+        with self._lock:
+            if sha in self._blobs:
+                self._blobs.move_to_end(sha)
+        try:
+            os.utime(self._blob_path(sha))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, keep: str):
+        with open(os.path.join(self.directory, "evict.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)  # one evicting thread across every worker
+            try:
+                entries = self._scan()
+                total = sum(size for _, _, size in entries)
+                blobs, evicted = OrderedDict(), 0
+                for _, sha, size in entries:
+                    if total > self.max_bytes and sha != keep:
+                        total -= size
+                        evicted += 1
+                        try:
+                            os.remove(self._blob_path(sha))
+                        except FileNotFoundError:
+                            pass
+                    else:
+                        blobs[sha] = size
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        with self._lock:
+            self._blobs = blobs
+            self.evictions += evicted
+
+    def _key_lock(self, ref: str):
+        with self._lock:
+            return self._key_locks.setdefault(ref, threading.Lock())
+
+    def get_blob(self, ref: str, fetch) -> str:
+        """
+        Returns the blob path for `ref`, calling fetch(tmp_path) to fill it on a miss.
+        Concurrent misses for the same ref in this worker share one fetch.
+        """
+        sha = self._lookup(ref)
+        if sha is not None:
+            try:
+                size = os.path.getsize(self._blob_path(sha))
+            except FileNotFoundError:
+                sha = None  # evicted since the lookup
+            else:
+                with self._lock:
+                    self._blobs.setdefault(sha, size)
+                    self.hits += 1
+                    self.bytes_saved += size
+                self._touch(sha)
+                return self._blob_path(sha)
+
+        with self._key_lock(ref):
+            sha = self._lookup(ref)
+            if sha is None:
+                sha = self._fill(ref, fetch)
+            else:
+                with self._lock:
+                    self.hits += 1
+                    self.bytes_saved += self._blobs.get(sha, 0)
+        with self._lock:
+            self._key_locks.pop(ref, None)
+        return self._blob_path(sha)
+
+    def _fill(self, ref: str, fetch) -> str:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.directory, "tmp"))
+        os.close(fd)
+        try:
+            fetch(tmp_path)
+            sha = sha256_file(tmp_path)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, self._blob_path(sha))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._write_atomic(self._ref_path(ref), sha)
+        with self._lock:
+            self._blobs[sha] = size
+            self._blobs.move_to_end(sha)
+            self.misses += 1
+            self.bytes_fetched += size
+        self._evict(keep=sha)
+        return sha
+
+    @contextmanager
+    def open_path(self, ref: str, fetch):
+        """Yields a private path to the cached file; it stays readable until the block exits."""
+        for _ in range(3):
+            blob = self.get_blob(ref, fetch)
+            reader = os.path.join(self.directory, "readers", f"{uuid.uuid4().hex}.pdf")
+            try:
+                os.link(blob, reader)
+            except FileNotFoundError:
+                continue  # evicted between lookup and link; fetch again
+            except OSError:
+                shutil.copyfile(blob, reader)  # filesystem without hard links
+            break
+        else:
+            raise RuntimeError(f"Could not pin cached file for {ref}")
+        try:
+            yield reader
+        finally:
+            try:
+                os.remove(reader)
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "bytes_saved": self.bytes_saved,
+            "bytes_fetched": self.bytes_fetched,
+            "evictions": self.evictions,
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+class ExtractedTextCache:
+    """
+    Page text extracted from each document, so re-chunking never parses the PDF again.
+
+    Text is stored as <document_id>/<sha256 of the PDF>.jsonl.gz, one
+    {"page", "text"} object per line, and streamed back page by page. It is
+    written while the PDF is parsed and moved into place only once every page
+    was extracted, so a failed or interrupted parse never leaves partial text.
+    A new version of a document replaces the text of the previous one.
+    """
+
+    def __init__(self, directory: str, compresslevel: int = 6):
+        self.directory = directory
+        self.compresslevel = compresslevel
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _directory(self, document_id: str) -> str:
+        if not document_id or os.sep in document_id or document_id.startswith("."):
+            raise ValueError(f"Invalid document id {document_id!r}")
+        return os.path.join(self.directory, document_id)
+
+    def _path(self, document_id: str, content_hash: str = None):
+        """The file for this content hash, or the newest one for the document when no hash is given."""
+        directory = self._directory(document_id)
+        if content_hash is not None:
+            path = os.path.join(directory, f"{content_hash}.jsonl.gz")
+            return path if os.path.exists(path) else None
+        try:
+            names = [name for name in os.listdir(directory) if name.endswith(".jsonl.gz")]
+        except FileNotFoundError:
+            return None
+        paths = [os.path.join(directory, name) for name in names]
+        return max(paths, key=os.path.getmtime) if paths else None
+
+    def pages(self, document_id: str, content_hash: str = None):
+        """Iterator over cached (page_number, text) pairs, or None when nothing is cached."""
+        path = self._path(document_id, content_hash)
+        if path is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._read(path)
+
+    @staticmethod
+    def _read(path: str):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                page = json.loads(line)
+                yield page["page"], page["text"]
+
+    def write_through(self, document_id: str, content_hash: str, pages):
+        """Yields `pages` unchanged while storing them; they are kept only if every page was read."""
+        directory = self._directory(document_id)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        complete = False
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8",
+                                                      compresslevel=self.compresslevel) as f:
+                for page_number, text in pages:
+                    f.write(json.dumps({"page": page_number, "text": text}) + "\n")
+                    yield page_number, text
+            complete = True
+        finally:
+            if complete:
+                path = os.path.join(directory, f"{content_hash}.jsonl.gz")
+                os.replace(tmp_path, path)
+                for name in os.listdir(directory):
+                    if name.endswith(".jsonl.gz") and os.path.join(directory, name) != path:
+                        os.remove(os.path.join(directory, name))
+            elif os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def delete(self, document_id: str):
+        shutil.rmtree(self._directory(document_id), ignore_errors=True)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+# --- Store ---
+
+class DocumentStore:
+    """Reads and writes documents by storage key, with reads served through the disk cache."""
+
+    def __init__(self, backend, cache: DiskCache, executor: ThreadPoolExecutor = None):
+        self.backend = backend
+        self.cache = cache
+        self.executor = executor
+
+    def put(self, key: str, file_obj, content_type: str = "application/pdf"):
+        self.backend.put(key, file_obj, content_type)
+
+    def put_many(self, items: list):
+        """Store (key, file_obj, content_type) tuples in parallel on the shared executor."""
+        if self.executor is None:
+            for item in items:
+                self.put(*item)
+            return
+        for future in [self.executor.submit(self.put, *item) for item in items]:
+            future.result()
+
+    @contextmanager
+    def local_path(self, key: str):
+        """Local path to the current version of `key`, valid inside the with-block."""
+        ref = f"{key}@{self.backend.version(key)}"
+        with self.cache.open_path(ref, lambda path: self.backend.fetch(key, path)) as path:
+            yield path
+
+    def delete(self, key: str):
+        self.backend.delete(key)
@@ -0,0 +1,171 @@
+"""
+Per-user, per-chatbot usage metering for billing.
+
+Calls add to in-memory counters under a lock and never touch the database. A
+background thread writes the counters to usage_records every
+USAGE_FLUSH_SECONDS in one bulk upsert, and the app flushes once more on
+shutdown, so a crashed worker loses at most one interval of usage. When the
+database is unreachable the counters stay buffered; when it rejects the batch
+(e.g. a row for a deleted user), rows are written one by one and the rejected
+ones are dropped, so one bad row cannot hold back everyone's usage.
+"""
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from uuid import UUID
+
+from sqlalchemy import func
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.db.upsert import increment_rows
+from app.models.models import UsageRecord
+from app.setting import current_config
+from app.utils.analytics import bucket_start, utc_naive
+from app.utils.metrics import metrics
+
+COUNTERS = (
+    "requests", "latency_ms", "llm_calls", "llm_latency_ms",
+    "prompt_tokens", "completion_tokens", "embedding_tokens",
+)
+KEYS = ("user_id", "chatbot_id", "bucket_start")
+# Errors that retrying the same rows can never fix
+REJECTED_ERRORS = (IntegrityError, DataError)
+
+
+class UsageMeter:
+    def __init__(self, session_factory, flush_interval: float):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, user_id, chatbot_id: str = None, **counts):
+        """Adds `counts` (names from COUNTERS) to the current hour of this user and chatbot."""
+        try:
+            user_id = UUID(str(user_id))
+        except ValueError:
+            return  # not attributable to a user (e.g. scripts)
+        key = (user_id, chatbot_id or "", bucket_start(datetime.now(timezone.utc), "hour"))
+        with self._lock:
+            pending = self._pending[key]
+            for name, value in counts.items():
+                pending[name] += int(value)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self) -> int:
+        """
+        Writes buffered counters in one transaction. On a database error they stay buffered for the
+        next flush; if the database rejects the batch, rows are retried one by one and rejected ones dropped.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+            if not batch:
+                return 0
+            rows = [dict(zip(KEYS, key), **counts) for key, counts in batch.items()]
+            try:
+                self._write(rows)
+            except REJECTED_ERRORS:
+                written = self._write_each(batch)
+            except Exception as e:
+                self._restore(batch)
+                metrics.incr("usage_flush_errors_total")
+                print(f"[WARN] Usage flush failed, keeping {len(batch)} rows for the next flush: {e}")
+                return 0
+            else:
+                written = len(rows)
+            metrics.incr("usage_rows_flushed_total", written)
+            return written
+
+    def _write(self, rows: list):
+        with self.session_factory() as db, db.begin():
+            increment_rows(db, UsageRecord, rows, keys=KEYS, counters=COUNTERS)
+
+    def _write_each(self, batch: dict) -> int:
+        """Writes rows in a transaction each, dropping the rejected ones. Returns the number written."""
+        written, items = 0, list(batch.items())
+        for index, (key, counts) in enumerate(items):
+            try:
+                self._write([dict(zip(KEYS, key), **counts)])
+            except REJECTED_ERRORS as e:
+                metrics.incr("usage_rows_dropped_total")
+                print(f"[ERROR] Dropping usage row for user {key[0]}, chatbot {key[1]!r}: {e}")
+            except Exception as e:
+                self._restore(dict(items[index:]))
+                metrics.incr("usage_flush_errors_total")
+                print(f"[WARN] Usage flush failed, keeping {len(items) - index} rows for the next flush: {e}")
+                break
+            else:
+                written += 1
+        return written
+
+    def _restore(self, batch: dict):
+        with self._lock:
+            for key, counts in batch.items():
+                pending = self._pending[key]
+                for name, value in counts.items():
+                    pending[name] += value
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="usage-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the flusher and writes whatever is still buffered."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> dict:
+        return {"pending_rows": self.pending(), "flush_interval_seconds": self.flush_interval}
+
+
+def usage_summary(db: Session, user_id, start: datetime = None, end: datetime = None) -> dict:
+    """Usage totals and per-chatbot breakdown for a user; `start` is inclusive, `end` exclusive (by hour)."""
+    filters = [UsageRecord.user_id == user_id]
+    if start:
+        filters.append(UsageRecord.bucket_start >= bucket_start(start, "hour"))
+    if end:
+        filters.append(UsageRecord.bucket_start < utc_naive(end))
+    rows = (
+        db.query(UsageRecord.chatbot_id, *[func.sum(getattr(UsageRecord, name)).label(name) for name in COUNTERS])
+        .filter(*filters)
+        .group_by(UsageRecord.chatbot_id)
+        .order_by(UsageRecord.chatbot_id)
+        .all()
+    )
+
+    def with_averages(counts: dict) -> dict:
+        counts["avg_latency_ms"] = counts["latency_ms"] / counts["requests"] if counts["requests"] else None
+        counts["avg_llm_latency_ms"] = (
+            counts["llm_latency_ms"] / counts["llm_calls"] if counts["llm_calls"] else None
+        )
+        return counts
+
+    chatbots = [
+        with_averages({"chatbot_id": row.chatbot_id or None, **{name: int(getattr(row, name)) for name in COUNTERS}})
+        for row in rows
+    ]
+    totals = with_averages({name: sum(chatbot[name] for chatbot in chatbots) for name in COUNTERS})
+    return {"totals": totals, "chatbots": chatbots}
+
+
+usage_meter = UsageMeter(SessionLocal, current_config.USAGE_FLUSH_SECONDS)
+metrics.register_collector("usage", usage_meter.stats)
@@ -0,0 +1,216 @@
+"""
+Garbage collection of chunks in Chroma that no document accounts for.
+
+Chunks are orphans when their document row is gone (deleted documents, the
+/reset endpoints), when the document failed to process and left a partial
+set of chunks behind, or when it started "processing" (at upload or
+re-indexing) more than VECTOR_GC_STALE_PROCESSING_HOURS ago (its worker died
+mid-ingestion). The collector pages through every document collection,
+checks each page's document ids against the documents table and deletes the
+orphans in batches, so memory stays bounded however large the index is.
+
+    python -m app.utils.vector_gc --dry-run     # report only
+    python -m app.utils.vector_gc               # delete orphans
+
+It also runs every VECTOR_GC_INTERVAL_HOURS, and after a reset. Every app
+process schedules it, but only the one holding VECTOR_GC_LOCK_FILE runs it,
+and not again until an interval after the last run by any of them.
+"""
+import argparse
+import fcntl
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.models.models import Document
+from app.setting import current_config
+from app.utils.analytics import utc_naive
+from app.utils.metrics import metrics
+from app.utils.process_pdf import precess_pdf
+
+# Documents whose chunks are dead data; "processing" documents are still being written
+ORPHAN_STATUSES = ("failed",)
+
+
+class VectorGarbageCollector:
+    def __init__(self, client, session_factory, interval_hours: float, page_size: int = None,
+                 delete_batch_size: int = None, dry_run: bool = False, lock_path: str = None,
+                 stale_processing_hours: float = None):
+        self.client = client
+        self.session_factory = session_factory
+        self.interval_hours = interval_hours
+        self.lock_path = lock_path or current_config.VECTOR_GC_LOCK_FILE
+        self.stale_processing_hours = (
+            current_config.VECTOR_GC_STALE_PROCESSING_HOURS if stale_processing_hours is None
+            else stale_processing_hours
+        )
+        self.page_size = page_size or current_config.VECTOR_GC_PAGE_SIZE
+        self.delete_batch_size = delete_batch_size or current_config.VECTOR_GC_DELETE_BATCH_SIZE
+        self.dry_run = dry_run
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_report = None
+
+    def collections(self) -> list:
+        """Every document collection: the configured one and those of other embedding models."""
+        return [
+            collection for collection in self.client.list_collections()
+            if collection.name == "documents" or collection.name.startswith("documents_")
+        ]
+
+    def orphans(self, db: Session, ids: list, metadatas: list) -> list:
+        """The ids in one page of chunks whose document is missing, failed or abandoned mid-ingestion."""
+        document_ids = {(metadata or {}).get("id") for metadata in metadatas} - {None}
+        stale_before = utc_naive(datetime.now(timezone.utc)) - timedelta(hours=self.stale_processing_hours)
+        rows = db.query(
+            Document.id, Document.status, func.coalesce(Document.processing_started_at, Document.uploaded_at)
+        ).filter(Document.id.in_(document_ids))
+        live = {
+            document_id
+            for document_id, status, started_at in rows
+            if status not in ORPHAN_STATUSES
+            and not (status == "processing" and started_at and utc_naive(started_at) < stale_before)
+        }
+        return [vector_id for vector_id, metadata in zip(ids, metadatas) if (metadata or {}).get("id") not in live]
+
+    def collect(self, dry_run: bool = None) -> dict:
+        """
+        Scans every document collection once and deletes (or, in a dry run, only counts) orphans.
+        Returns None when another run is already in progress.
+        """
+        dry_run = self.dry_run if dry_run is None else dry_run
+        if not self._run_lock.acquire(blocking=False):
+            return None
+        try:
+            started = time.monotonic()
+            report = {"dry_run": dry_run, "collections": {}}
+            with self.session_factory() as db:
+                for collection in self.collections():
+                    report["collections"][collection.name] = self._collect_collection(db, collection, dry_run)
+            report["seconds"] = round(time.monotonic() - started, 3)
+            scanned = sum(stats["scanned"] for stats in report["collections"].values())
+            report["scanned"] = scanned
+            report["orphans"] = sum(stats["orphans"] for stats in report["collections"].values())
+            report["deleted"] = sum(stats["deleted"] for stats in report["collections"].values())
+            report["chunks_per_second"] = round(scanned / report["seconds"]) if report["seconds"] else None
+            self.last_report = report
+            return report
+        finally:
+            self._run_lock.release()
+
+    def _collect_collection(self, db: Session, collection, dry_run: bool) -> dict:
+        stats = {"scanned": 0, "orphans": 0, "deleted": 0}
+        documents = Counter()
+        offset = 0
+        while True:
+            page = collection.get(include=["metadatas"], limit=self.page_size, offset=offset)
+            if not page["ids"]:
+                break
+            orphans = self.orphans(db, page["ids"], page["metadatas"])
+            stats["scanned"] += len(page["ids"])
+            stats["orphans"] += len(orphans)
+            metrics.incr("vector_gc_scanned_total", len(page["ids"]))
+            metrics.incr("vector_gc_orphans_total", len(orphans))
+            metadatas = dict(zip(page["ids"], page["metadatas"]))
+            documents.update((metadatas[vector_id] or {}).get("id") or "(none)" for vector_id in orphans)
+
+            if not dry_run:
+                for start in range(0, len(orphans), self.delete_batch_size):
+                    batch = orphans[start:start + self.delete_batch_size]
+                    collection.delete(ids=batch)
+                    precess_pdf.vectors_deleted(collection.name, ids=batch)
+                    stats["deleted"] += len(batch)
+                    metrics.incr("vector_gc_deleted_total", len(batch))
+            # Deleted chunks no longer take up positions, so only the kept ones are skipped
+            offset += len(page["ids"]) - (0 if dry_run else len(orphans))
+            if len(page["ids"]) < self.page_size:
+                break
+
+        stats["documents"] = dict(documents.most_common(20))
+        verb = "found" if dry_run else "deleted"
+        print(f"[VECTOR GC] {collection.name}: {verb} {stats['orphans']} orphans in {stats['scanned']} chunks")
+        return stats
+
+    def collect_scheduled(self) -> dict:
+        """
+        Runs `collect` in at most one of the processes sharing the lock file, once per interval.
+        Returns None when another process is collecting or ran within the last half interval.
+        """
+        with open(self.lock_path, "a+") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            try:
+                lock_file.seek(0)
+                last_run = float(lock_file.read() or 0)
+                # Workers' timers are out of phase: half an interval skips their duplicates, never a whole run
+                if time.time() - last_run < self.interval_hours * 3600 / 2:
+                    return None
+                report = self.collect()
+                lock_file.truncate(0)
+                lock_file.write(str(time.time()))
+                return report
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_hours * 3600):
+            try:
+                self.collect_scheduled()
+            except Exception as e:
+                metrics.incr("vector_gc_errors_total")
+                print(f"[WARN] Vector garbage collection failed: {e}")
+
+    def start(self):
+        if not self.interval_hours or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="vector-gc", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def stats(self) -> dict:
+        report = self.last_report or {}
+        return {
+            "interval_hours": self.interval_hours,
+            "running": self._run_lock.locked(),
+            **{name: report.get(name) for name in ("dry_run", "scanned", "orphans", "deleted", "seconds",
+                                                   "chunks_per_second")},
+        }
+
+
+vector_gc = VectorGarbageCollector(
+    precess_pdf.client, SessionLocal, current_config.VECTOR_GC_INTERVAL_HOURS, dry_run=current_config.VECTOR_GC_DRY_RUN
+)
+metrics.register_collector("vector_gc", vector_gc.stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find and delete Chroma chunks without a document")
+    parser.add_argument("--dry-run", action="store_true", help="report orphans without deleting them")
+    parser.add_argument("--page-size", type=int)
+    args = parser.parse_args()
+    if args.page_size:
+        vector_gc.page_size = args.page_size
+
+    report = vector_gc.collect(dry_run=args.dry_run)
+    for name, stats in report["collections"].items():
+        for document_id, count in stats["documents"].items():
+            print(f"  {name}  {document_id}: {count}")
+    verb = "would delete" if args.dry_run else "deleted"
+    print(f"Scanned {report['scanned']} chunks in {report['seconds']}s ({report['chunks_per_second']}/s); "
+          f"{verb} {report['orphans']} orphans")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,523 @@
+import fcntl
+import json
+import operator
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+import numpy as np
+
+from app.setting import current_config
+from app.utils.metrics import metrics
+
+STORAGE_MODES = ("float32", "float16", "int8", "pq")
+# Range operators the compact index evaluates over metadata values, besides $eq and $in
+COMPARISONS = {"$gt": operator.gt, "$gte": operator.ge, "$lt": operator.lt, "$lte": operator.le}
+
+
+class UnsupportedFilter(ValueError):
+    """Raised for `where` clauses the compact index cannot evaluate."""
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _kmeans(data: np.ndarray, k: int, iterations: int = 12, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        distances = (
+            (data ** 2).sum(1, keepdims=True) - 2 * data @ centroids.T + (centroids ** 2).sum(1)
+        )
+        assignment = distances.argmin(1)
+        for c in range(k):
+            members = data[assignment == c]
+            if len(members):
+                centroids[c] = members.mean(0)
+    return centroids
+
+
+class VectorLog:
+    """
+    A collection's writes, shared on disk by every worker, so compact indexes never read Chroma.
+
+    Each write stores its normalized float32 vectors and its documents as files
+    under data/, then commits a manifest under log/<hour>/ named after the time
+    of the commit. Deletes commit a manifest with the removed ids or `where`
+    clause. Readers list only the hours since they last looked, and re-scoring
+    reads just the candidate rows from the vector files instead of keeping every
+    float vector in the worker.
+    """
+
+    HOUR_NS = 3600 * 10 ** 9
+    # Manifests of concurrent writers can be committed slightly out of order
+    LOOKBACK_NS = 60 * 10 ** 9
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, *parts) -> str:
+        return os.path.join(self.directory, *parts)
+
+    def _commit(self, manifest: dict, stamp: int = None):
+        stamp = stamp or time.time_ns()
+        bucket = self._path("log", str(stamp // self.HOUR_NS))
+        os.makedirs(bucket, exist_ok=True)
+        path = os.path.join(bucket, f"{stamp:020d}-{uuid.uuid4().hex}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(path + ".tmp", path)  # readers never see a partial manifest
+
+    def append(self, ids: list, embeddings, documents: list, metadatas: list, stamp: int = None):
+        os.makedirs(self._path("data"), exist_ok=True)
+        segment = uuid.uuid4().hex
+        np.save(self._path("data", f"{segment}.npy"), _normalize(np.asarray(embeddings, dtype=np.float32)))
+        encoded = [(document or "").encode() for document in documents or [None] * len(ids)]
+        np.save(self._path("data", f"{segment}.offsets.npy"), np.cumsum([0, *map(len, encoded)], dtype=np.int64))
+        with open(self._path("data", f"{segment}.txt"), "wb") as f:
+            f.write(b"".join(encoded))
+        self._commit({"add": segment, "ids": list(ids), "metadatas": list(metadatas)}, stamp)
+
+    def delete(self, ids: list = None, where: dict = None):
+        self._commit({"delete": list(ids) if ids is not None else None, "where": where})
+
+    def exported(self) -> bool:
+        return os.path.exists(self._path("exported"))
+
+    def export(self, collection, page_size: int = 2000):
+        """Copies what the collection held before its writes were logged; the first worker does it for all."""
+        if self.exported():
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path("export.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if self.exported():
+                    return
+                # Ordered before every write logged while exporting, so those win over the copied version
+                stamp, offset = time.time_ns(), 0
+                while True:
+                    page = collection.get(include=["embeddings", "documents", "metadatas"],
+                                          limit=page_size, offset=offset)
+                    if not page["ids"]:
+                        break
+                    self.append(page["ids"], page["embeddings"], page["documents"], page["metadatas"], stamp)
+                    offset += len(page["ids"])
+                open(self._path("exported"), "w").close()
+                print(f"Exported {offset} vectors of {collection.name} to {self.directory}")
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read(self, cursor: dict) -> list:
+        """Manifests committed since `cursor` last advanced, oldest first; advances it."""
+        if not os.path.isdir(self._path("log")):
+            return []
+        since = cursor["stamp"] - self.LOOKBACK_NS
+        names = []
+        for bucket in os.listdir(self._path("log")):
+            if int(bucket) < since // self.HOUR_NS:
+                continue
+            names += [
+                (name, bucket) for name in os.listdir(self._path("log", bucket))
+                if name.endswith(".json") and int(name[:20]) >= since and name not in cursor["seen"]
+            ]
+        manifests = []
+        for name, bucket in sorted(names):
+            with open(self._path("log", bucket, name)) as f:
+                manifests.append(json.load(f))
+            cursor["seen"].add(name)
+            cursor["stamp"] = max(cursor["stamp"], int(name[:20]))
+        cursor["seen"] = {name for name in cursor["seen"] if int(name[:20]) >= cursor["stamp"] - self.LOOKBACK_NS}
+        return manifests
+
+    def _rows(self, name: str, rows) -> np.ndarray:
+        """Reads `rows` of a .npy file, one seek each, so the worker neither loads nor maps the rest."""
+        with open(self._path("data", name), "rb") as f:
+            if np.lib.format.read_magic(f) == (1, 0):
+                shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+            start, row_bytes = f.tell(), int(np.prod(shape[1:], dtype=np.int64)) * dtype.itemsize
+            data = bytearray()
+            for row in rows:
+                f.seek(start + int(row) * row_bytes)
+                data += f.read(row_bytes)
+        return np.frombuffer(bytes(data), dtype=dtype).reshape(len(rows), *shape[1:])
+
+    def vectors(self, segment: str, rows=None) -> np.ndarray:
+        """A segment's vectors, or only `rows` of them."""
+        if rows is None:
+            return np.load(self._path("data", f"{segment}.npy"))
+        return self._rows(f"{segment}.npy", rows)
+
+    def documents(self, segment: str, rows) -> list:
+        bounds = self._rows(f"{segment}.offsets.npy", [bound for row in rows for bound in (row, row + 1)])
+        documents = []
+        with open(self._path("data", f"{segment}.txt"), "rb") as f:
+            for start, end in bounds.reshape(-1, 2):
+                f.seek(int(start))
+                documents.append(f.read(int(end - start)).decode())
+        return documents
+
+
+class CompactVectorIndex:
+    """
+    Worker-resident, quantized index of a collection's vectors.
+
+    Vectors are normalized and kept as float16, int8 (per-vector scale) or
+    product-quantized codes. Search scans the compact codes of the rows allowed
+    by the `where` filter and returns the best candidates; callers re-score those
+    candidates with the full-precision vectors, which `stored` reads from the
+    files of the VectorLog the rows were added from.
+    """
+
+    def __init__(self, mode: str = "int8", pq_subvectors: int = None, pq_train_size: int = 20000,
+                 log: VectorLog = None):
+        if mode not in STORAGE_MODES or mode == "float32":
+            raise ValueError(f"Compact storage mode must be one of float16, int8, pq (got '{mode}')")
+        self.mode = mode
+        self.pq_subvectors = pq_subvectors or current_config.PQ_SUBVECTORS
+        self.pq_train_size = pq_train_size
+        self.log = log
+        self.dimension = None
+        self.ids = []
+        self.rows = {}
+        self.postings = {}
+        # Row arrays grow by doubling; only their first len(self.ids) rows are in use
+        self.valid = np.zeros(0, dtype=bool)
+        self.segments = []  # VectorLog data files rows were added from
+        self.locations = np.zeros((0, 2), dtype=np.int64)  # (segment, row in it) of each row, or -1
+        self.codes = None
+        self.scales = None
+        self.codebooks = None
+        self._lock = threading.RLock()
+
+    # --- building ---
+
+    def apply(self, manifest: dict):
+        """Apply one VectorLog manifest: an added segment or a delete."""
+        if "add" in manifest:
+            self.add(manifest["ids"], self.log.vectors(manifest["add"]), manifest["metadatas"],
+                     segment=manifest["add"])
+            return
+        if manifest["delete"] is not None:
+            self.remove(manifest["delete"])
+        if manifest["where"]:
+            self.remove_where(manifest["where"])
+
+    def add(self, ids: list, embeddings, metadatas: list, segment: str = None):
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = vectors.shape[1]
+            if self.mode == "pq" and self.codebooks is None:
+                self._train_pq(vectors[: self.pq_train_size])
+            codes, scales = self._encode(vectors)
+            self._grow(len(ids), codes, scales)
+            start, end = len(self.ids), len(self.ids) + len(ids)
+            self.codes[start:end] = codes
+            if scales is not None:
+                self.scales[start:end] = scales
+            self.valid[start:end] = True
+            self.locations[start:end] = -1
+            if segment is not None:
+                self.segments.append(segment)
+                self.locations[start:end, 0] = len(self.segments) - 1
+                self.locations[start:end, 1] = np.arange(len(ids))
+            for offset, (vector_id, metadata) in enumerate(zip(ids, metadatas)):
+                row = start + offset
+                previous = self.rows.get(vector_id)
+                if previous is not None:
+                    self.valid[previous] = False
+                self.rows[vector_id] = row
+                self.ids.append(vector_id)
+                for key, value in (metadata or {}).items():
+                    self.postings.setdefault(key, {}).setdefault(value, []).append(row)
+
+    def _grow(self, rows: int, codes: np.ndarray, scales: np.ndarray):
+        """
+        Makes room for `rows` more rows by doubling the row arrays, instead of copying them on every add.
+        Zeroed capacity not yet written to takes no memory, and the replaced arrays go back to the OS.
+        """
+        size = len(self.ids)
+        if self.codes is not None and size + rows <= len(self.codes):
+            return
+        capacity = max(size + rows, 2 * size)
+        templates = {"codes": codes, "scales": scales, "valid": self.valid, "locations": self.locations}
+        for name, template in templates.items():
+            if template is None:
+                continue
+            grown = np.zeros((capacity, *template.shape[1:]), dtype=template.dtype)
+            if getattr(self, name) is not None:
+                grown[:size] = getattr(self, name)[:size]
+            setattr(self, name, grown)
+
+    def remove(self, ids: list):
+        with self._lock:
+            for vector_id in ids:
+                row = self.rows.pop(vector_id, None)
+                if row is not None:
+                    self.valid[row] = False
+
+    def remove_where(self, where: dict):
+        with self._lock:
+            self.remove([self.ids[row] for row in self.filter_rows(where)])
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _train_pq(self, sample: np.ndarray):
+        sub = self._subvector_size()
+        padded = self._pad(sample)
+        k = min(256, len(padded))
+        self.codebooks = np.stack([
+            _kmeans(padded[:, m * sub:(m + 1) * sub], k) for m in range(self.pq_subvectors)
+        ])
+
+    def _subvector_size(self) -> int:
+        return -(-self.dimension // self.pq_subvectors)
+
+    def _pad(self, vectors: np.ndarray) -> np.ndarray:
+        width = self._subvector_size() * self.pq_subvectors
+        if vectors.shape[1] == width:
+            return vectors
+        return np.pad(vectors, ((0, 0), (0, width - vectors.shape[1])))
+
+    def _encode(self, vectors: np.ndarray):
+        if self.mode == "float16":
+            return vectors.astype(np.float16), None
+        if self.mode == "int8":
+            scales = np.abs(vectors).max(1) / 127.0
+            scales[scales == 0] = 1.0
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        sub = self._subvector_size()
+        padded = self._pad(vectors)
+        codes = np.empty((len(vectors), self.pq_subvectors), dtype=np.uint8)
+        for m in range(self.pq_subvectors):
+            part = padded[:, m * sub:(m + 1) * sub]
+            centroids = self.codebooks[m]
+            distances = (part ** 2).sum(1, keepdims=True) - 2 * part @ centroids.T + (centroids ** 2).sum(1)
+            codes[:, m] = distances.argmin(1)
+        return codes, None
+
+    # --- searching ---
+
+    def filter_rows(self, where: dict = None) -> np.ndarray:
+        """Row numbers matching a Chroma-style `where` clause ($and, $or, $eq, $in, $gt, $gte, $lt, $lte)."""
+        with self._lock:
+            if not where:
+                return np.flatnonzero(self.valid[:len(self.ids)])
+            rows = np.fromiter(self._match(where), dtype=np.int64)
+            rows = np.unique(rows)
+            return rows[self.valid[rows]]
+
+    def _match(self, where: dict) -> set:
+        result = None
+        for key, condition in where.items():
+            if key == "$and":
+                matched = set.intersection(*(self._match(clause) for clause in condition))
+            elif key == "$or":
+                matched = set.union(*(self._match(clause) for clause in condition))
+            elif isinstance(condition, dict):
+                (operator_name, value), = condition.items()
+                values = self.postings.get(key, {})
+                if operator_name == "$eq":
+                    matched = set(values.get(value, ()))
+                elif operator_name == "$in":
+                    matched = set().union(*(values.get(v, ()) for v in value)) if value else set()
+                elif operator_name in COMPARISONS:
+                    compare = COMPARISONS[operator_name]
+                    matched = set().union(*(
+                        rows for stored, rows in values.items()
+                        if isinstance(stored, (int, float)) and compare(stored, value)
+                    ))
+                else:
+                    raise UnsupportedFilter(f"Operator {operator_name} is not supported by the compact index")
+            else:
+                matched = set(self.postings.get(key, {}).get(condition, ()))
+            result = matched if result is None else result & matched
+        return result or set()
+
+    def search(self, query, n: int, where: dict = None, block_size: int = 65536):
+        """Return up to `n` (id, approximate score) candidates for a query vector."""
+        query = _normalize(np.asarray(query, dtype=np.float32))
+        rows = self.filter_rows(where)
+        if not len(rows):
+            return []
+        with self._lock:
+            if self.mode == "pq":
+                padded = self._pad(query[None, :])[0]
+                sub = self._subvector_size()
+                table = np.stack([
+                    self.codebooks[m] @ padded[m * sub:(m + 1) * sub] for m in range(self.pq_subvectors)
+                ])
+            scores = np.empty(len(rows), dtype=np.float32)
+            unfiltered = len(rows) == len(self.ids)
+            for start in range(0, len(rows), block_size):
+                # Slicing avoids copying the codes when every row is a candidate
+                end = min(start + block_size, len(rows))
+                block = slice(start, end) if unfiltered else rows[start:end]
+                codes = self.codes[block]
+                if self.mode == "pq":
+                    scores[start:start + len(codes)] = table[np.arange(self.pq_subvectors), codes].sum(1)
+                else:
+                    scores[start:start + len(codes)] = codes.astype(np.float32) @ query
+                    if self.mode == "int8":
+                        scores[start:start + len(codes)] *= self.scales[block]
+            n = min(n, len(rows))
+            best = np.argpartition(-scores, n - 1)[:n]
+            best = best[np.argsort(-scores[best])]
+            return [(self.ids[rows[i]], float(scores[i])) for i in best]
+
+    def stored(self, ids: list) -> tuple:
+        """The full-precision vectors and the documents of `ids`, read from their VectorLog segments."""
+        with self._lock:
+            locations = self.locations[[self.rows[vector_id] for vector_id in ids]]
+            segments = list(self.segments)
+        vectors = np.empty((len(ids), self.dimension), dtype=np.float32)
+        documents = [None] * len(ids)
+        for segment in np.unique(locations[:, 0]):
+            positions = np.flatnonzero(locations[:, 0] == segment)
+            rows = locations[positions, 1]
+            vectors[positions] = self.log.vectors(segments[segment], rows)
+            for position, document in zip(positions, self.log.documents(segments[segment], rows)):
+                documents[position] = document
+        return vectors, documents
+
+    @staticmethod
+    def rescore(query, ids: list, embeddings, k: int) -> list:
+        """Exact cosine re-ranking of candidates; returns the top `k` (id, score) pairs."""
+        if not ids:
+            return []
+        query = _normalize(np.asarray(query, dtype=np.float32))
+        scores = _normalize(np.asarray(embeddings, dtype=np.float32)) @ query
+        order = np.argsort(-scores)[:k]
+        return [(ids[i], float(scores[i])) for i in order]
+
+    def vector_bytes(self) -> int:
+        """Bytes held by the quantized vectors (codes, scales and codebooks)."""
+        size = len(self.ids)
+        total = self.codes[:size].nbytes if self.codes is not None else 0
+        total += self.scales[:size].nbytes if self.scales is not None else 0
+        total += self.codebooks.nbytes if self.codebooks is not None else 0
+        return total
+
+    def memory_bytes(self) -> int:
+        """
+        Approximate bytes held by the whole index: the quantized vectors plus the ids, the row map,
+        the metadata postings, the row flags and locations. For PQ the bookkeeping is usually the larger part.
+        """
+        total = self.vector_bytes() + self.valid[:len(self.ids)].nbytes + self.locations[:len(self.ids)].nbytes
+        with self._lock:
+            total += sys.getsizeof(self.ids) + sum(map(sys.getsizeof, self.ids)) + sys.getsizeof(self.rows)
+            total += sum(map(sys.getsizeof, self.rows.values())) + sys.getsizeof(self.postings)
+            for values in self.postings.values():
+                total += sys.getsizeof(values)
+                for value, rows in values.items():
+                    total += sys.getsizeof(value) + sys.getsizeof(rows)
+        return total
+
+
+class CompactIndexCache:
+    """
+    One compact index per collection, kept in sync through the collection's VectorLog.
+
+    The first query of a collection loads its index; concurrent queries of the
+    same collection wait for that load, others are not held up. A background
+    thread then applies the manifests other workers committed, every
+    `refresh_seconds`, so queries never look for changes themselves.
+    """
+
+    def __init__(self, mode: str, directory: str = None, refresh_seconds: float = None):
+        self.mode = mode
+        self.directory = directory or current_config.VECTOR_LOG_DIR
+        self.refresh_seconds = (
+            current_config.VECTOR_INDEX_REFRESH_SECONDS if refresh_seconds is None else refresh_seconds
+        )
+        self._logs = {}
+        self._indexes = {}  # collection name -> Future of its index
+        self._cursors = {}
+        self._sync_locks = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def log(self, collection_name: str) -> VectorLog:
+        with self._lock:
+            if collection_name not in self._logs:
+                self._logs[collection_name] = VectorLog(os.path.join(self.directory, collection_name))
+            return self._logs[collection_name]
+
+    def get(self, collection) -> CompactVectorIndex:
+        with self._lock:
+            loading = self._indexes.get(collection.name)
+            leader = loading is None
+            if leader:
+                loading = self._indexes[collection.name] = Future()
+        if leader:
+            try:
+                loading.set_result(self._load(collection))
+                self.start()
+            except Exception as e:
+                with self._lock:
+                    self._indexes.pop(collection.name, None)
+                loading.set_exception(e)
+        return loading.result()
+
+    def _load(self, collection) -> CompactVectorIndex:
+        log = self.log(collection.name)
+        log.export(collection)
+        index = CompactVectorIndex(self.mode, log=log)
+        self._cursors[collection.name] = {"stamp": 0, "seen": set()}
+        self._sync_locks[collection.name] = threading.Lock()
+        self._apply(collection.name, index)
+        return index
+
+    def _apply(self, collection_name: str, index: CompactVectorIndex):
+        with self._sync_locks[collection_name]:
+            for manifest in self.log(collection_name).read(self._cursors[collection_name]):
+                index.apply(manifest)
+
+    def sync(self, collection_name: str):
+        """Apply the manifests committed since the last sync to the collection's index, if loaded."""
+        with self._lock:
+            loading = self._indexes.get(collection_name)
+        if loading is not None and loading.done() and loading.exception() is None:
+            self._apply(collection_name, loading.result())
+
+    def added(self, collection_name: str, ids: list, embeddings, documents: list, metadatas: list):
+        """Log a write (new or rewritten chunks) for every worker, and apply it to this one's index at once."""
+        self.log(collection_name).append(ids, embeddings, documents, metadatas)
+        self.sync(collection_name)
+
+    def deleted(self, collection_name: str, ids: list = None, where: dict = None):
+        self.log(collection_name).delete(ids, where)
+        self.sync(collection_name)
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_seconds):
+            with self._lock:
+                names = list(self._indexes)
+            for name in names:
+                try:
+                    self.sync(name)
+                except Exception as e:
+                    metrics.incr("vector_index_refresh_errors_total")
+                    print(f"[WARN] Could not refresh the compact index of {name}: {e}")
+
+    def start(self):
+        with self._lock:
+            if not self.refresh_seconds or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="compact-index-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
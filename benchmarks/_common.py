@@ -0,0 +1,142 @@
+"""Shared helpers for the benchmark scripts in this directory."""
+import hashlib
+import json
+import os
+import random
+import re
+import time
+
+import numpy as np
+from chromadb.api.types import EmbeddingFunction
+
+
+WORDS = (
+    "account balance billing customer delivery order refund return policy shipping "
+    "warranty product support service contact email phone hours store online payment "
+    "invoice discount subscription plan upgrade cancel renewal feature setting profile "
+    "password security privacy data export report dashboard analytics team member role "
+    "access integration api webhook token limit quota usage storage document upload"
+).split()
+
+
+def synthetic_text(words_per_page: int, rng: random.Random) -> list:
+    """Return the lines of one synthetic page: a heading followed by wrapped sentences."""
+    lines = [f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}"]
+    sentence, line = [], []
+    for i in range(words_per_page):
+        word = rng.choice(WORDS)
+        sentence.append(word)
+        if len(sentence) >= rng.randint(8, 18) or i == words_per_page - 1:
+            line.append(" ".join(sentence).capitalize() + ".")
+            sentence = []
+        if sum(len(part) for part in line) > 80:
+            lines.append(" ".join(line))
+            line = []
+    if line:
+        lines.append(" ".join(line))
+    return lines
+
+
+def make_synthetic_pdf(path: str, pages: int, words_per_page: int, seed: int = 0) -> str:
+    """Write a plain-text PDF with the given page count and text density."""
+    rng = random.Random(seed)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_refs = []
+    for _ in range(pages):
+        stream = ["BT /F1 9 Tf 11 TL 40 800 Td"]
+        for line in synthetic_text(words_per_page, rng):
+            escaped = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            stream.append(f"({escaped}) '")
+        stream.append("ET")
+        content = "\n".join(stream).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        content_ref = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref
+        )
+        page_refs.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % ref for ref in page_refs)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+
+    with open(path, "wb") as f:
+        f.write(out)
+    return path
+
+
+class HashEmbeddingFunction(EmbeddingFunction):
+    """Deterministic feature-hashing embeddings so benchmarks never call OpenAI."""
+
+    def __init__(self, dimension: int = 384, latency_ms: float = 0.0):
+        self.dimension = dimension
+        self.latency_ms = latency_ms
+        self.calls = 0
+        self.texts = 0
+        self.seconds = 0.0
+
+    def __call__(self, input):
+        start = time.perf_counter()
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        vectors = np.zeros((len(input), self.dimension), dtype=np.float32)
+        for row, text in enumerate(input):
+            for token in re.findall(r"\w+", text.lower()):
+                digest = hashlib.blake2b(token.encode(), digest_size=4).digest()
+                vectors[row, int.from_bytes(digest, "little") % self.dimension] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+        self.calls += 1
+        self.texts += len(input)
+        self.seconds += time.perf_counter() - start
+        return [vector for vector in vectors]
+
+    @staticmethod
+    def name() -> str:
+        return "benchmark-hash"
+
+    def get_config(self):
+        return {"dimension": self.dimension}
+
+    @staticmethod
+    def build_from_config(config):
+        return HashEmbeddingFunction(**config)
+
+
+def load_baseline(path: str):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path: str, report: dict):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"Baseline saved to {path}")
+
+
+def compare_to_baseline(report: dict, baseline: dict, keys: list):
+    """Print each metric next to its baseline value and the relative change."""
+    print(f"{'metric':<28}{'current':>14}{'baseline':>14}{'change':>10}")
+    for key in keys:
+        current, previous = report.get(key), baseline.get(key)
+        if current is None or previous is None:
+            continue
+        change = (current - previous) / previous * 100 if previous else 0.0
+        print(f"{key:<28}{current:>14.3f}{previous:>14.3f}{change:>9.1f}%")
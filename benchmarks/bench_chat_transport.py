@@ -0,0 +1,114 @@
+"""
+Per-message overhead of chat over POST /chatbots/chat against the WebSocket.
+
+Retrieval and the LLM are stubbed to answer at once, so what is measured is
+the work around them: for POST, request parsing, dependency resolution, the
+rate limiter, a database session per request and the whole history sent with
+every message; for the WebSocket, one frame per message on a connection whose
+chatbot and history were resolved when it opened. Both run in-process through
+Starlette's TestClient, so network round trips are not included. The WebSocket
+streams one frame per answer word; --answer-words 1 isolates the per-message cost.
+
+    python -m benchmarks.bench_chat_transport --messages 200 --answer-words 1
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+
+def summary(name: str, latencies: list, sent: int):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{name:<11}{statistics.mean(latencies):>9.2f}{statistics.median(latencies):>9.2f}{p95:>9.2f}"
+          f"{sent / len(latencies):>16.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200, help="messages per transport, in one conversation")
+    parser.add_argument("--answer-words", type=int, default=60)
+    parser.add_argument("--history", type=int, default=20, help="messages of history kept (both transports)")
+    args = parser.parse_args()
+
+    from fastapi.testclient import TestClient
+
+    from app.db.base import Base
+    from app.db.session import get_db
+    from app.main import app
+    from app.models.models import ChatBot, Document, User
+    from app.routes import document
+    from app.setting import current_config
+    from app.utils.auth import get_current_user
+    from app.utils.message_writer import message_writer
+    from app.utils.usage import usage_meter
+
+    workdir = tempfile.mkdtemp(prefix="bench_chat_transport_")
+    engine = create_engine(f"sqlite:///{os.path.join(workdir, 'chat.db')}", connect_args={"check_same_thread": False})
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    user_id = uuid.uuid4()
+    with Session() as db:
+        db.add(User(id=user_id, email="bench@example.com", hashed_password="x"))
+        doc = Document(id="bench-doc", user_id=user_id, filename="a.pdf", filepath="a.pdf", file_type="pdf")
+        db.add(ChatBot(id="bench-bot", user_id=user_id, name="Bench", system_prompt="p", welcome_message="Hi",
+                       theme="light", primary_color="#000", documents=[doc]))
+        db.commit()
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    answer = " ".join(["word"] * args.answer_words)
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_current_user] = lambda: user_id
+    document.precess_pdf.query_collection = lambda query, filter, tenant=None, timeout=None, query_vector=None: [["passage"]]
+    document.precess_pdf.get_ai_response = lambda *args, **kwargs: answer
+    document.precess_pdf.stream_ai_response = lambda *args, **kwargs: iter(answer.split(" "))
+    current_config.CHATBOT_RATE_LIMIT_PER_MINUTE = current_config.VISITOR_RATE_LIMIT_PER_MINUTE = 10 ** 9
+    current_config.CHAT_WS_HISTORY_MESSAGES = args.history
+    usage_meter.session_factory = message_writer.session_factory = Session
+
+    print(f"messages={args.messages} answer_words={args.answer_words} history={args.history}")
+    print(f"{'transport':<11}{'mean ms':>9}{'p50 ms':>9}{'p95 ms':>9}{'bytes sent/msg':>16}")
+    with TestClient(app) as client:
+        latencies, sent, history = [], 0, []
+        for i in range(args.messages):
+            payload = json.dumps({"query": f"question {i}?", "document_id": ["bench-doc"], "chatbot_id": "bench-bot",
+                                  "messageHistory": history})
+            start = time.perf_counter()
+            response = client.post("/chatbots/chat", content=payload, headers={"Content-Type": "application/json"})
+            latencies.append((time.perf_counter() - start) * 1000)
+            sent += len(payload)
+            history = (history + [{"role": "user", "content": f"question {i}?"},
+                                  {"role": "assistant", "content": response.json()}])[-args.history:]
+        summary("POST", latencies, sent)
+
+        latencies, sent = [], 0
+        with client.websocket_connect("/chatbots/ws/chat?chatbot_id=bench-bot") as ws:
+            ws.receive_json()
+            for i in range(args.messages):
+                frame = json.dumps({"type": "message", "content": f"question {i}?"})
+                start = time.perf_counter()
+                ws.send_text(frame)
+                while ws.receive_json()["type"] != "done":
+                    pass
+                latencies.append((time.perf_counter() - start) * 1000)
+                sent += len(frame)
+        summary("WebSocket", latencies, sent)
+    message_writer.flush()
+    app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Compare the structure-aware chunker with the old per-page character splitter.
+
+Reports chunk count, tiny chunks, sentences cut at page breaks, estimated index
+size and throughput on synthetic page text (no PDF parsing involved).
+
+    python -m benchmarks.bench_chunking --pages 2000 --words 400
+"""
+import argparse
+import random
+import time
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from app.utils.chunking import StructuredChunker, estimate_tokens
+from benchmarks._common import synthetic_text
+
+EMBEDDING_BYTES = 1536 * 4  # one float32 text-embedding-3-small vector
+
+
+def synthetic_pages(pages: int, words: int, seed: int = 0) -> list:
+    """One flowing document cut into pages at a fixed line count, so sentences run across page breaks."""
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(max(1, pages // 4)):
+        lines.extend(synthetic_text(words * 4, rng))
+    per_page = max(1, len(lines) // pages)
+    return [
+        (number + 1, "\n".join(lines[number * per_page:(number + 1) * per_page]))
+        for number in range(pages)
+    ]
+
+
+def legacy_chunks(pages: list) -> list:
+    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+    chunks = []
+    for _, text in pages:
+        chunks.extend(splitter.split_text(text))
+    return chunks
+
+
+def structured_chunks(pages: list, chunk_size: int, chunk_overlap: int) -> list:
+    chunker = StructuredChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return [chunk.text for chunk in chunker.chunk_pages(pages)]
+
+
+def measure(name: str, func, pages: list, tiny_tokens: int, repeat: int) -> dict:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = func(pages)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tokens = [estimate_tokens(chunk) for chunk in chunks]
+    text_bytes = sum(len(chunk.encode()) for chunk in chunks)
+    return {
+        "name": name,
+        "chunks": len(chunks),
+        "tiny": sum(1 for t in tokens if t < tiny_tokens),
+        "cut_sentences": sum(1 for chunk in chunks if not chunk.rstrip().endswith((".", "!", "?"))),
+        "mean_tokens": sum(tokens) / len(tokens) if tokens else 0,
+        "index_mb": (text_bytes + len(chunks) * EMBEDDING_BYTES) / 2**20,
+        "pages_per_s": len(pages) / best,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--words", type=int, default=400, help="words per page")
+    parser.add_argument("--chunk-size", type=int, default=125, help="tokens")
+    parser.add_argument("--chunk-overlap", type=int, default=12, help="tokens")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pages = synthetic_pages(args.pages, args.words)
+    tiny = args.chunk_size // 4
+    rows = [
+        measure("recursive 500/50 chars", legacy_chunks, pages, tiny, args.repeat),
+        measure(
+            f"structured {args.chunk_size}/{args.chunk_overlap} tok",
+            lambda p: structured_chunks(p, args.chunk_size, args.chunk_overlap),
+            pages, tiny, args.repeat,
+        ),
+    ]
+
+    print(f"pages={args.pages} words/page={args.words}")
+    print(f"{'splitter':<28}{'chunks':>8}{'tiny':>7}{'cut':>7}{'mean tok':>10}{'index MB':>10}{'pages/s':>10}")
+    for row in rows:
+        print(
+            f"{row['name']:<28}{row['chunks']:>8}{row['tiny']:>7}{row['cut_sentences']:>7}"
+            f"{row['mean_tokens']:>10.1f}{row['index_mb']:>10.2f}{row['pages_per_s']:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
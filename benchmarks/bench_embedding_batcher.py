@@ -0,0 +1,87 @@
+"""
+Query embedding throughput and latency with and without micro-batching.
+
+Simulates an embedding API with a fixed round-trip cost per request, a small
+cost per text, and a bounded number of concurrent connections, as with a real
+HTTP client pool and a requests-per-minute quota. Many concurrent clients each
+embed a stream of short queries, first one request per query, then through
+EmbeddingBatcher.
+
+    python -m benchmarks.bench_embedding_batcher --clients 128 --round-trip-ms 40
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from app.utils.embedding_batcher import EmbeddingBatcher
+from benchmarks._common import HashEmbeddingFunction
+
+
+class SimulatedEmbeddingAPI:
+    def __init__(self, round_trip_ms: float, per_text_ms: float, connections: int):
+        self.round_trip = round_trip_ms / 1000
+        self.per_text = per_text_ms / 1000
+        self.connections = threading.Semaphore(connections)
+        self.function = HashEmbeddingFunction()
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, input):
+        with self.connections:
+            time.sleep(self.round_trip + self.per_text * len(input))
+            with self._lock:
+                self.requests += 1
+            return self.function(input)
+
+
+def run(embed, clients: int, queries_per_client: int):
+    latencies = []
+    lock = threading.Lock()
+
+    def client(client_id: int):
+        local = []
+        for i in range(queries_per_client):
+            start = time.perf_counter()
+            embed(f"client {client_id} asks question number {i} about the refund policy")
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(client, range(clients)))
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, np.percentile(latencies, 50) * 1000, np.percentile(latencies, 99) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=128)
+    parser.add_argument("--queries", type=int, default=10, help="queries per client")
+    parser.add_argument("--round-trip-ms", type=float, default=40)
+    parser.add_argument("--per-text-ms", type=float, default=0.2)
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--window-ms", type=float, default=5)
+    parser.add_argument("--max-size", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"clients={args.clients} queries/client={args.queries} round_trip={args.round_trip_ms}ms "
+          f"connections={args.connections} window={args.window_ms}ms max_size={args.max_size}")
+    print(f"{'mode':<10}{'queries/s':>11}{'p50 ms':>9}{'p99 ms':>9}{'API requests':>14}")
+
+    api = SimulatedEmbeddingAPI(args.round_trip_ms, args.per_text_ms, args.connections)
+    throughput, p50, p99 = run(lambda text: api([text])[0], args.clients, args.queries)
+    print(f"{'direct':<10}{throughput:>11.0f}{p50:>9.1f}{p99:>9.1f}{api.requests:>14}")
+
+    api = SimulatedEmbeddingAPI(args.round_trip_ms, args.per_text_ms, args.connections)
+    batcher = EmbeddingBatcher(api, window_ms=args.window_ms, max_size=args.max_size, concurrency=args.concurrency)
+    throughput, p50, p99 = run(batcher.embed, args.clients, args.queries)
+    print(f"{'batched':<10}{throughput:>11.0f}{p50:>9.1f}{p99:>9.1f}{api.requests:>14}")
+
+
+if __name__ == "__main__":
+    main()
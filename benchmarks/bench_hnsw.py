@@ -0,0 +1,158 @@
+"""
+Recall, latency and memory of Chroma's HNSW index over a grid of settings.
+
+Chunks a sample corpus with the app's chunker, embeds it once, then builds a
+collection for every (space, M, construction ef) combination and queries it
+at each search ef. Recall@k is measured against exact brute-force search in
+the same space; a result counts as a hit when it is at least as close as the
+k-th exact neighbour, so ties do not count as misses. Size is the persisted
+collection (vectors plus HNSW graph), all of which is held in memory while
+serving.
+
+    python -m benchmarks.bench_hnsw --chunks 20000 --m 8,16,32 --construction-ef 100,200 --search-ef 10,50,100,200
+    python -m benchmarks.bench_hnsw --corpus ./pdfs --provider openai --k 13
+"""
+import argparse
+import glob
+import itertools
+import os
+import random
+import shutil
+import tempfile
+import time
+from dataclasses import replace
+
+import chromadb
+import numpy as np
+
+from app.utils.chunking import StructuredChunker
+from app.utils.index_settings import IndexSettings
+from benchmarks._common import HashEmbeddingFunction, synthetic_text
+
+
+def int_list(value: str) -> list:
+    return [int(part) for part in value.split(",") if part]
+
+
+def load_corpus(corpus: str, chunks: int, seed: int) -> list:
+    """Chunk texts from the PDFs under `corpus`, or synthetic pages when none is given."""
+    chunker = StructuredChunker()
+    if corpus:
+        from langchain_community.document_loaders import PyPDFLoader
+
+        texts = []
+        for path in sorted(glob.glob(os.path.join(corpus, "**", "*.pdf"), recursive=True)):
+            pages = ((i + 1, page.page_content) for i, page in enumerate(PyPDFLoader(path).lazy_load()))
+            texts.extend(chunk.text for chunk in chunker.chunk_pages(pages))
+            if len(texts) >= chunks:
+                break
+        return texts[:chunks]
+
+    rng = random.Random(seed)
+    texts, page = [], 1
+    while len(texts) < chunks:
+        text = "\n".join(synthetic_text(400, rng))
+        texts.extend(chunk.text for chunk in chunker.chunk_pages([(page, text)]))
+        page += 1
+    return texts[:chunks]
+
+
+def embedder(provider: str, dimension: int):
+    if provider == "hash":
+        return HashEmbeddingFunction(dimension=dimension)
+    from app.utils.embeddings import get_embedding_provider
+
+    return get_embedding_provider(provider).function
+
+
+def embed(function, texts: list, batch: int = 256) -> np.ndarray:
+    vectors = []
+    for offset in range(0, len(texts), batch):
+        vectors.extend(function(texts[offset:offset + batch]))
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def distances(space: str, vectors: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Chroma's distance functions: squared L2, 1 - cosine similarity, 1 - inner product."""
+    if space == "l2":
+        return ((vectors - query) ** 2).sum(axis=1)
+    if space == "cosine":
+        norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+        return 1 - (vectors @ query) / np.where(norms == 0, 1, norms)
+    return 1 - vectors @ query
+
+
+def directory_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="directory of PDFs (default: synthetic pages)")
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=13)
+    parser.add_argument("--provider", default="hash", help="hash (offline), openai or local")
+    parser.add_argument("--dimension", type=int, default=384, help="hash provider only")
+    parser.add_argument("--space", default="l2,cosine")
+    parser.add_argument("--m", type=int_list, default=[8, 16, 32])
+    parser.add_argument("--construction-ef", type=int_list, default=[100, 200])
+    parser.add_argument("--search-ef", type=int_list, default=[10, 50, 100, 200])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    texts = load_corpus(args.corpus, args.chunks + args.queries, args.seed)
+    random.Random(args.seed).shuffle(texts)
+    documents, questions = texts[args.queries:], texts[:args.queries]
+    function = embedder(args.provider, args.dimension)
+    start = time.perf_counter()
+    vectors, queries = embed(function, documents), embed(function, questions)
+    print(f"chunks={len(documents)} queries={len(questions)} dimension={vectors.shape[1]} k={args.k} "
+          f"provider={args.provider} (embedded in {time.perf_counter() - start:.1f}s)")
+    print(f"{'space':<8}{'M':>4}{'c_ef':>6}{'s_ef':>6}{'recall@k':>10}{'p50 ms':>9}{'p99 ms':>9}"
+          f"{'build s':>9}{'size MB':>9}")
+
+    ids = [str(i) for i in range(len(documents))]
+    for space in args.space.split(","):
+        exact_kth = []
+        for query in queries:
+            exact_kth.append(np.partition(distances(space, vectors, query), args.k - 1)[args.k - 1])
+
+        for m, construction_ef in itertools.product(args.m, args.construction_ef):
+            workdir = tempfile.mkdtemp(prefix="bench_hnsw_")
+            try:
+                settings = IndexSettings(space=space, m=m, construction_ef=construction_ef, top_k=args.k)
+                build_dir = os.path.join(workdir, "build")
+                collection = chromadb.PersistentClient(path=build_dir).create_collection(
+                    "bench", configuration=settings.configuration(), embedding_function=None
+                )
+                start = time.perf_counter()
+                for offset in range(0, len(ids), 5000):
+                    collection.add(ids=ids[offset:offset + 5000], embeddings=vectors[offset:offset + 5000])
+                build = time.perf_counter() - start
+                size_mb = directory_bytes(build_dir) / 2 ** 20
+
+                for search_ef in args.search_ef:
+                    # A loaded index keeps the search ef it was opened with, so each
+                    # setting is measured on a fresh copy, as after a restart
+                    copy_dir = os.path.join(workdir, f"ef{search_ef}")
+                    shutil.copytree(build_dir, copy_dir)
+                    collection = chromadb.PersistentClient(path=copy_dir).get_collection("bench", embedding_function=None)
+                    replace(settings, search_ef=search_ef).apply(collection)
+                    latency, hits = [], 0
+                    for query, kth in zip(queries, exact_kth):
+                        start = time.perf_counter()
+                        result = collection.query(query_embeddings=[query], n_results=args.k, include=["distances"])
+                        latency.append(time.perf_counter() - start)
+                        # Compare with numpy's distances, so float rounding in the index cannot cost recall
+                        found = [int(vector_id) for vector_id in result["ids"][0]]
+                        hits += int((distances(space, vectors[found], query) <= kth + 1e-6).sum())
+                    print(f"{space:<8}{m:>4}{construction_ef:>6}{search_ef:>6}"
+                          f"{hits / (args.k * len(queries)):>10.3f}{np.percentile(latency, 50) * 1000:>9.2f}"
+                          f"{np.percentile(latency, 99) * 1000:>9.2f}{build:>9.1f}{size_mb:>9.1f}")
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
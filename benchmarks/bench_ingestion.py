@@ -0,0 +1,186 @@
+"""
+Ingestion throughput benchmark for ProcessPdfDocument.process_pdf.
+
+Generates a synthetic PDF, runs it through the real pipeline with a stubbed
+embedding function and a throwaway Chroma store, and reports pages/s, chunks/s,
+per-stage timings, time until the first batch of chunks is queryable and
+peak memory.
+
+    python -m benchmarks.bench_ingestion --pages 200 --words 400
+    python -m benchmarks.bench_ingestion --save-baseline
+"""
+import argparse
+import contextlib
+import os
+import resource
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import chromadb
+
+from app.utils import process_pdf as process_pdf_module
+from app.utils.process_pdf import ProcessPdfDocument
+from benchmarks._common import (
+    HashEmbeddingFunction,
+    compare_to_baseline,
+    load_baseline,
+    make_synthetic_pdf,
+    save_baseline,
+)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "ingestion.json")
+REPORT_KEYS = [
+    "total_s", "first_chunk_s", "extract_s", "chunk_s", "embed_s", "chroma_add_s",
+    "pages_per_s", "chunks_per_s", "peak_python_mb", "max_rss_mb",
+]
+
+
+class StageTimer:
+    def __init__(self):
+        self.seconds = {}
+
+    def add(self, stage: str, elapsed: float):
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + elapsed
+
+    def wrap(self, stage: str, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+        return timed
+
+    def wrap_iter(self, stage: str, iterator):
+        """Time every step of a lazy iterator, excluding the consumer's work."""
+        iterator = iter(iterator)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(stage, time.perf_counter() - start)
+                return
+            self.add(stage, time.perf_counter() - start)
+            yield item
+
+
+def timed_loader(timer: StageTimer):
+    """Subclass of the pipeline's PDF loader that records extraction time."""
+    base = process_pdf_module.PyPDFLoader
+
+    class TimedLoader(base):
+        # load() is list(self.lazy_load()), so timing the iterator covers both.
+        def lazy_load(self):
+            return timer.wrap_iter("extract", super().lazy_load())
+
+    return TimedLoader
+
+
+def run_once(workdir: str, pdf_path: str, embedding_function: HashEmbeddingFunction,
+             batch_chunks: int = None) -> dict:
+    timer = StageTimer()
+    client = chromadb.PersistentClient(path=os.path.join(workdir, "chroma_db"))
+    pipeline = ProcessPdfDocument(client=client, embedding_function=embedding_function)
+    if batch_chunks:
+        pipeline.batch_chunks = batch_chunks
+
+    chunk_counter = {"chunks": 0}
+    chunk_pages = pipeline.chunker.chunk_pages
+
+    def counting_chunk_pages(pages):
+        # Pages are extracted lazily while chunking, so this stage includes
+        # extraction time; it is subtracted out below.
+        for chunk in timer.wrap_iter("chunk+extract", chunk_pages(pages)):
+            chunk_counter["chunks"] += 1
+            yield chunk
+
+    pipeline.chunker.chunk_pages = counting_chunk_pages
+    saved_at = []
+    save_vector = timer.wrap("save_vector", pipeline.save_vector)
+
+    def recording_save_vector(*args, **kwargs):
+        save_vector(*args, **kwargs)
+        saved_at.append(time.perf_counter())
+
+    pipeline.save_vector = recording_save_vector
+
+    user_id = "benchmark-user"
+    os.makedirs(os.path.join(workdir, user_id), exist_ok=True)
+    shutil.copy(pdf_path, os.path.join(workdir, user_id, os.path.basename(pdf_path)))
+
+    original_loader = process_pdf_module.PyPDFLoader
+    process_pdf_module.PyPDFLoader = timed_loader(timer)
+    cwd = os.getcwd()
+    tracemalloc.start()
+    try:
+        os.chdir(workdir)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            pipeline.process_pdf(user_id, os.path.basename(pdf_path), "benchmark-doc")
+            total = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        os.chdir(cwd)
+        process_pdf_module.PyPDFLoader = original_loader
+
+    embed = embedding_function.seconds
+    return {
+        "total_s": total,
+        "first_chunk_s": saved_at[0] - start if saved_at else total,
+        "extract_s": timer.seconds.get("extract", 0.0),
+        "chunk_s": max(timer.seconds.get("chunk+extract", 0.0) - timer.seconds.get("extract", 0.0), 0.0),
+        "embed_s": embed,
+        "chroma_add_s": max(timer.seconds.get("save_vector", 0.0) - embed, 0.0),
+        "chunks": chunk_counter["chunks"],
+        "peak_python_mb": peak / 2**20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--words", type=int, default=400, help="words per page")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="simulated latency per embedding call")
+    parser.add_argument("--batch-chunks", type=int, help="chunks per saved batch (default: INGEST_BATCH_CHUNKS)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    runs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = make_synthetic_pdf(os.path.join(tmp, "synthetic.pdf"), args.pages, args.words)
+        for i in range(args.repeat):
+            workdir = os.path.join(tmp, f"run{i}")
+            os.makedirs(workdir)
+            runs.append(run_once(workdir, pdf_path, HashEmbeddingFunction(latency_ms=args.embed_latency_ms),
+                                 args.batch_chunks))
+
+    best = min(runs, key=lambda run: run["total_s"])
+    report = dict(best)
+    report.update({
+        "pages": args.pages,
+        "words_per_page": args.words,
+        "pages_per_s": args.pages / best["total_s"],
+        "chunks_per_s": best["chunks"] / best["total_s"],
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    })
+
+    print(f"pages={args.pages} words/page={args.words} chunks={best['chunks']} (best of {args.repeat})")
+    for key in REPORT_KEYS:
+        print(f"  {key:<18}{report[key]:>12.3f}")
+
+    baseline = load_baseline(args.baseline)
+    if baseline:
+        print()
+        compare_to_baseline(report, baseline, REPORT_KEYS)
+    if args.save_baseline:
+        save_baseline(args.baseline, report)
+
+
+if __name__ == "__main__":
+    main()
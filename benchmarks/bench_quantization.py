@@ -0,0 +1,148 @@
+"""
+Worker memory, latency and recall of the compact vector storage modes against Chroma.
+
+Stores the same clustered synthetic vectors in a Chroma collection and in its
+vector log, then answers the same queries in a fresh process per mode: one
+querying Chroma's float32 HNSW index, and one per compact mode, searching the
+quantized codes and re-scoring from the logged float vectors as
+`query_collection` does. Each process reports its real RSS once every query has
+run, less its RSS before the collection was first read, split into anonymous
+memory (held by the worker) and file-backed pages (the page cache, shared
+between workers and reclaimable). "index MB" extrapolates the compact index's
+own size to one million chunks. Recall is measured against exact search.
+
+    python -m benchmarks.bench_quantization --vectors 200000 --dimension 1536
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+
+def clustered_vectors(n: int, dimension: int, clusters: int = 200, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension)).astype(np.float32)
+    noise = rng.normal(scale=0.5, size=(n, dimension)).astype(np.float32)
+    return centers[rng.integers(0, clusters, n)] + noise
+
+
+def percentile(values: list, q: float) -> float:
+    return float(np.percentile(values, q)) * 1000
+
+
+def memory_kb() -> dict:
+    with open("/proc/self/status") as f:
+        fields = dict(line.split(":", 1) for line in f)
+    return {name: int(fields[name].split()[0]) for name in ("VmRSS", "RssAnon", "RssFile")}
+
+
+def worker(args):
+    """Answer the queries with one storage mode in this process; print its RSS growth and latencies."""
+    import chromadb
+
+    from app.setting import current_config
+    from app.utils.vector_index import CompactIndexCache
+
+    current_config.PQ_SUBVECTORS = args.pq_subvectors
+    queries = clustered_vectors(args.queries, args.dimension, seed=1)
+    collection = chromadb.PersistentClient(path=os.path.join(args.workdir, "chroma")).get_collection("documents")
+    before = memory_kb()
+
+    results, latency, index_bytes = [], [], None
+    if args.worker == "chroma":
+        for query in queries:
+            start = time.perf_counter()
+            found = collection.query(query_embeddings=[query], n_results=args.k, include=["documents"])
+            latency.append(time.perf_counter() - start)
+            results.append(found["ids"][0])
+    else:
+        index = CompactIndexCache(args.worker, os.path.join(args.workdir, "vector_log"), refresh_seconds=0).get(
+            collection
+        )
+        factor = args.pq_rescore_factor if args.worker == "pq" else args.rescore_factor
+        for query in queries:
+            start = time.perf_counter()
+            ids = [vector_id for vector_id, _ in index.search(query, args.k * factor)]
+            vectors, _ = index.stored(ids)  # documents are read too, as query_collection does
+            results.append([vector_id for vector_id, _ in index.rescore(query, ids, vectors, args.k)])
+            latency.append(time.perf_counter() - start)
+        index_bytes = index.memory_bytes()
+
+    after = memory_kb()
+    print(json.dumps({
+        "memory": {name: (after[name] - before[name]) / 1024 for name in after},
+        "rss": after["VmRSS"] / 1024, "latency": latency, "results": results, "index_bytes": index_bytes,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=13)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--pq-rescore-factor", type=int, default=10)
+    parser.add_argument("--pq-subvectors", type=int, default=96)
+    parser.add_argument("--documents", type=int, default=1000, help="distinct document ids in the metadata")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        return worker(args)
+
+    import chromadb
+
+    from app.utils.vector_index import VectorLog
+
+    vectors = clustered_vectors(args.vectors, args.dimension)
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = clustered_vectors(args.queries, args.dimension, seed=1)
+    exact = []
+    for query in queries:
+        scores = normalized @ (query / np.linalg.norm(query))
+        exact.append({str(i) for i in np.argpartition(-scores, args.k)[:args.k]})
+
+    workdir = tempfile.mkdtemp(prefix="bench_quantization_")
+    start = time.perf_counter()
+    collection = chromadb.PersistentClient(path=os.path.join(workdir, "chroma")).create_collection(
+        "documents", embedding_function=None, configuration={"hnsw": {"space": "cosine"}}
+    )
+    for offset in range(0, args.vectors, 5000):
+        rows = range(offset, min(offset + 5000, args.vectors))
+        collection.add(
+            ids=[str(i) for i in rows], embeddings=vectors[offset:offset + len(rows)],
+            documents=[f"chunk {i}" for i in rows],
+            metadatas=[{"user_id": f"user-{i % 50}", "id": f"doc-{i % args.documents}"} for i in rows],
+        )
+    VectorLog(os.path.join(workdir, "vector_log", "documents")).export(collection)
+    print(f"vectors={args.vectors} dimension={args.dimension} k={args.k} queries={args.queries} "
+          f"(stored in {time.perf_counter() - start:.0f}s)")
+    print("worker memory after the queries, MB (anonymous = held by the worker, file = shared page cache)")
+    print(f"{'mode':<10}{'RSS':>8}{'+anon':>8}{'+file':>8}{'index MB/1M':>13}{'p50 ms':>9}{'p99 ms':>9}"
+          f"{'recall@k':>10}")
+
+    for mode in ("chroma", "float16", "int8", "pq"):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_quantization", "--worker", mode, "--workdir", workdir,
+             *sys.argv[1:]],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        report = json.loads(output.strip().splitlines()[-1])
+        hits = sum(len(expected & set(found)) for expected, found in zip(exact, report["results"]))
+        index_mb = (
+            f"{report['index_bytes'] * 1_000_000 / args.vectors / 2**20:.0f}" if report["index_bytes"] else "-"
+        )
+        print(f"{'float32' if mode == 'chroma' else mode:<10}{report['rss']:>8.0f}"
+              f"{report['memory']['RssAnon']:>8.0f}{report['memory']['RssFile']:>8.0f}{index_mb:>13}"
+              f"{percentile(report['latency'], 50):>9.2f}{percentile(report['latency'], 99):>9.2f}"
+              f"{hits / (args.k * args.queries):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
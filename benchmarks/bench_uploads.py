@@ -0,0 +1,197 @@
+"""
+Many-file upload throughput: the old per-file path against the shared executor.
+
+Runs against moto's in-process S3 with a simulated round trip and per-stream
+bandwidth added to every S3 request, so parallel streams and multipart parts
+pay off the way they do against real S3.
+
+The legacy path uploads files one after another, builds a new thread pool for
+each file and sends every file as a single PUT. The current path is
+DocumentStore.put_many: all files at once on the shared executor, multipart
+above the threshold.
+
+The ingestion leg then indexes --ingest-files synthetic PDFs through the real
+pipeline, with a stubbed embedding function that waits --embed-latency-ms per
+call. The sequential path runs ingest_uploaded_document once per file, as the
+old one-background-task-per-file upload did; the parallel path is
+ingest_uploaded_documents on the shared ingestion executor.
+
+    python -m benchmarks.bench_uploads --files 20 --size-mb 2 --large-files 2 --large-size-mb 40
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from boto3.s3.transfer import TransferConfig
+
+from app.setting import current_config
+
+try:
+    from moto import mock_aws
+except ImportError:  # pragma: no cover
+    raise SystemExit("bench_uploads needs moto: pip install moto")
+
+
+def body_size(body) -> int:
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    position = body.tell()
+    body.seek(0, os.SEEK_END)
+    size = body.tell() - position
+    body.seek(position)
+    return size
+
+
+def add_network(client, round_trip_ms: float, bandwidth_mb: float):
+    def delay(params, **kwargs):
+        time.sleep(round_trip_ms / 1000 + body_size(params.get("body")) / (bandwidth_mb * 1024 * 1024))
+
+    client.meta.events.register("before-call.s3", delay)
+
+
+def save_to_local(payload: bytes, filename: str, user_id: str):
+    """The local copy the legacy path wrote next to every upload."""
+    os.makedirs(user_id, exist_ok=True)
+    with open(os.path.join(user_id, filename), "wb") as f:
+        f.write(payload)
+
+
+def legacy_upload(helper, files, user_id):
+    single_put = TransferConfig(multipart_threshold=1024 ** 4)
+    for payload, filename in files:
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            s3 = executor.submit(
+                helper.s3_client.upload_fileobj, io.BytesIO(payload), helper.s3_bucket_name,
+                f"{user_id}/{filename}", Config=single_put,
+            )
+            local = executor.submit(save_to_local, payload, filename, user_id)
+            local.result()
+            s3.result()
+
+
+USER_ID = uuid.UUID("00000000-0000-0000-0000-00000000b0b0")
+
+
+def bench_ingestion(workdir: str, files: int, pages: int, embed_latency_ms: float):
+    import chromadb
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app.models.models import Base, Document
+    from app.routes import document
+    from app.utils.ingestion import ingestion_tracker
+    from app.utils.process_pdf import ProcessPdfDocument
+    from app.utils.storage import DiskCache, DocumentStore, LocalBackend
+    from benchmarks._common import HashEmbeddingFunction, make_synthetic_pdf
+
+    engine = create_engine(f"sqlite:///{os.path.join(workdir, 'ingest.db')}")
+    Base.metadata.create_all(engine)
+    ingestion_tracker.session_factory = sessionmaker(bind=engine)
+    store = DocumentStore(LocalBackend(os.path.join(workdir, "storage")), DiskCache(os.path.join(workdir, "docs"), 0))
+    document.precess_pdf = ProcessPdfDocument(
+        client=chromadb.PersistentClient(path=os.path.join(workdir, "chroma")),
+        embedding_function=HashEmbeddingFunction(latency_ms=embed_latency_ms),
+        document_store=store, progress=ingestion_tracker,
+    )
+    pdf = make_synthetic_pdf(os.path.join(workdir, "synthetic.pdf"), pages, 400)
+
+    def upload(path: str) -> list:
+        uploads = []
+        with ingestion_tracker.session_factory() as db:
+            for i in range(files):
+                key = f"{path}/doc{i}.pdf"
+                with open(pdf, "rb") as f:
+                    store.put(key, f)
+                db.add(Document(id=key, user_id=USER_ID, filename=f"doc{i}.pdf", filepath=key,
+                                file_type="pdf", status="processing", storage_key=key))
+                uploads.append((key, key, f"doc{i}.pdf"))
+            db.commit()
+        return uploads
+
+    print(f"ingestion: files={files} pages={pages} embed_latency={embed_latency_ms}ms "
+          f"workers={current_config.INGEST_WORKERS}")
+    print(f"{'path':<12}{'seconds':>9}{'files/s':>9}")
+    for path in ("sequential", "parallel"):
+        uploads = upload(path)
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            if path == "sequential":
+                for document_id, key, filename in uploads:
+                    document.ingest_uploaded_document(document_id, USER_ID, key, filename)
+            else:
+                document.ingest_uploaded_documents(uploads, USER_ID)
+        elapsed = time.perf_counter() - start
+        print(f"{path:<12}{elapsed:>9.2f}{files / elapsed:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--size-mb", type=float, default=2)
+    parser.add_argument("--large-files", type=int, default=2)
+    parser.add_argument("--large-size-mb", type=float, default=40)
+    parser.add_argument("--round-trip-ms", type=float, default=30)
+    parser.add_argument("--bandwidth-mb", type=float, default=20, help="per-stream MB/s")
+    parser.add_argument("--ingest-files", type=int, default=8)
+    parser.add_argument("--pages", type=int, default=20, help="pages per ingested PDF")
+    parser.add_argument("--embed-latency-ms", type=float, default=200, help="simulated latency per embedding call")
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+    current_config.S3_UPLOADS_ENABLED = True
+    current_config.S3_BUCKET_NAME = "cleary-benchmark"
+
+    files = [(os.urandom(int(args.size_mb * 1024 * 1024)), f"doc{i}.pdf") for i in range(args.files)]
+    files += [(os.urandom(int(args.large_size_mb * 1024 * 1024)), f"large{i}.pdf") for i in range(args.large_files)]
+    total_mb = sum(len(payload) for payload, _ in files) / 1024 / 1024
+
+    print(f"files={len(files)} total={total_mb:.0f}MB round_trip={args.round_trip_ms}ms "
+          f"bandwidth={args.bandwidth_mb}MB/s per stream workers={current_config.UPLOAD_WORKERS} "
+          f"part={current_config.S3_MULTIPART_CHUNK_MB}MB x{current_config.S3_MAX_CONCURRENCY}")
+    print(f"{'path':<10}{'seconds':>9}{'MB/s':>8}")
+
+    from app.utils.process_pdf import AWSHelper
+    from app.utils.storage import DiskCache, DocumentStore, S3Backend
+
+    workdir = tempfile.mkdtemp(prefix="bench_uploads_")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        with mock_aws():
+            helper = AWSHelper()
+            helper.s3_client.create_bucket(
+                Bucket=helper.s3_bucket_name,
+                CreateBucketConfiguration={"LocationConstraint": helper.aws_region},
+            )
+            add_network(helper.s3_client, args.round_trip_ms, args.bandwidth_mb)
+
+            start = time.perf_counter()
+            legacy_upload(helper, files, "legacy")
+            elapsed = time.perf_counter() - start
+            print(f"{'legacy':<10}{elapsed:>9.2f}{total_mb / elapsed:>8.1f}")
+
+            store = DocumentStore(
+                S3Backend(helper.s3_client, helper.s3_bucket_name, helper.transfer_config),
+                DiskCache(os.path.join(workdir, "cache"), 0),
+                executor=helper.executor,
+            )
+            start = time.perf_counter()
+            store.put_many([(f"shared/{name}", io.BytesIO(payload), "application/pdf") for payload, name in files])
+            elapsed = time.perf_counter() - start
+            print(f"{'shared':<10}{elapsed:>9.2f}{total_mb / elapsed:>8.1f}")
+            helper.executor.shutdown()
+        bench_ingestion(workdir, args.ingest_files, args.pages, args.embed_latency_ms)
+    finally:
+        os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
@@ -37,4 +37,76 @@ def client(db_session):
     app.dependency_overrides[get_db] = override_get_db
     with TestClient(app) as test_client:
         yield test_client
-    app.dependency_overrides.clear()
\ No newline at end of file
+    app.dependency_overrides.clear()
+
+@pytest.fixture(autouse=True)
+def chat_admission(monkeypatch):
+    """Fresh, in-memory and generous chat limits so unrelated tests are never throttled."""
+    from app.setting import current_config
+    from app.utils.rate_limit import MemoryBucketStore, chat_rate_limiter, llm_gate
+
+    monkeypatch.setattr(current_config, "CHATBOT_RATE_LIMIT_PER_MINUTE", 100000)
+    monkeypatch.setattr(current_config, "VISITOR_RATE_LIMIT_PER_MINUTE", 100000)
+    monkeypatch.setattr(chat_rate_limiter, "_store", MemoryBucketStore())
+    chat_rate_limiter._limits.clear()
+    llm_gate._semaphore = None
+    yield chat_rate_limiter
+    chat_rate_limiter._limits.clear()
+    llm_gate._semaphore = None
+
+
+@pytest.fixture(autouse=True)
+def usage(monkeypatch):
+    """Usage counters flush to the test database and start empty."""
+    from app.utils.usage import usage_meter
+
+    monkeypatch.setattr(usage_meter, "session_factory", TestingSessionLocal)
+    usage_meter._pending.clear()
+    yield usage_meter
+    usage_meter._pending.clear()
+
+
+@pytest.fixture
+def session_factory(db_session):
+    """Creates sessions on the test database (with its tables) for code that opens its own."""
+    return TestingSessionLocal
+
+
+@pytest.fixture(autouse=True)
+def answer_banks(monkeypatch):
+    """Answer bank builds read the test database."""
+    from app.utils.answer_bank import answer_bank
+
+    monkeypatch.setattr(answer_bank, "session_factory", TestingSessionLocal)
+    yield answer_bank
+
+
+@pytest.fixture(autouse=True)
+def ingestion_progress(monkeypatch):
+    """Ingestion progress is written to the test database."""
+    from app.utils.ingestion import ingestion_tracker
+
+    monkeypatch.setattr(ingestion_tracker, "session_factory", TestingSessionLocal)
+    yield ingestion_tracker
+
+
+@pytest.fixture(autouse=True)
+def circuit_breakers():
+    """Every test starts with closed breakers."""
+    from app.utils.circuit_breaker import breakers
+
+    for breaker in breakers.values():
+        breaker.reset()
+    yield breakers
+    for breaker in breakers.values():
+        breaker.reset()
+
+
+@pytest.fixture(autouse=True)
+def messages(monkeypatch):
+    """Chat messages saved in the background go to the test database."""
+    from app.utils.message_writer import message_writer
+
+    monkeypatch.setattr(message_writer, "session_factory", TestingSessionLocal)
+    yield message_writer
+    message_writer.flush()
@@ -0,0 +1,139 @@
+from datetime import datetime, timedelta
+from uuid import UUID
+
+from app.models.models import ChatBot, ChatMessage, ChatRollup, User
+from app.routes.document import save_chat_message
+from app.utils.analytics import backfill, bucket_start, chatbot_stats
+
+USER_ID = UUID("946cc9ce-4fc0-4a32-bf27-62287f31b995")
+BASE = datetime(2024, 3, 1, 9, 15)
+
+
+def seed_chatbot(db_session, chatbot_id="bot-a"):
+    if not db_session.get(User, USER_ID):
+        db_session.add(User(id=USER_ID, email="owner@example.com", hashed_password="x"))
+    db_session.add(ChatBot(
+        id=chatbot_id, name="Support", system_prompt="", welcome_message="Hi", theme="light",
+        primary_color="#000000", user_id=USER_ID,
+    ))
+    db_session.commit()
+
+
+def add_message(db_session, sender, text, created_at, starts=None, chatbot_id="bot-a"):
+    db_session.add(ChatMessage(
+        text=text, sender=sender, created_at=created_at, user_id=USER_ID,
+        chatbot_id=chatbot_id, starts_conversation=starts,
+    ))
+
+
+def test_bucket_start():
+    assert bucket_start(BASE, "hour") == datetime(2024, 3, 1, 9)
+    assert bucket_start(BASE, "day") == datetime(2024, 3, 1)
+
+
+def test_saved_messages_update_rollups(db_session):
+    seed_chatbot(db_session)
+
+    save_chat_message(USER_ID, "bot-a", "hello", "user", db_session, starts_conversation=True)
+    save_chat_message(USER_ID, "bot-a", "hi there", "bot", db_session)
+    save_chat_message(USER_ID, "bot-a", "and?", "user", db_session, starts_conversation=False)
+    save_chat_message(USER_ID, "bot-a", "new chat", "user", db_session, starts_conversation=True)
+
+    stats = chatbot_stats(db_session, "bot-a", "hour")
+    assert stats["totals"] == {
+        "user_messages": 3, "bot_messages": 1, "conversations": 2,
+        "user_chars": 17, "bot_chars": 8, "bot_user_ratio": 1 / 3,
+    }
+    assert db_session.query(ChatRollup).count() == 2  # one hour and one day bucket
+
+
+def test_backfill_matches_live_rollups(db_session):
+    seed_chatbot(db_session)
+    for i in range(5):
+        save_chat_message(USER_ID, "bot-a", f"q{i}", "user", db_session, starts_conversation=i % 2 == 0)
+        save_chat_message(USER_ID, "bot-a", f"answer {i}", "bot", db_session)
+    live = chatbot_stats(db_session, "bot-a", "day")
+
+    db_session.query(ChatRollup).delete()
+    db_session.commit()
+    assert backfill(db_session) == 10
+
+    assert chatbot_stats(db_session, "bot-a", "day") == live
+
+
+def test_backfill_splits_legacy_history_into_conversations(db_session):
+    seed_chatbot(db_session)
+    seed_chatbot(db_session, "bot-b")
+    add_message(db_session, "user", "first", BASE)
+    add_message(db_session, "bot", "reply", BASE + timedelta(minutes=1))
+    add_message(db_session, "user", "follow up", BASE + timedelta(minutes=10))
+    add_message(db_session, "user", "next day", BASE + timedelta(days=1))
+    add_message(db_session, "user", "other bot", BASE, chatbot_id="bot-b")
+    db_session.commit()
+
+    backfill(db_session, chatbot_id="bot-a")
+
+    stats = chatbot_stats(db_session, "bot-a", "day")
+    assert [bucket["conversations"] for bucket in stats["series"]] == [1, 1]
+    assert [bucket["user_messages"] for bucket in stats["series"]] == [2, 1]
+    assert chatbot_stats(db_session, "bot-b")["series"] == []
+
+
+def test_analytics_endpoint(client, db_session):
+    seed_chatbot(db_session)
+    for day in range(3):
+        add_message(db_session, "user", "question", BASE + timedelta(days=day), starts=True)
+        add_message(db_session, "bot", "answer", BASE + timedelta(days=day, minutes=1))
+    db_session.commit()
+    backfill(db_session)
+
+    response = client.get("/chatbots/chatbot/bot-a/analytics", params={
+        "start": (BASE + timedelta(days=1)).isoformat(), "end": (BASE + timedelta(days=3)).isoformat(),
+    })
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [bucket["bucket_start"] for bucket in body["series"]] == ["2024-03-02T00:00:00", "2024-03-03T00:00:00"]
+    assert body["totals"]["conversations"] == 2
+    assert body["totals"]["bot_user_ratio"] == 1.0
+    assert client.get("/chatbots/chatbot/missing/analytics").status_code == 404
+
+
+def test_clearing_a_chat_clears_its_analytics(client, db_session):
+    seed_chatbot(db_session)
+    save_chat_message(USER_ID, "bot-a", "hello", "user", db_session, starts_conversation=True)
+    save_chat_message(USER_ID, "bot-a", "hi there", "bot", db_session)
+
+    assert client.delete("/chatbots/chatbot/bot-a/clear_user_chat").status_code == 200
+
+    db_session.expire_all()
+    assert db_session.query(ChatRollup).count() == 0
+    assert chatbot_stats(db_session, "bot-a")["totals"]["user_messages"] == 0
+
+
+
+def test_clearing_a_chat_rebuilds_only_the_days_it_touched(client, db_session):
+    seed_chatbot(db_session)
+    visitor = UUID("5d1d9a36-1f5c-4b7e-9d0e-0c6f1a2b3c4d")
+    db_session.add(User(id=visitor, email="visitor@example.com", hashed_password="x"))
+    for user_id, text, created_at in ((visitor, "visitor day one", BASE),
+                                      (USER_ID, "owner day one", BASE + timedelta(minutes=5)),
+                                      (USER_ID, "owner day two", BASE + timedelta(days=1)),
+                                      (visitor, "visitor day three", BASE + timedelta(days=2))):
+        db_session.add(ChatMessage(text=text, sender="user", created_at=created_at, user_id=user_id,
+                                   chatbot_id="bot-a", starts_conversation=True))
+    db_session.commit()
+    backfill(db_session, chatbot_id="bot-a")
+    # Mark the day the owner never chatted on, to see that it is left alone
+    day_three = bucket_start(BASE + timedelta(days=2), "day")
+    db_session.query(ChatRollup).filter(ChatRollup.bucket_start == day_three).update({"bot_chars": 99})
+    db_session.commit()
+
+    assert client.delete("/chatbots/chatbot/bot-a/clear_user_chat").status_code == 200
+
+    db_session.expire_all()
+    series = chatbot_stats(db_session, "bot-a", "day")["series"]
+    assert [(bucket["bucket_start"][:10], bucket["user_messages"], bucket["bot_chars"]) for bucket in series] == [
+        ("2024-03-01", 1, 0), ("2024-03-03", 1, 99),
+    ]
+    assert [bucket["user_messages"] for bucket in chatbot_stats(db_session, "bot-a", "hour")["series"]] == [1, 1]
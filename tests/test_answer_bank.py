@@ -0,0 +1,156 @@
+import re
+import zlib
+from uuid import UUID
+
+import chromadb
+import pytest
+from chromadb.api.types import EmbeddingFunction
+
+from app.models.models import AnswerBank, ChatBot, Document, User
+from app.routes import document
+from app.utils.answer_bank import AnswerBankBuilder, parse_questions
+from app.utils.llm_scheduler import llm_scheduler
+from app.utils.process_pdf import HandleChromadb
+
+USER_ID = UUID("946cc9ce-4fc0-4a32-bf27-62287f31b995")
+
+
+class BagOfWordsEmbeddingFunction(EmbeddingFunction):
+    def __call__(self, input):
+        vectors = []
+        for text in input:
+            vector = [0.0] * 64
+            for word in re.findall(r"\w+", text.lower()):
+                vector[zlib.crc32(word.encode()) % 64] += 1.0
+            vectors.append(vector)
+        return vectors
+
+    @staticmethod
+    def name() -> str:
+        return "bag-of-words-test"
+
+
+class Reply:
+    usage_metadata = {}
+
+    def __init__(self, content):
+        self.content = content
+
+
+@pytest.fixture
+def llm_calls(monkeypatch):
+    calls = []
+
+    def invoke(models, messages, tenant, priority="interactive", **kwargs):
+        calls.append(priority)
+        if messages[0].content.startswith("You write the questions"):
+            return Reply("1. How long is the refund window?\n- Where do I reset my password?\nHope that helps!")
+        return Reply(f"Answer: {messages[-1].content.splitlines()[0]}")
+
+    monkeypatch.setattr(llm_scheduler, "invoke", invoke)
+    return calls
+
+
+@pytest.fixture
+def builder(tmp_path, db_session, session_factory):
+    store = HandleChromadb(
+        client=chromadb.PersistentClient(path=str(tmp_path / "chroma")),
+        embedding_function=BagOfWordsEmbeddingFunction(),
+    )
+    db_session.add(User(id=USER_ID, email="owner@example.com", hashed_password="x"))
+    documents = [
+        Document(id=document_id, user_id=USER_ID, filename="a.pdf", filepath="a.pdf", file_type="pdf")
+        for document_id in ("doc1", "doc2")
+    ]
+    db_session.add(ChatBot(id="bot", name="Support", system_prompt="-", welcome_message="-", theme="light",
+                           primary_color="#fff", user_id=USER_ID, documents=documents))
+    db_session.add(AnswerBank(chatbot_id="bot"))
+    db_session.commit()
+    for document_id in ("doc1", "doc2"):
+        store.save_vector([f"{document_id} refunds within 30 days", f"{document_id} password resets"],
+                          {"id": document_id, "user_id": str(USER_ID)})
+    return AnswerBankBuilder(store, session_factory, min_similarity=0.9, questions_per_chunk=2, max_chunks=3)
+
+
+def test_parse_questions_drops_markers_and_chatter():
+    assert parse_questions("1. Is it free?\n2) Can I cancel?\n- Who are you?\nThat's all.", 2) == [
+        "Is it free?", "Can I cancel?"
+    ]
+
+
+def test_build_then_lookup(builder, llm_calls, db_session):
+    assert builder.build("bot") == 2  # duplicates across chunks are answered once
+    assert set(llm_calls) == {"batch"}
+    assert len(llm_calls) == 3 + 2  # one question call per sampled chunk, one answer per question
+
+    bank = db_session.get(AnswerBank, "bot")
+    db_session.refresh(bank)
+    assert (bank.status, bank.entries) == ("ready", 2)
+
+    def lookup(query, document_ids=("doc1", "doc2")):
+        return builder.lookup(db_session, USER_ID, "bot", query, list(document_ids))
+
+    answer, query_vector = lookup("how long is the refund window")
+    assert answer == "Answer: How long is the refund window?" and len(query_vector) == 64
+    answer, query_vector = lookup("What is the capital of France?")
+    assert answer is None and query_vector is not None  # a miss hands the vector on to retrieval
+    assert lookup("How long is the refund window?", document_ids=["doc1"]) == (None, None)
+    other_tenant = UUID("0b7c2a4e-7f55-4c1e-9d8f-3a9a2f1d6e10")
+    assert builder.lookup(db_session, other_tenant, "bot", "How long is the refund window?", ["doc1", "doc2"]) == (
+        None, None
+    )
+
+
+def test_rebuild_replaces_entries(builder, llm_calls, db_session):
+    builder.build("bot")
+    builder.build("bot")
+
+    collection, _, _ = builder.collection(str(USER_ID))
+    assert collection.count() == 2
+
+
+def test_chat_serves_bank_answers_without_the_llm(client, builder, llm_calls, monkeypatch):
+    monkeypatch.setattr(document, "answer_bank", builder)
+    builder.build("bot")
+    llm_calls.clear()
+
+    response = client.post("/chatbots/chat", json={
+        "query": "How long is the refund window?", "document_id": ["doc2", "doc1"], "chatbot_id": "bot"
+    })
+    assert response.json() == "Answer: How long is the refund window?"
+    assert llm_calls == []
+
+
+def test_chat_embeds_the_query_once_on_a_bank_miss(client, builder, llm_calls, monkeypatch):
+    monkeypatch.setattr(document, "answer_bank", builder)
+    monkeypatch.setattr(document, "precess_pdf", builder.store)
+    builder.build("bot")
+    embedded = []
+    call = builder.store.embedding_breaker.call
+    monkeypatch.setattr(builder.store.embedding_breaker, "call",
+                        lambda func, *args, **kwargs: embedded.append(args) or call(func, *args, **kwargs))
+
+    def embedding_tokens():
+        return client.get("/users/usage").json()["totals"]["embedding_tokens"]
+
+    before = embedding_tokens()  # the build's questions
+    response = client.post("/chatbots/chat", json={
+        "query": "Where is the office?", "document_id": ["doc1", "doc2"], "chatbot_id": "bot"
+    })
+    assert response.json() == "Answer: Where is the office?"
+    assert embedded == [("Where is the office?",)]
+    assert embedding_tokens() - before == document.estimate_tokens("Where is the office?")
+
+
+def test_document_changes_refresh_the_bank(client, builder, monkeypatch):
+    refreshed = []
+    monkeypatch.setattr(document, "answer_bank", builder)
+    monkeypatch.setattr(builder, "refresh", refreshed.append)
+
+    assert client.post("/chatbots/chatbot/bot/answer_bank").status_code == 202
+    client.put("/chatbots/chatbot/bot/update", data={"name": "Renamed", "selectedDocuments": ["doc1", "doc2"]})
+    client.put("/chatbots/chatbot/bot/update", data={"selectedDocuments": ["doc1"]})
+    assert refreshed == ["bot", "bot"]
+
+    status = client.get("/chatbots/chatbot/bot/answer_bank").json()
+    assert (status["status"], status["stale"]) == ("pending", True)
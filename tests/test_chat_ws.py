@@ -0,0 +1,111 @@
+import uuid
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from app.models.models import ChatBot, ChatMessage, Document, User
+from app.routes import document
+from app.utils.llm_scheduler import LLMUnavailable
+from app.utils.metrics import metrics
+
+USER_ID = uuid.UUID("946cc9ce-4fc0-4a32-bf27-62287f31b995")
+
+
+@pytest.fixture
+def chatbot(db_session):
+    db_session.add(User(id=USER_ID, email="owner@example.com", hashed_password="x"))
+    doc = Document(id="d1", user_id=USER_ID, filename="a.pdf", filepath="a.pdf", file_type="pdf")
+    db_session.add(ChatBot(id="bot-1", user_id=USER_ID, name="Bot", system_prompt="p", welcome_message="Hello!",
+                           theme="light", primary_color="#000", documents=[doc]))
+    db_session.commit()
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """Retrieval and a streaming model that answer with the query; records the history of each call."""
+    histories = []
+
+    def stream_ai_response(query, context, message_history=None, tenant="default", chatbot_id=None, timeout=None):
+        histories.append(list(message_history or []))
+        yield from ["You ", "asked: ", query]
+
+    monkeypatch.setattr(document.precess_pdf, "query_collection",
+                        lambda query, filter, tenant=None, timeout=None, query_vector=None: [["passage"]])
+    monkeypatch.setattr(document.precess_pdf, "stream_ai_response", stream_ai_response)
+    return histories
+
+
+def receive_answer(ws) -> tuple:
+    tokens = []
+    while True:
+        frame = ws.receive_json()
+        if frame["type"] == "token":
+            tokens.append(frame["content"])
+        else:
+            return tokens, frame
+
+
+def test_answers_are_streamed_and_the_history_is_kept_on_the_server(client, chatbot, llm, db_session, messages):
+    with client.websocket_connect("/chatbots/ws/chat?chatbot_id=bot-1") as ws:
+        assert ws.receive_json() == {"type": "ready", "chatbot_id": "bot-1", "welcome_message": "Hello!"}
+
+        ws.send_json({"type": "message", "content": "first"})
+        tokens, done = receive_answer(ws)
+        assert tokens == ["You ", "asked: ", "first"]
+        assert done == {"type": "done", "content": "You asked: first", "degraded": False}
+
+        ws.send_json({"type": "ping"})
+        assert ws.receive_json() == {"type": "pong"}
+        ws.send_text("not json")
+        assert ws.receive_json()["status"] == 400
+
+        ws.send_json({"type": "message", "content": "second"})
+        assert receive_answer(ws)[1]["content"] == "You asked: second"
+
+    messages.flush(timeout=5)  # exchanges are saved in the background, after their answer was sent
+    assert llm == [[], [{"role": "user", "content": "first"}, {"role": "assistant", "content": "You asked: first"}]]
+    saved = db_session.query(ChatMessage).order_by(ChatMessage.created_at).all()
+    assert [(m.sender, m.text, m.starts_conversation) for m in saved] == [
+        ("user", "first", True), ("bot", "You asked: first", None),
+        ("user", "second", False), ("bot", "You asked: second", None),
+    ]
+
+
+def test_llm_failures_degrade_or_become_error_frames(client, chatbot, llm, monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise LLMUnavailable("rate limited", retry_after=5)
+        yield
+
+    monkeypatch.setattr(document.precess_pdf, "stream_ai_response", unavailable)
+    with client.websocket_connect("/chatbots/ws/chat?chatbot_id=bot-1") as ws:
+        ws.receive_json()
+        ws.send_json({"type": "message", "content": "refunds?"})
+        tokens, done = receive_answer(ws)
+        assert done["degraded"] is True and "passage" in done["content"]
+
+        monkeypatch.setattr(document.current_config, "CHAT_DEGRADED_MODE", False)
+        ws.send_json({"type": "message", "content": "refunds?"})
+        assert ws.receive_json() == {"type": "error", "status": 503, "detail": "rate limited", "retry_after": "5"}
+
+
+def test_idle_connections_get_heartbeats_and_are_closed(client, chatbot, llm, monkeypatch):
+    monkeypatch.setattr(document.current_config, "CHAT_WS_HEARTBEAT_SECONDS", 0.05)
+    monkeypatch.setattr(document.current_config, "CHAT_WS_IDLE_TIMEOUT_SECONDS", 0.2)
+    closed = metrics.get("chat_ws_closed_total", reason="idle")
+    with client.websocket_connect("/chatbots/ws/chat?chatbot_id=bot-1") as ws:
+        ws.receive_json()
+        assert ws.receive_json() == {"type": "ping"}
+        while True:
+            try:
+                assert ws.receive_json() == {"type": "ping"}
+            except WebSocketDisconnect as e:
+                assert (e.code, e.reason) == (1000, "Idle timeout")
+                break
+    assert metrics.get("chat_ws_closed_total", reason="idle") == closed + 1
+
+
+def test_unknown_chatbots_are_refused(client, chatbot):
+    with pytest.raises(WebSocketDisconnect) as exc:
+        with client.websocket_connect("/chatbots/ws/chat?chatbot_id=missing") as ws:
+            ws.receive_json()
+    assert exc.value.code == 1008
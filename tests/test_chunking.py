@@ -0,0 +1,78 @@
+import pytest
+
+from app.utils.chunking import StructuredChunker, estimate_tokens, is_heading
+
+
+def test_sentence_across_page_break_stays_in_one_chunk():
+    pages = [
+        (1, "Returns are accepted within thirty days. Refunds are issued to the original"),
+        (2, "payment method once the item arrives. Shipping is free on all orders."),
+    ]
+    chunks = list(StructuredChunker(chunk_size=200, chunk_overlap=0).chunk_pages(pages))
+
+    assert len(chunks) == 1
+    assert "original payment method" in chunks[0].text
+    assert (chunks[0].page_start, chunks[0].page_end) == (1, 2)
+
+
+def test_chunks_respect_token_budget_and_sentence_boundaries():
+    sentence = "The warranty covers manufacturing defects for two full years."
+    pages = [(n, " ".join([sentence] * 10)) for n in range(1, 6)]
+    chunker = StructuredChunker(chunk_size=60, chunk_overlap=0)
+    chunks = list(chunker.chunk_pages(pages))
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.tokens <= 60
+        assert chunk.text.endswith(".")
+    assert chunks[0].page_start == 1 and chunks[-1].page_end == 5
+
+
+def test_heading_starts_a_new_chunk():
+    body = "Orders ship within two business days from our warehouse. " * 4
+    pages = [(1, f"Shipping Policy\n{body}\nRefund Policy\n{body}")]
+    chunks = list(StructuredChunker(chunk_size=200, chunk_overlap=0).chunk_pages(pages))
+
+    assert [chunk.text.split(" ")[0] for chunk in chunks] == ["Shipping", "Refund"]
+
+
+def test_overlap_repeats_trailing_sentences():
+    pages = [(1, " ".join(f"Sentence number {i} talks about billing." for i in range(40)))]
+    chunks = list(StructuredChunker(chunk_size=50, chunk_overlap=12).chunk_pages(pages))
+
+    last_sentence = chunks[0].text.rsplit(". ", 1)[-1]
+    assert chunks[1].text.startswith(last_sentence.rstrip("."))
+
+
+def test_tiny_tail_is_merged_into_previous_chunk():
+    long_text = "Support is available every weekday from nine to five. " * 8
+    pages = [(1, long_text), (2, "Thanks.")]
+    chunks = list(StructuredChunker(chunk_size=120, chunk_overlap=0).chunk_pages(pages))
+
+    assert chunks[-1].text.endswith("Thanks.")
+    assert chunks[-1].page_end == 2
+    assert all(chunk.tokens >= 30 for chunk in chunks)
+
+
+def test_oversized_sentence_is_split_on_words():
+    pages = [(1, "word " * 500)]
+    chunks = list(StructuredChunker(chunk_size=50, chunk_overlap=0).chunk_pages(pages))
+
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk.text) <= 50 for chunk in chunks)
+
+
+def test_invalid_overlap_is_rejected():
+    with pytest.raises(ValueError):
+        StructuredChunker(chunk_size=50, chunk_overlap=50)
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("1.2 Return Policy", True),
+    ("FREQUENTLY ASKED QUESTIONS", True),
+    ("Shipping Information", True),
+    ("Items can be returned within thirty days.", False),
+    ("the quick brown fox", False),
+])
+def test_is_heading(line, expected):
+    assert is_heading(line) is expected
@@ -0,0 +1,110 @@
+import time
+import uuid
+
+import pytest
+
+from app.models.models import ChatBot, User
+from app.routes import document
+from app.utils.circuit_breaker import CircuitBreaker, CircuitOpen
+from app.utils.deadline import Deadline, DeadlineExceeded
+from app.utils.embedding_batcher import EmbeddingBatcher
+from app.utils.llm_scheduler import LLMQueueTimeout
+
+USER_ID = uuid.UUID("946cc9ce-4fc0-4a32-bf27-62287f31b995")
+
+
+def fail():
+    raise RuntimeError("upstream error")
+
+
+def busy():
+    raise LLMQueueTimeout("no free slot")
+
+
+def test_breaker_opens_on_failures_and_recovers_through_a_trial_call():
+    breaker = CircuitBreaker("test", slow_seconds=10, window=4, min_calls=4, failure_rate=0.5, open_seconds=0.05,
+                             ignore=(LLMQueueTimeout,))
+    assert breaker.call(lambda: "ok") == "ok"
+    with pytest.raises(RuntimeError):
+        breaker.call(fail)
+    with pytest.raises(LLMQueueTimeout):
+        breaker.call(busy)
+    assert breaker.state == "closed"  # ignored errors are not counted
+    breaker.call(lambda: "ok")
+    with pytest.raises(RuntimeError):
+        breaker.call(fail)
+    assert breaker.state == "open"
+
+    with pytest.raises(CircuitOpen) as exc:
+        breaker.call(lambda: "never called")
+    assert exc.value.retry_after >= 1
+
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    with pytest.raises(RuntimeError):
+        breaker.call(fail)
+    assert breaker.state == "open"
+    time.sleep(0.06)
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.stats() == {"state": "closed", "open": False, "calls": 6, "failures": 3, "slow_calls": 0,
+                               "rejected": 1, "opened": 2}
+
+
+def test_slow_calls_open_the_breaker():
+    breaker = CircuitBreaker("slow", slow_seconds=0.01, window=3, min_calls=3, failure_rate=0.6, open_seconds=30)
+    breaker.call(lambda: "fast")
+    breaker.call(time.sleep, 0.02)
+    assert breaker.state == "closed"
+    breaker.call(time.sleep, 0.02)
+    assert breaker.state == "open"
+
+
+def test_query_embedding_is_bounded_by_its_budget():
+    batcher = EmbeddingBatcher(lambda texts: time.sleep(0.2) or [[1.0] for _ in texts], window_ms=1)
+    with pytest.raises(TimeoutError):
+        batcher.embed("slow", timeout=0.05)
+    deadline = Deadline(0.05)
+    assert deadline.budget("embedding", cap=0.01) == 0.01
+    time.sleep(0.06)
+    with pytest.raises(DeadlineExceeded):
+        deadline.budget("generation")
+
+
+@pytest.fixture
+def chatbot(db_session):
+    db_session.add(User(id=USER_ID, email="owner@example.com", hashed_password="x"))
+    db_session.add(ChatBot(id="bot-1", user_id=USER_ID, name="Bot", system_prompt="p", welcome_message="w",
+                           theme="light", primary_color="#000"))
+    db_session.commit()
+
+
+def test_chat_answers_with_passages_while_the_llm_breaker_is_open(client, chatbot, monkeypatch, circuit_breakers):
+    monkeypatch.setattr(document.precess_pdf, "query_collection",
+                        lambda query, filter, tenant=None, timeout=None, query_vector=None: [["Refunds take 14 days.", "Call support."]])
+    llm_breaker = circuit_breakers["llm"]
+    llm_breaker.open_seconds = 30
+    for _ in range(llm_breaker.min_calls):
+        with pytest.raises(RuntimeError):
+            llm_breaker.call(fail)
+
+    payload = {"query": "How long do refunds take?", "document_id": ["d1"], "chatbot_id": "bot-1"}
+    response = client.post("/chatbots/chat", json=payload)
+    assert response.status_code == 200
+    assert response.headers["X-Chat-Degraded"] == "true"
+    assert "Refunds take 14 days." in response.json() and "Call support." in response.json()
+    assert client.get("/metrics").json()["circuit_breakers"]["llm"]["state"] == "open"
+
+    monkeypatch.setattr(document.current_config, "CHAT_DEGRADED_MODE", False)
+    response = client.post("/chatbots/chat", json={**payload, "messageHistory": [{"role": "user", "content": "hi"}]})
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_chat_fails_fast_when_the_query_cannot_be_embedded_in_time(client, chatbot, monkeypatch):
+    def slow_retrieval(query, filter, tenant=None, timeout=None, query_vector=None):
+        raise TimeoutError()
+
+    monkeypatch.setattr(document.precess_pdf, "query_collection", slow_retrieval)
+    history = [{"role": "user", "content": "hi"}]
+    payload = {"query": "hello", "document_id": ["d1"], "chatbot_id": "bot-1", "messageHistory": history}
+    assert client.post("/chatbots/chat", json=payload).status_code == 504
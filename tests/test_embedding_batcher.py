@@ -0,0 +1,72 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import chromadb
+import pytest
+
+from app.utils.embedding_batcher import EmbeddingBatcher
+from app.utils.process_pdf import HandleChromadb
+from tests.test_embeddings import FixedEmbeddingFunction
+
+
+class RecordingFunction:
+    def __init__(self, latency: float = 0.02, fail: bool = False):
+        self.latency = latency
+        self.fail = fail
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def __call__(self, input):
+        with self._lock:
+            self.batches.append(list(input))
+        time.sleep(self.latency)
+        if self.fail:
+            raise RuntimeError("embedding service down")
+        return [[float(len(text))] for text in input]
+
+
+def test_concurrent_queries_share_batches():
+    function = RecordingFunction()
+    batcher = EmbeddingBatcher(function, window_ms=20, max_size=16, concurrency=2)
+    texts = [f"question {'x' * i}" for i in range(40)] + ["same"] * 8
+
+    with ThreadPoolExecutor(max_workers=len(texts)) as pool:
+        vectors = list(pool.map(batcher.embed, texts))
+
+    assert vectors == [[float(len(text))] for text in texts]
+    assert len(function.batches) < len(texts) / 4
+    assert max(len(batch) for batch in function.batches) <= 16
+    assert sum(batch.count("same") for batch in function.batches) <= len(function.batches)
+
+
+def test_errors_reach_every_caller():
+    batcher = EmbeddingBatcher(RecordingFunction(fail=True), window_ms=10, max_size=8)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(batcher.embed, f"q{i}") for i in range(4)]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result()
+
+
+def test_zero_window_calls_function_directly():
+    function = RecordingFunction(latency=0)
+    batcher = EmbeddingBatcher(function, window_ms=0)
+    assert batcher.embed("abc") == [3.0]
+    assert function.batches == [["abc"]]
+
+
+def test_query_collection_embeds_through_batcher(tmp_path):
+    store = HandleChromadb(
+        client=chromadb.PersistentClient(path=str(tmp_path / "chroma")),
+        embedding_function=FixedEmbeddingFunction(),
+    )
+    store.save_vector(["a", "bb"], {"id": "doc1", "user_id": "u1"})
+    calls = []
+    embed = store.query_embedder.embed
+    store.query_embedder.embed = lambda text, timeout=None: calls.append(text) or embed(text, timeout)
+
+    result = store.query_collection("bb", filter={"user_id": {"$eq": "u1"}})
+
+    assert calls == ["bb"]
+    assert sorted(result[0]) == ["a", "bb"]
@@ -0,0 +1,87 @@
+import chromadb
+import pytest
+from chromadb.api.types import EmbeddingFunction
+
+from app.utils import embeddings
+from app.utils.embeddings import EmbeddingProviderMismatch, LocalEmbeddingFunction, get_embedding_provider
+from app.utils.process_pdf import HandleChromadb
+
+
+class FixedEmbeddingFunction(EmbeddingFunction):
+    def __init__(self, dimension: int = 8):
+        self.dimension = dimension
+
+    def __call__(self, input):
+        return [[float(len(text) % 7)] + [0.0] * (self.dimension - 1) for text in input]
+
+    @staticmethod
+    def name() -> str:
+        return "fixed-test"
+
+
+@pytest.fixture
+def chroma_client(tmp_path):
+    return chromadb.PersistentClient(path=str(tmp_path / "chroma"))
+
+
+def test_collection_is_tagged_with_provider_and_dimension(chroma_client):
+    store = HandleChromadb(client=chroma_client, embedding_function=FixedEmbeddingFunction())
+    store.save_vector(["hello world"], {"id": "doc", "user_id": "u"})
+
+    metadata = chroma_client.get_collection(store.collection_name).metadata
+    assert metadata["embedding_provider"] == "custom"
+    assert metadata["embedding_model"] == "fixed-test"
+    assert metadata["embedding_dimension"] == 8
+
+
+def test_vectors_from_another_provider_are_refused(chroma_client):
+    store = HandleChromadb(client=chroma_client, embedding_function=FixedEmbeddingFunction())
+    store.get_or_create_collection()
+
+    other = HandleChromadb(client=chroma_client, embedding_function=FixedEmbeddingFunction(dimension=16))
+    with pytest.raises(EmbeddingProviderMismatch):
+        other.save_vector(["hello"], {"id": "doc"})
+
+
+def test_untagged_legacy_collection_is_adopted(chroma_client):
+    chroma_client.create_collection("documents_custom_fixed-test", embedding_function=FixedEmbeddingFunction())
+    store = HandleChromadb(client=chroma_client, embedding_function=FixedEmbeddingFunction())
+    store.get_or_create_collection()
+
+    assert chroma_client.get_collection(store.collection_name).metadata["embedding_dimension"] == 8
+
+
+def test_providers_use_separate_collections():
+    openai = get_embedding_provider("openai", "text-embedding-3-small")
+    local = embeddings.EmbeddingProvider("local", "sentence-transformers/all-MiniLM-L6-v2", None, 384)
+
+    assert openai.collection_name() == "documents"
+    assert openai.dimension == 1536
+    assert local.collection_name() == "documents_local_sentence-transformers-all-minilm-l6-v2"
+
+
+def test_local_provider_batches_inference(monkeypatch):
+    batches = []
+
+    class FakeModel:
+        def encode(self, texts, batch_size, normalize_embeddings):
+            batches.append(list(texts))
+            return [FakeVector([1.0, 0.0]) for _ in texts]
+
+    class FakeVector(list):
+        def tolist(self):
+            return list(self)
+
+    monkeypatch.setattr(embeddings, "_load_model", lambda name: FakeModel())
+    monkeypatch.setattr(embeddings, "_worker_model", None)
+    function = LocalEmbeddingFunction(model_name="fake", workers=0, batch_size=4)
+
+    vectors = function([f"text {i}" for i in range(10)])
+
+    assert len(vectors) == 10
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+
+
+def test_unknown_provider_is_rejected():
+    with pytest.raises(ValueError):
+        get_embedding_provider("nope")
@@ -0,0 +1,91 @@
+import csv
+import gzip
+import io
+import json
+import tracemalloc
+from datetime import datetime, timedelta
+from uuid import UUID
+
+from app.models.models import ChatMessage, User
+from app.utils.export import gzip_chunks, iter_csv, iter_ndjson
+
+USER_ID = UUID("946cc9ce-4fc0-4a32-bf27-62287f31b995")
+OTHER_ID = UUID("00000000-0000-0000-0000-000000000001")
+BASE = datetime(2024, 1, 1, 12, 0, 0)
+
+
+def seed(db_session):
+    db_session.add_all([
+        User(id=USER_ID, email="owner@example.com", hashed_password="x"),
+        User(id=OTHER_ID, email="other@example.com", hashed_password="x"),
+    ])
+    for i in range(6):
+        db_session.add(ChatMessage(
+            text=f"message {i}, with \"quotes\"\nand a newline", sender="user" if i % 2 == 0 else "bot",
+            created_at=BASE + timedelta(days=i), user_id=USER_ID, chatbot_id="bot-a" if i < 4 else "bot-b",
+        ))
+    db_session.add(ChatMessage(text="not mine", sender="user", created_at=BASE, user_id=OTHER_ID))
+    db_session.commit()
+
+
+def test_ndjson_export_streams_only_own_messages_in_order(client, db_session):
+    seed(db_session)
+
+    response = client.get("/chatbots/messages/export")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert "attachment" in response.headers["content-disposition"]
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["content"].split(",")[0] for row in rows] == [f"message {i}" for i in range(6)]
+    assert set(rows[0]) == {"id", "chatbot_id", "sender", "content", "created_at"}
+
+
+def test_csv_export_filters_by_chatbot_and_date_range(client, db_session):
+    seed(db_session)
+
+    response = client.get("/chatbots/messages/export", params={
+        "format": "csv", "chatbot_id": "bot-a",
+        "start": (BASE + timedelta(days=1)).isoformat(), "end": (BASE + timedelta(days=3)).isoformat() + "Z",
+    })
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["content"] for row in rows] == [f"message {i}, with \"quotes\"\nand a newline" for i in (1, 2)]
+    assert {row["chatbot_id"] for row in rows} == {"bot-a"}
+
+
+def test_gzip_export_round_trips(client, db_session):
+    seed(db_session)
+
+    response = client.get("/chatbots/messages/export", params={"gzip": True})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/gzip"
+    assert response.headers["content-disposition"].endswith('.ndjson.gz"')
+    assert len(gzip.decompress(response.content).splitlines()) == 6
+
+
+def test_unknown_format_is_rejected(client):
+    assert client.get("/chatbots/messages/export", params={"format": "xml"}).status_code == 422
+
+
+def fake_rows(count: int):
+    for i in range(count):
+        yield (f"id-{i}", "bot", "user", "x" * 200, BASE)
+
+
+def test_serializers_use_bounded_memory():
+    def peak(count: int, serializer) -> int:
+        tracemalloc.start()
+        total = 0
+        for chunk in gzip_chunks(serializer(fake_rows(count))):
+            total += len(chunk)
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak_bytes
+
+    for serializer in (iter_ndjson, iter_csv):
+        small, large = peak(2000, serializer), peak(50000, serializer)
+        assert large < small * 2, (serializer.__name__, small, large)
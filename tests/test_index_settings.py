@@ -0,0 +1,64 @@
+import chromadb
+import pytest
+from chromadb.api.types import EmbeddingFunction
+
+from app.setting import current_config
+from app.utils.index_settings import IndexSettings
+from app.utils.process_pdf import HandleChromadb
+
+
+class WordLengthEmbeddingFunction(EmbeddingFunction):
+    def __call__(self, input):
+        return [[float(len(text)), float(text.count(" ")), 1.0] for text in input]
+
+    @staticmethod
+    def name() -> str:
+        return "word-length-test"
+
+
+@pytest.fixture
+def chroma_client(tmp_path):
+    return chromadb.PersistentClient(path=str(tmp_path / "chroma"))
+
+
+def test_collection_overrides_replace_defaults(monkeypatch):
+    monkeypatch.setattr(current_config, "HNSW_SEARCH_EF", 64)
+    monkeypatch.setattr(current_config, "HNSW_COLLECTION_SETTINGS", '{"documents": {"m": 32, "top_k": 5}}')
+
+    assert IndexSettings.for_collection("documents") == IndexSettings(m=32, search_ef=64, top_k=5)
+    assert IndexSettings.for_collection("documents_local_x") == IndexSettings(search_ef=64)
+
+
+def test_invalid_settings_are_rejected(monkeypatch):
+    with pytest.raises(ValueError):
+        IndexSettings(space="manhattan")
+    with pytest.raises(ValueError):
+        IndexSettings(top_k=0)
+    monkeypatch.setattr(current_config, "HNSW_COLLECTION_SETTINGS", '{"documents": {"ef": 10}}')
+    with pytest.raises(ValueError):
+        IndexSettings.for_collection("documents")
+
+
+def test_collection_is_built_and_queried_with_settings(chroma_client, monkeypatch):
+    monkeypatch.setattr(current_config, "HNSW_SPACE", "cosine")
+    monkeypatch.setattr(current_config, "HNSW_M", 24)
+    monkeypatch.setattr(current_config, "RETRIEVAL_TOP_K", 3)
+    store = HandleChromadb(client=chroma_client, embedding_function=WordLengthEmbeddingFunction())
+    store.save_vector([f"chunk {'word ' * i}" for i in range(10)], {"id": "doc", "user_id": "u"})
+
+    hnsw = chroma_client.get_collection(store.collection_name).configuration["hnsw"]
+    assert (hnsw["space"], hnsw["max_neighbors"]) == ("cosine", 24)
+    assert len(store.query_collection("chunk word", filter={"user_id": "u"})[0]) == 3
+
+
+def test_search_ef_is_applied_to_existing_collections(chroma_client, capsys):
+    collection = chroma_client.create_collection(
+        "tuned", configuration=IndexSettings(search_ef=10).configuration(), embedding_function=None
+    )
+
+    IndexSettings(search_ef=150).apply(collection)
+    assert chroma_client.get_collection("tuned").configuration["hnsw"]["ef_search"] == 150
+    assert "WARN" not in capsys.readouterr().out
+
+    IndexSettings(m=48).apply(collection)
+    assert "re-index" in capsys.readouterr().out
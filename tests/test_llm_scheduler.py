@@ -0,0 +1,155 @@
+import threading
+import time
+
+import httpx
+import openai
+import pytest
+
+from app.utils.circuit_breaker import CircuitBreaker, CircuitOpen
+from app.utils.llm_scheduler import LLMQueueTimeout, LLMScheduler, LLMUnavailable, parse_weights
+
+
+def rate_limit_error():
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    return openai.RateLimitError("rate limited", response=httpx.Response(429, request=request), body=None)
+
+
+def server_error():
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    return openai.InternalServerError("bad gateway", response=httpx.Response(502, request=request), body=None)
+
+
+def connection_error():
+    return openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+
+
+class StubModel:
+    def __init__(self, name, failures=0, error=rate_limit_error):
+        self.name = name
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def invoke(self, messages, timeout=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error()
+        return f"{self.name}: {messages}"
+
+    def stream(self, messages, timeout=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error()
+        yield from f"{self.name}: {messages}".split(" ")
+
+
+def grant_order(scheduler, tickets):
+    """Queue (tenant, lane) tickets behind a held slot, then release one at a time."""
+    order, threads = [], []
+    scheduler.acquire("holder")
+
+    def wait(tenant, lane):
+        scheduler.acquire(tenant, lane)
+        order.append(tenant)
+
+    for tenant, lane in tickets:
+        thread = threading.Thread(target=wait, args=(tenant, lane))
+        thread.start()
+        threads.append(thread)
+        while scheduler.queued() < len(threads):
+            time.sleep(0.001)
+
+    for count in range(len(tickets)):
+        scheduler.release()
+        while len(order) < count + 1:
+            time.sleep(0.001)
+    for thread in threads:
+        thread.join()
+    scheduler.release()
+    return order
+
+
+def test_busy_tenant_does_not_starve_others():
+    scheduler = LLMScheduler(slots=1)
+    order = grant_order(scheduler, [("a", "interactive")] * 4 + [("b", "interactive")] * 2)
+    assert order[:4] == ["a", "b", "a", "b"]
+
+
+def test_weights_and_lanes():
+    scheduler = LLMScheduler(slots=1, weights=parse_weights("a:2"))
+    order = grant_order(scheduler, [("batch", "batch")] + [("a", "interactive")] * 4 + [("b", "interactive")] * 2)
+    # a has twice b's share; batch only runs once the interactive lane is empty
+    assert order == ["a", "b", "a", "a", "b", "a", "batch"]
+
+
+def test_queue_timeout():
+    scheduler = LLMScheduler(slots=1)
+    scheduler.acquire("a")
+    with pytest.raises(LLMQueueTimeout):
+        scheduler.acquire("b", wait_until=time.monotonic() + 0.05)
+    assert scheduler.queued() == 0
+    scheduler.release()
+
+
+def test_rate_limits_are_retried_then_fall_back():
+    scheduler = LLMScheduler(slots=2, max_retries=2, backoff_base=0.001)
+    model = StubModel("primary", failures=2)
+    assert scheduler.invoke([model], "hi", tenant="a") == "primary: hi"
+    assert model.calls == 3
+
+    primary, fallback = StubModel("primary", failures=99), StubModel("fallback")
+    assert scheduler.invoke([primary, fallback], "hi", tenant="a") == "fallback: hi"
+    assert (primary.calls, fallback.calls) == (3, 1)
+
+    with pytest.raises(LLMUnavailable):
+        scheduler.invoke([StubModel("primary", failures=99)], "hi", tenant="b")
+
+    stats = scheduler.stats()
+    assert stats["busy"] == 0
+    assert stats["tenants"]["a"]["calls"] == 2
+    assert stats["tenants"]["a"]["retries"] == 4
+    assert stats["tenants"]["a"]["fallbacks"] == 1
+
+
+def test_server_and_connection_errors_are_retried_then_fall_back():
+    scheduler = LLMScheduler(slots=1, max_retries=1, backoff_base=0.001)
+    model = StubModel("primary", failures=1, error=server_error)
+    assert scheduler.invoke([model], "hi", tenant="a") == "primary: hi"
+
+    primary, fallback = StubModel("primary", failures=99, error=connection_error), StubModel("fallback")
+    assert list(scheduler.stream([primary, fallback], "hi", tenant="a")) == ["fallback:", "hi"]
+    assert (primary.calls, fallback.calls) == (2, 1)
+
+    with pytest.raises(LLMUnavailable, match="unavailable"):
+        scheduler.invoke([StubModel("primary", failures=99, error=server_error)], "hi", tenant="a")
+
+
+def test_streams_retry_before_the_first_chunk_and_free_the_slot_when_closed():
+    scheduler = LLMScheduler(slots=1, max_retries=1, backoff_base=0.001)
+    primary, fallback = StubModel("primary", failures=99), StubModel("fallback")
+    assert list(scheduler.stream([primary, fallback], "hi there", tenant="a")) == ["fallback:", "hi", "there"]
+    assert (primary.calls, fallback.calls) == (2, 1)
+
+    stream = scheduler.stream([StubModel("primary")], "hi there", tenant="a")
+    assert next(stream) == "primary:"
+    stream.close()  # e.g. the client disconnected mid-answer
+    scheduler.acquire("b", wait_until=time.monotonic() + 0.05)
+    scheduler.release()
+
+
+def test_the_breaker_times_only_the_upstream_call():
+    breaker = CircuitBreaker("test", slow_seconds=0.05, window=2, min_calls=2, failure_rate=0.5, open_seconds=30)
+    scheduler = LLMScheduler(slots=1, max_retries=0, breaker=breaker)
+    scheduler.acquire("holder")
+    threading.Timer(0.1, scheduler.release).start()
+    assert scheduler.invoke([StubModel("primary")], "hi", tenant="a") == "primary: hi"  # queued ~0.1s
+    assert list(scheduler.stream([StubModel("primary")], "hi", tenant="a")) == ["primary:", "hi"]
+    assert (breaker.stats()["calls"], breaker.stats()["slow_calls"], breaker.state) == (2, 0, "closed")
+
+    with pytest.raises(LLMUnavailable):
+        scheduler.invoke([StubModel("primary", failures=99, error=server_error)], "hi", tenant="a")
+    assert breaker.state == "open"
+    model = StubModel("primary")
+    with pytest.raises(CircuitOpen):
+        scheduler.invoke([model], "hi", tenant="a")
+    assert model.calls == 0 and scheduler.stats()["busy"] == 0
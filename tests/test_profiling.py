@@ -0,0 +1,74 @@
+import os
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.utils import profiling
+from app.utils.profiling import ProfileStore, ProfilingMiddleware, RequestProfiler
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def busy_work(seconds: float):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+
+
+@pytest.fixture
+def profiled_client(tmp_path):
+    profiler = RequestProfiler(ProfileStore(str(tmp_path / "profiles"), max_profiles=2), token="secret",
+                               sample_rate=0, interval_ms=1, root=TESTS_DIR)
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+    @app.get("/work")
+    def work():
+        busy_work(0.1)
+        return {"done": True}
+
+    with TestClient(app) as client:
+        yield client, profiler
+
+
+def test_only_requests_with_the_token_are_profiled(profiled_client):
+    client, profiler = profiled_client
+    assert "X-Profile-Id" not in client.get("/work").headers
+    assert "X-Profile-Id" not in client.get("/work", headers={"X-Profile": "wrong"}).headers
+
+    response = client.get("/work", headers={"X-Profile": "secret"})
+    assert response.json() == {"done": True}
+    profile_id = response.headers["X-Profile-Id"]
+    with open(profiler.store.path(profile_id)) as f:
+        folded = f.read()
+    # The route runs in a threadpool worker, which is sampled with the event loop
+    assert folded.startswith("worker;") and "busy_work (tests/test_profiling.py" in folded
+    meta = profiler.store.list()[0]
+    assert (meta["id"], meta["path"], meta["status"]) == (profile_id, "/work", 200)
+    assert meta["samples"] > 10 and meta["wall_seconds"] >= 0.1
+
+
+def test_ring_buffer_keeps_the_newest_profiles(profiled_client):
+    client, profiler = profiled_client
+    ids = [client.get("/work", headers={"X-Profile": "secret"}).headers["X-Profile-Id"] for _ in range(3)]
+    assert [meta["id"] for meta in profiler.store.list()] == ids[:0:-1]
+    assert profiler.store.path(ids[0]) is None
+    assert len(os.listdir(profiler.store.directory)) == 4
+    assert profiler.store.path("../../etc/passwd") is None
+
+
+def test_profile_download_requires_the_token(client, tmp_path, monkeypatch):
+    store = ProfileStore(str(tmp_path / "profiles"), max_profiles=5)
+    monkeypatch.setattr(profiling.request_profiler, "store", store)
+    monkeypatch.setattr(profiling.request_profiler, "token", "secret")
+    profile_id = store.new_id()
+    store.save(profile_id, "event-loop;main (app/main.py:1) 3\n", {"path": "/chatbots/chat"})
+
+    assert client.get("/profiles").status_code == 403
+    assert client.get(f"/profiles/{profile_id}", headers={"X-Profile": "wrong"}).status_code == 403
+    assert client.get("/profiles", headers={"X-Profile": "secret"}).json()[0]["path"] == "/chatbots/chat"
+    response = client.get(f"/profiles/{profile_id}", headers={"X-Profile": "secret"})
+    assert response.text == "event-loop;main (app/main.py:1) 3\n"
+    assert client.get("/profiles/20000101000000000000-000000000000", headers={"X-Profile": "secret"}).status_code == 404
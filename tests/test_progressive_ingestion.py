@@ -0,0 +1,124 @@
+import threading
+from uuid import UUID
+
+import chromadb
+
+from app.models.models import ChatBot, Document, User
+from app.routes import document
+from app.utils.ingestion import IngestionTracker
+from app.utils.process_pdf import ProcessPdfDocument
+from benchmarks._common import make_synthetic_pdf
+from tests.test_embeddings import FixedEmbeddingFunction
+
+USER_ID = UUID("946cc9ce-4fc0-4a32-bf27-62287f31b995")
+
+
+def add_document(db_session, document_id="doc1", user_id=USER_ID):
+    db_session.add(Document(id=document_id, user_id=user_id, filename="doc.pdf", filepath="doc.pdf",
+                            file_type="pdf", status="processing"))
+    db_session.commit()
+
+
+def test_batches_are_queryable_and_reported_while_the_rest_is_read(tmp_path, db_session, session_factory):
+    add_document(db_session)
+    pipeline = ProcessPdfDocument(
+        client=chromadb.PersistentClient(path=str(tmp_path / "chroma")),
+        embedding_function=FixedEmbeddingFunction(),
+        progress=IngestionTracker(session_factory, interval=0),
+    )
+    pipeline.batch_chunks = 4
+    seen = []
+    save_vector = pipeline.save_vector
+
+    def observed_save_vector(*args, **kwargs):
+        save_vector(*args, **kwargs)
+        stored = pipeline.get_or_create_collection().get(where={"id": "doc1"}, include=[])
+        with session_factory() as db:
+            seen.append((len(stored["ids"]), db.get(Document, "doc1").chunks_indexed))
+
+    pipeline.save_vector = observed_save_vector
+    pdf = make_synthetic_pdf(str(tmp_path / "doc.pdf"), pages=6, words_per_page=300)
+    count = pipeline.load_pdf(pdf, {"source": "doc.pdf", "user_id": str(USER_ID), "id": "doc1"}, chunk_size=100,
+                              chunk_overlap=10)
+
+    assert count > 8 and len(seen) == -(-count // 4)
+    # Each batch is stored before the next is chunked, and reported right after it is stored
+    stored_counts = [stored for stored, _ in seen]
+    assert stored_counts == [min(4 * (i + 1), count) for i in range(len(seen))]
+    assert [indexed for _, indexed in seen] == [0] + stored_counts[:-1]
+    stored = pipeline.get_or_create_collection().get(where={"id": "doc1"})
+    assert sorted(stored["ids"]) == sorted(f"doc1_{i}" for i in range(count))
+    assert sorted(m["chunk_index"] for m in stored["metadatas"]) == list(range(count))
+
+    db_session.expire_all()
+    doc = db_session.get(Document, "doc1")
+    assert (doc.pages_total, doc.pages_indexed, doc.chunks_indexed) == (6, 6, count)
+    assert doc.first_chunk_seconds is not None and doc.indexed_at is not None
+
+
+def test_progress_endpoint(client, db_session):
+    add_document(db_session)
+    doc = db_session.get(Document, "doc1")
+    doc.pages_total, doc.pages_indexed, doc.chunks_indexed = 8, 2, 5
+    add_document(db_session, "other", UUID(int=1))
+
+    response = client.get("/chatbots/documents/doc1/progress")
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["status"], body["pages_indexed"], body["chunks_indexed"], body["percent"]) == ("processing", 2, 5, 25.0)
+    assert client.get("/chatbots/documents/other/progress").status_code == 404
+
+
+def test_uploads_and_reindexing_record_their_outcome(client, db_session, session_factory, monkeypatch):
+    db_session.add(User(id=USER_ID, email="owner@example.com", hashed_password="x"))
+    db_session.commit()
+    chunks = {"good.pdf": 4, "bad.pdf": None}  # None: processing failed
+    monkeypatch.setattr(document.precess_pdf, "process_pdf", lambda **kwargs: chunks[kwargs["file_name"]])
+
+    files = [("files", (name, b"%PDF-1.4", "application/pdf")) for name in chunks]
+    uploaded = {f["filename"]: f["document_id"] for f in client.post("/chatbots/upload", files=files).json()["files"]}
+    db_session.expire_all()
+    assert db_session.get(Document, uploaded["good.pdf"]).status == "ready"
+    assert db_session.get(Document, uploaded["bad.pdf"]).status == "failed"
+
+    db_session.add(ChatBot(id="bot", name="Bot", system_prompt="p", welcome_message="w", theme="light",
+                           primary_color="#000", user_id=USER_ID,
+                           documents=[db_session.get(Document, document_id) for document_id in uploaded.values()]))
+    db_session.commit()
+    reindexed = {uploaded["good.pdf"]: None, uploaded["bad.pdf"]: 3}  # the failed document is retried
+    statuses = []
+
+    def reindex_document(user_id, filename, document_id, *args):
+        # Not "failed" while its chunks are written, or the garbage collector would delete them
+        with session_factory() as db:
+            statuses.append(db.get(Document, document_id).status)
+        return reindexed[document_id]
+
+    monkeypatch.setattr(document.precess_pdf, "reindex_document", reindex_document)
+
+    assert client.post("/chatbots/chatbot/bot/reindex").status_code == 202
+    assert statuses == ["processing", "processing"]
+    db_session.expire_all()
+    assert db_session.get(Document, uploaded["good.pdf"]).status == "failed"
+    assert db_session.get(Document, uploaded["bad.pdf"]).status == "ready"
+
+
+def test_files_of_one_upload_are_ingested_in_parallel(client, db_session, monkeypatch):
+    db_session.add(User(id=USER_ID, email="owner@example.com", hashed_password="x"))
+    db_session.commit()
+    names = ["a.pdf", "b.pdf", "c.pdf"]
+    arrived = threading.Barrier(len(names), timeout=5)  # breaks unless every file is being indexed at once
+    threads = set()
+
+    def process_pdf(**kwargs):
+        threads.add(threading.get_ident())
+        arrived.wait()
+        return 1
+
+    monkeypatch.setattr(document.precess_pdf, "process_pdf", process_pdf)
+    files = [("files", (name, b"%PDF-1.4", "application/pdf")) for name in names]
+    uploaded = [f["document_id"] for f in client.post("/chatbots/upload", files=files).json()["files"]]
+
+    db_session.expire_all()
+    assert [db_session.get(Document, document_id).status for document_id in uploaded] == ["ready"] * len(names)
+    assert len(threads) == len(names)
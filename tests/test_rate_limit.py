@@ -0,0 +1,119 @@
+import asyncio
+import time
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from app.models.models import ChatBot, User
+from app.routes import document
+from app.setting import current_config
+from app.utils.metrics import metrics
+from app.utils.rate_limit import ConcurrencyGate, MemoryBucketStore, SqliteBucketStore
+
+USER_ID = uuid.UUID("946cc9ce-4fc0-4a32-bf27-62287f31b995")
+
+
+def test_bucket_allows_burst_then_rejects_with_retry_after():
+    store = MemoryBucketStore()
+    results = [store.acquire("k", rate=1.0, capacity=3) for _ in range(4)]
+    assert [allowed for allowed, _ in results] == [True, True, True, False]
+    assert 0 < results[-1][1] <= 1.0
+
+
+def test_sqlite_buckets_are_shared_between_workers(tmp_path):
+    path = str(tmp_path / "buckets.db")
+    worker_a, worker_b = SqliteBucketStore(path), SqliteBucketStore(path)
+    assert worker_a.acquire("bot", rate=0.01, capacity=2)[0]
+    assert worker_b.acquire("bot", rate=0.01, capacity=2)[0]
+    assert not worker_a.acquire("bot", rate=0.01, capacity=2)[0]
+    assert not worker_b.acquire("bot", rate=0.01, capacity=2)[0]
+    assert worker_b.acquire("other-bot", rate=0.01, capacity=2)[0]
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_refilled_buckets_are_pruned(backend, tmp_path):
+    if backend == "memory":
+        store = MemoryBucketStore(prune_every=3)
+        keys = lambda: set(store._buckets)
+    else:
+        store = SqliteBucketStore(str(tmp_path / "buckets.db"), prune_every=3)
+        keys = lambda: {key for key, in store._connect().execute("SELECT key FROM buckets")}
+    store.acquire("visitor-a", rate=1000, capacity=1)
+    store.acquire("visitor-b", rate=1000, capacity=1)
+    time.sleep(0.01)  # both have refilled
+    store.acquire("busy-bot", rate=0.01, capacity=1)  # third acquire prunes
+
+    assert keys() == {"busy-bot"}
+    assert store.acquire("visitor-a", rate=1000, capacity=1)[0]
+    assert not store.acquire("busy-bot", rate=0.01, capacity=1)[0]  # still drained, not reset
+
+
+def test_gate_rejects_when_queue_is_full():
+    gate = ConcurrencyGate(limit=1, max_waiting=1, timeout=5)
+
+    async def hold(seconds):
+        async with gate:
+            await asyncio.sleep(seconds)
+            return "ok"
+
+    async def run():
+        first = asyncio.ensure_future(hold(0.2))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(hold(0))
+        await asyncio.sleep(0.01)
+        with pytest.raises(HTTPException) as exc:
+            await hold(0)
+        return exc.value, await first, await second
+
+    rejected, first, second = asyncio.run(run())
+    assert rejected.status_code == 429 and rejected.headers["Retry-After"] == "1"
+    assert (first, second) == ("ok", "ok")
+    assert gate.in_flight == 0 and gate.waiting == 0
+
+
+def test_gate_times_out_waiters():
+    gate = ConcurrencyGate(limit=1, max_waiting=5, timeout=0.05)
+
+    async def run():
+        async with gate:
+            with pytest.raises(HTTPException) as exc:
+                async with gate:
+                    pass
+        return exc.value
+
+    assert asyncio.run(run()).status_code == 429
+
+
+def test_chat_returns_429_per_visitor_and_per_chatbot(client, db_session, monkeypatch):
+    monkeypatch.setattr(document.precess_pdf, "query_collection", lambda query, filter, tenant=None, timeout=None, query_vector=None: [["ctx"]])
+    monkeypatch.setattr(document.precess_pdf, "get_ai_response", lambda query, context, message_history=None, **kwargs: "hi")
+    db_session.add(User(id=USER_ID, email="owner@example.com", hashed_password="x"))
+    db_session.add(ChatBot(
+        id="bot-1", user_id=USER_ID, name="Bot", system_prompt="p", welcome_message="w",
+        theme="light", primary_color="#000", rate_limit_per_minute=18, visitor_rate_limit_per_minute=6,
+    ))
+    db_session.commit()
+    metrics.reset()
+
+    def chat(visitor, query):
+        payload = {"query": query, "document_id": ["d1"], "chatbot_id": "bot-1"}
+        return client.post("/chatbots/chat", json=payload, headers={"X-Forwarded-For": f"{visitor}, 10.0.0.2"})
+
+    # Burst is 10 seconds of rate: 1 message per visitor, 3 for the chatbot.
+    # Without a trusted proxy, a forged X-Forwarded-For does not make a new visitor
+    assert chat("1.1.1.1", "q1").status_code == 200
+    limited = chat("2.2.2.2", "q2")
+    assert limited.status_code == 429
+    assert int(limited.headers["Retry-After"]) >= 1
+
+    # Behind trusted proxies, the nearest untrusted address is the visitor
+    monkeypatch.setattr(current_config, "TRUSTED_PROXIES", ["testclient", "10.0.0.0/8"])
+    assert chat("3.3.3.3", "q3").status_code == 200
+    assert chat("3.3.3.3", "q3").status_code == 429
+    assert chat("4.4.4.4", "q4").status_code == 200
+    assert chat("5.5.5.5", "q5").status_code == 429
+
+    assert metrics.get("chat_admission_total", result="admitted", reason="ok") == 3
+    assert metrics.get("chat_admission_total", result="rejected", reason="visitor_rate") == 2
+    assert metrics.get("chat_admission_total", result="rejected", reason="chatbot_rate") == 1
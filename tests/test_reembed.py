@@ -0,0 +1,135 @@
+import chromadb
+import pytest
+from chromadb.api.types import EmbeddingFunction
+
+from app.models.models import EmbeddingMigration, EmbeddingRoute
+from app.utils.embeddings import EmbeddingProvider
+from app.utils.process_pdf import HandleChromadb
+from app.utils.reembed import DEFAULT_TENANT, EmbeddingMigrator, EmbeddingRouter, Route, migration_status
+
+
+class OldEmbeddingFunction(EmbeddingFunction):
+    def __call__(self, input):
+        return [[float(len(text)), 1.0, 0.0] for text in input]
+
+    @staticmethod
+    def name() -> str:
+        return "old-test"
+
+
+class NewEmbeddingFunction(EmbeddingFunction):
+    def __init__(self, fail_after: int = None):
+        self.calls = 0
+        self.fail_after = fail_after
+
+    def __call__(self, input):
+        if input == ["dimension probe"]:
+            return [[0.0, 0.0, 0.0, 0.0]]
+        self.calls += 1
+        if self.fail_after is not None and self.calls > self.fail_after:
+            raise RuntimeError("embedding API unavailable")
+        return [[float(len(text)), float(text.count(" ")), 1.0, 0.5] for text in input]
+
+    @staticmethod
+    def name() -> str:
+        return "new-test"
+
+
+@pytest.fixture
+def router(session_factory):
+    return EmbeddingRouter(session_factory, ttl=0)
+
+
+@pytest.fixture
+def store(tmp_path, router):
+    store = HandleChromadb(
+        client=chromadb.PersistentClient(path=str(tmp_path / "chroma")),
+        embedding_function=OldEmbeddingFunction(),
+        router=router,
+    )
+    store.save_vector([f"chunk {'word ' * i}" for i in range(5)], {"id": "doc1", "user_id": "u1"})
+    store.save_vector(["other tenant"], {"id": "doc2", "user_id": "u2"})
+    return store
+
+
+def migrator_for(store, router, session_factory, function, logs=None):
+    return EmbeddingMigrator(
+        store, router, session_factory, EmbeddingProvider.from_function(function),
+        batch_size=2, max_chunks_per_second=0, log=(logs if logs is not None else []).append,
+    )
+
+
+def test_router_prefers_tenant_route_then_default(session_factory):
+    router = EmbeddingRouter(session_factory, ttl=60)
+    assert router.resolve("u1") is None
+
+    with session_factory() as db:
+        router.set_route(db, DEFAULT_TENANT, Route("documents_b", "openai", "b"))
+        router.set_route(db, "u1", Route("documents_c", "openai", "c"))
+        assert router.resolve("u1").collection_name == "documents_c"
+        assert router.resolve("u2").collection_name == "documents_b"
+
+        # Written elsewhere: only seen once the cached routes expire
+        db.add(EmbeddingRoute(tenant="u2", collection_name="documents_d", provider="openai", model="d"))
+        db.commit()
+        assert router.resolve("u2").collection_name == "documents_b"
+        router.invalidate()
+        assert router.resolve("u2").collection_name == "documents_d"
+
+
+def test_migration_copies_and_cuts_over_one_tenant(store, router, session_factory):
+    logs = []
+    migrator = migrator_for(store, router, session_factory, NewEmbeddingFunction(), logs)
+
+    assert migrator.run(["u1"], settle_seconds=0) == [("u1", "switched")]
+
+    collection_name, provider, _ = store.resolve("u1")
+    assert collection_name == migrator.target_collection == "documents_custom_new-test"
+    assert provider.model == "new-test"
+    assert store.resolve("u2")[0] == store.collection_name
+    target = store.client.get_collection(collection_name, embedding_function=None)
+    assert target.count() == 5
+    assert target.metadata["embedding_dimension"] == 4
+    assert len(store.query_collection("chunk word", filter={"user_id": "u1"}, tenant="u1")[0]) == 5
+    assert any("5/5 chunks" in line for line in logs)
+
+    # New uploads follow the route
+    store.save_vector(["late chunk"], {"id": "doc3", "user_id": "u1"})
+    assert target.count() == 6
+
+
+def test_interrupted_copy_resumes_from_checkpoint(store, router, session_factory):
+    function = NewEmbeddingFunction(fail_after=1)
+    migrator_for(store, router, session_factory, function).run(["u1"], settle_seconds=0)
+    with session_factory() as db:
+        migration = db.query(EmbeddingMigration).one()
+        assert (migration.status, migration.checkpoint) == ("failed", 2)
+    assert store.resolve("u1")[0] == store.collection_name  # still served by the old collection
+
+    function.fail_after = None
+    function.calls = 0
+    assert migrator_for(store, router, session_factory, function).run(["u1"], settle_seconds=0) == [("u1", "switched")]
+    assert function.calls == 2  # the remaining three chunks, two per batch
+    with session_factory() as db:
+        [status] = migration_status(db)
+    assert (status["chunks_done"], status["chunks_total"], status["status"]) == (5, 5, "switched")
+
+
+def test_cutover_reconciles_writes_made_during_the_copy(store, router, session_factory):
+    migrator = migrator_for(store, router, session_factory, NewEmbeddingFunction())
+    assert migrator.run(["u1"], cutover=False) == [("u1", "copied")]
+
+    store.save_vector(["uploaded during the copy"], {"id": "doc3", "user_id": "u1"})
+    store.save_vector(["rewritten during the copy"], {"id": "doc1", "user_id": "u1"}, replace=True, start=2)
+    store.client.get_collection(store.collection_name, embedding_function=None).delete(ids=["doc1_0"])
+    assert store.resolve("u1")[0] == store.collection_name
+
+    with session_factory() as db:
+        migrator.cutover(db, db.query(EmbeddingMigration).one(), settle_seconds=0)
+
+    target = store.client.get_collection(migrator.target_collection, embedding_function=None)
+    assert sorted(target.get(where={"user_id": "u1"})["ids"]) == [
+        "doc1_1", "doc1_2", "doc1_3", "doc1_4", "doc3_0"
+    ]
+    assert target.get(ids=["doc1_2"])["documents"] == ["rewritten during the copy"]
+    assert store.resolve("u1")[0] == migrator.target_collection
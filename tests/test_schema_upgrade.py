@@ -0,0 +1,58 @@
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app.db.base import Base
+from app.db.upgrade import ADDED_COLUMNS, upgrade_schema
+from app.models.models import ChatBot, ChatMessage, Document
+
+USER_ID = "946cc9ce4fc04a32bf2762287f31b995"
+
+
+def old_database():
+    """A database whose tables predate every column in ADDED_COLUMNS."""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        for table_name, column_name, _ in ADDED_COLUMNS:
+            for index in inspect(connection).get_indexes(table_name):
+                if column_name in index["column_names"]:
+                    connection.exec_driver_sql(f"DROP INDEX {index['name']}")
+            connection.exec_driver_sql(f"ALTER TABLE {table_name} DROP COLUMN {column_name}")
+        connection.exec_driver_sql(
+            "INSERT INTO users (id, email, hashed_password) VALUES (?, 'owner@example.com', 'x')", (USER_ID,)
+        )
+        for bot_id in ("bot-1", "bot-2"):
+            connection.exec_driver_sql(
+                "INSERT INTO chat_bots (id, name, system_prompt, welcome_message, theme, primary_color, user_id) "
+                "VALUES (?, 'Bot', 'p', 'w', 'light', '#000', ?)", (bot_id, USER_ID)
+            )
+        connection.exec_driver_sql(
+            "INSERT INTO documents (id, user_id, filename, filepath, file_type) VALUES ('doc-1', ?, 'a.pdf', 'a.pdf', 'pdf')",
+            (USER_ID,)
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO chat_messages (id, text, sender, user_id, chatbot_id) VALUES ('m-1', 'hi', 'user', ?, 'bot-1')",
+            (USER_ID,)
+        )
+    return engine
+
+
+def test_existing_tables_get_the_new_columns():
+    engine = old_database()
+    for _ in range(2):  # runs on every start
+        with engine.begin() as connection:
+            upgrade_schema(connection)
+
+    with Session(engine) as db:
+        bots = db.query(ChatBot).order_by(ChatBot.id).all()
+        assert [(bot.chunk_size_tokens, bot.rate_limit_per_minute) for bot in bots] == [(None, None)] * 2
+        codes = [bot.embed_code for bot in bots]
+        assert all(codes) and len(set(codes)) == 2
+        doc = db.get(Document, "doc-1")
+        assert (doc.status, doc.storage_key) == ("ready", None)
+        assert (doc.pages_total, doc.chunks_indexed, doc.indexed_at) == (None, None, None)
+        assert doc.processing_started_at is None
+        assert db.get(ChatMessage, "m-1").starts_conversation is None
+    unique = [index for index in inspect(engine).get_indexes("chat_bots") if index["column_names"] == ["embed_code"]]
+    assert unique and unique[0]["unique"]
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+from uuid import UUID
+
+from app.models.models import ChatMessage, User
+from app.utils.search import fts5_query, search_messages
+
+USER_ID = UUID("946cc9ce-4fc0-4a32-bf27-62287f31b995")
+OTHER_ID = UUID("00000000-0000-0000-0000-000000000001")
+BASE = datetime(2024, 5, 1, 12, 0)
+
+
+def add_message(db_session, text, days=0, chatbot_id="bot-a", user_id=USER_ID):
+    message = ChatMessage(
+        text=text, sender="user", created_at=BASE + timedelta(days=days), user_id=user_id, chatbot_id=chatbot_id,
+    )
+    db_session.add(message)
+    return message
+
+
+def seed(db_session):
+    db_session.add_all([
+        User(id=USER_ID, email="owner@example.com", hashed_password="x"),
+        User(id=OTHER_ID, email="other@example.com", hashed_password="x"),
+    ])
+    add_message(db_session, "My refund has not arrived yet", days=0)
+    add_message(db_session, "Refund refund refund, where is my refund?", days=1)
+    add_message(db_session, "How do I reset my password?", days=2)
+    add_message(db_session, "Refunds on the other bot", days=3, chatbot_id="bot-b")
+    add_message(db_session, "Someone else's refund", user_id=OTHER_ID)
+    db_session.commit()
+
+
+def test_fts5_query_quotes_user_input():
+    assert fts5_query('refund "OR" NEAR(x') == '"refund" "OR" "NEAR" "x"*'
+    assert fts5_query("  ?!  ") == ""
+
+
+def test_search_ranks_and_scopes_to_user(db_session):
+    seed(db_session)
+
+    results = search_messages(db_session, USER_ID, "refund")["results"]
+
+    assert sorted(r["chatbot_id"] for r in results) == ["bot-a", "bot-a", "bot-b"]
+    assert results[0]["snippet"].count("<mark>") == 4  # the message that says it four times ranks first
+    assert results[0]["score"] >= results[1]["score"] >= results[2]["score"]
+
+
+def test_search_filters_and_paginates(db_session):
+    seed(db_session)
+
+    filtered = search_messages(db_session, USER_ID, "refund", chatbot_id="bot-a", start=BASE + timedelta(hours=1))
+    assert [r["snippet"] for r in filtered["results"]] == [
+        "<mark>Refund</mark> <mark>refund</mark> <mark>refund</mark>, where is my <mark>refund</mark>?"
+    ]
+
+    first = search_messages(db_session, USER_ID, "refund", limit=2)
+    second = search_messages(db_session, USER_ID, "refund", limit=2, offset=2)
+    assert first["has_more"] and not second["has_more"]
+    assert len({r["id"] for r in first["results"] + second["results"]}) == 3
+
+
+def test_index_follows_updates_and_deletes(db_session):
+    seed(db_session)
+    message = db_session.query(ChatMessage).filter(ChatMessage.text.like("How do I reset%")).one()
+
+    message.text = "Where is my invoice?"
+    db_session.commit()
+    assert search_messages(db_session, USER_ID, "password")["results"] == []
+    assert len(search_messages(db_session, USER_ID, "invoice")["results"]) == 1
+
+    db_session.delete(message)
+    db_session.commit()
+    assert search_messages(db_session, USER_ID, "invoice")["results"] == []
+
+
+def test_search_endpoint(client, db_session):
+    seed(db_session)
+
+    response = client.get("/chatbots/messages/search", params={"q": "passw"})
+
+    assert response.status_code == 200
+    assert [r["snippet"] for r in response.json()["results"]] == ["How do I reset my <mark>password</mark>?"]
+    assert client.get("/chatbots/messages/search", params={"q": "x", "limit": 500}).status_code == 422
@@ -0,0 +1,123 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+from app.db.session import get_db
+from app.main import app
+from app.models.models import ChatMessage
+from app.routes import document
+from app.utils.metrics import metrics
+from app.utils.singleflight import SingleFlight, normalize_query
+
+
+class SlowStubLLM:
+    def __init__(self, delay: float = 0.3):
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, query, context, message_history=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return f"answer to {query}"
+
+
+def test_normalize_query():
+    assert normalize_query("  What is the  Return policy? ") == normalize_query("what is the return policy")
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight("test")
+    calls = []
+
+    def work(value):
+        calls.append(value)
+        time.sleep(0.2)
+        return value * 2
+
+    async def run():
+        return await asyncio.gather(*(flight.do("key", work, 21) for _ in range(10)))
+
+    assert asyncio.run(run()) == [42] * 10
+    assert calls == [21]
+    assert flight.in_flight() == 0
+
+
+@pytest.fixture
+def file_db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'chat.db'}", connect_args={"check_same_thread": False, "timeout": 30})
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    yield SessionLocal
+    app.dependency_overrides.clear()
+    engine.dispose()
+
+
+def test_identical_chat_requests_are_coalesced(file_db, monkeypatch):
+    llm = SlowStubLLM()
+    retrievals = []
+    monkeypatch.setattr(document.precess_pdf, "query_collection", lambda query, filter, tenant=None, timeout=None, query_vector=None: retrievals.append(query) or [["ctx"]])
+    monkeypatch.setattr(document.precess_pdf, "get_ai_response", llm)
+    metrics.reset()
+
+    payload = {"query": "What is your refund policy?", "document_id": ["d2", "d1"], "chatbot_id": "bot-1"}
+
+    async def send_all():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            requests = [client.post("/chatbots/chat", json=payload) for _ in range(8)]
+            requests.append(client.post("/chatbots/chat", json={**payload, "query": "what is your refund policy"}))
+            return await asyncio.gather(*requests)
+
+    responses = asyncio.run(send_all())
+
+    assert all(response.status_code == 200 for response in responses)
+    assert {response.json() for response in responses} == {"answer to What is your refund policy?"}
+    assert llm.calls == 1
+    assert len(retrievals) == 1
+    assert metrics.get("singleflight_coalesced_total", flight="chat") == 8
+
+    db = file_db()
+    try:
+        messages = db.query(ChatMessage).filter(ChatMessage.chatbot_id == "bot-1").all()
+    finally:
+        db.close()
+    assert sum(1 for message in messages if message.sender == "user") == 9
+    assert sum(1 for message in messages if message.sender == "bot") == 9
+
+
+def test_requests_with_history_are_not_coalesced(file_db, monkeypatch):
+    llm = SlowStubLLM(delay=0.1)
+    monkeypatch.setattr(document.precess_pdf, "query_collection", lambda query, filter, tenant=None, timeout=None, query_vector=None: [["ctx"]])
+    monkeypatch.setattr(document.precess_pdf, "get_ai_response", llm)
+
+    payload = {
+        "query": "And shipping?",
+        "document_id": ["d1"],
+        "chatbot_id": "bot-1",
+        "messageHistory": [{"role": "user", "content": "hi"}],
+    }
+
+    async def send_all():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(client.post("/chatbots/chat", json=payload) for _ in range(3)))
+
+    asyncio.run(send_all())
+    assert llm.calls == 3
@@ -0,0 +1,139 @@
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import chromadb
+import pytest
+
+from app.utils.process_pdf import ProcessPdfDocument
+from app.utils.storage import DiskCache, DocumentStore, LocalBackend, ObjectNotFound
+from benchmarks._common import make_synthetic_pdf
+from tests.test_embeddings import FixedEmbeddingFunction
+
+
+class CountingBackend(LocalBackend):
+    def __init__(self, root, delay=0.0):
+        super().__init__(root)
+        self.fetches = 0
+        self.delay = delay
+        self._lock = threading.Lock()
+
+    def fetch(self, key, path):
+        with self._lock:
+            self.fetches += 1
+        time.sleep(self.delay)
+        super().fetch(key, path)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DocumentStore(CountingBackend(str(tmp_path / "remote")), DiskCache(str(tmp_path / "cache"), max_bytes=1000))
+
+
+def read(store, key):
+    with store.local_path(key) as path:
+        with open(path, "rb") as f:
+            return f.read()
+
+
+def test_hits_are_served_locally_and_counted(store):
+    store.put("u/a.pdf", io.BytesIO(b"a" * 100))
+    assert read(store, "u/a.pdf") == b"a" * 100
+    assert read(store, "u/a.pdf") == b"a" * 100
+
+    stats = store.cache.stats()
+    assert store.backend.fetches == 1
+    assert (stats["hits"], stats["misses"], stats["bytes_saved"]) == (1, 1, 100)
+    assert stats["hit_rate"] == 0.5
+
+
+def test_identical_content_is_stored_once_and_new_versions_refetch(store):
+    store.put("u/a.pdf", io.BytesIO(b"same"))
+    store.put("v/b.pdf", io.BytesIO(b"same"))
+    read(store, "u/a.pdf")
+    read(store, "v/b.pdf")
+    assert len(os.listdir(os.path.join(store.cache.directory, "blobs"))) == 1
+
+    time.sleep(0.01)
+    store.put("u/a.pdf", io.BytesIO(b"changed"))
+    assert read(store, "u/a.pdf") == b"changed"
+    assert store.backend.fetches == 3
+
+
+def test_lru_eviction_by_total_bytes(store):
+    for name in "abcd":
+        store.put(f"u/{name}.pdf", io.BytesIO(name.encode() * 300))
+    read(store, "u/a.pdf")
+    read(store, "u/b.pdf")
+    read(store, "u/c.pdf")
+    read(store, "u/a.pdf")  # a is now more recent than b
+    read(store, "u/d.pdf")  # 1200 bytes > 1000: b is evicted
+
+    assert store.cache.total_bytes <= 1000
+    assert store.cache.stats()["evictions"] == 1
+    fetches = store.backend.fetches
+    read(store, "u/a.pdf")
+    assert store.backend.fetches == fetches
+    read(store, "u/b.pdf")
+    assert store.backend.fetches == fetches + 1
+
+
+def test_workers_sharing_a_directory_share_its_bound(store, tmp_path):
+    other = DocumentStore(store.backend, DiskCache(store.cache.directory, max_bytes=1000))  # a second worker
+    for name in "abc":
+        store.put(f"u/{name}.pdf", io.BytesIO(name.encode() * 400))
+    read(store, "u/a.pdf")
+    read(other, "u/b.pdf")
+    read(other, "u/c.pdf")  # 1200 bytes on disk: a, cached by the first worker, is evicted
+
+    blobs = os.path.join(store.cache.directory, "blobs")
+    assert sum(os.path.getsize(os.path.join(blobs, name)) for name in os.listdir(blobs)) <= 1000
+    fetches = store.backend.fetches
+    read(store, "u/a.pdf")
+    assert store.backend.fetches == fetches + 1
+
+
+def test_reader_survives_eviction(store):
+    store.put("u/a.pdf", io.BytesIO(b"a" * 600))
+    store.put("u/b.pdf", io.BytesIO(b"b" * 600))
+    with store.local_path("u/a.pdf") as path:
+        read(store, "u/b.pdf")  # evicts a while it is being read
+        with open(path, "rb") as f:
+            assert f.read() == b"a" * 600
+    assert not os.path.exists(path)
+
+
+def test_concurrent_misses_share_one_fetch(tmp_path):
+    store = DocumentStore(CountingBackend(str(tmp_path / "remote"), delay=0.1), DiskCache(str(tmp_path / "cache"), 10_000))
+    store.put("u/a.pdf", io.BytesIO(b"x" * 500))
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        assert set(pool.map(lambda _: read(store, "u/a.pdf"), range(8))) == {b"x" * 500}
+    assert store.backend.fetches == 1
+    assert not os.listdir(os.path.join(store.cache.directory, "tmp"))
+
+
+def test_missing_and_invalid_keys(store):
+    with pytest.raises(ObjectNotFound):
+        read(store, "u/missing.pdf")
+    with pytest.raises(ValueError):
+        store.put("../outside.pdf", io.BytesIO(b"x"))
+
+
+def test_process_pdf_reads_by_key(tmp_path):
+    store = DocumentStore(CountingBackend(str(tmp_path / "remote")), DiskCache(str(tmp_path / "cache"), 10 * 1024 * 1024))
+    pipeline = ProcessPdfDocument(
+        client=chromadb.PersistentClient(path=str(tmp_path / "chroma")),
+        embedding_function=FixedEmbeddingFunction(),
+        document_store=store,
+    )
+    with open(make_synthetic_pdf(str(tmp_path / "doc.pdf"), pages=2, words_per_page=150), "rb") as f:
+        store.put("u1/doc1/doc.pdf", f)
+
+    first = pipeline.process_pdf("u1", "doc.pdf", "doc1", storage_key="u1/doc1/doc.pdf")
+    again = pipeline.process_pdf("u1", "doc.pdf", "doc1-copy", storage_key="u1/doc1/doc.pdf")
+
+    assert first and first == again
+    assert store.backend.fetches == 1
+    assert pipeline.process_pdf("u1", "gone.pdf", "doc2", storage_key="u1/doc2/gone.pdf") is None
@@ -0,0 +1,63 @@
+import os
+
+import chromadb
+import pytest
+
+from app.utils.process_pdf import ProcessPdfDocument
+from app.utils.storage import ExtractedTextCache
+from benchmarks._common import make_synthetic_pdf
+from tests.test_embeddings import FixedEmbeddingFunction
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ExtractedTextCache(str(tmp_path / "text"))
+
+
+def test_pages_round_trip_and_new_versions_replace_old(cache):
+    pages = [(1, "first page"), (2, "second page ü")]
+    assert list(cache.write_through("doc1", "aaa", iter(pages))) == pages
+    assert cache.pages("doc1", "bbb") is None
+    assert list(cache.pages("doc1", "aaa")) == pages
+
+    list(cache.write_through("doc1", "bbb", iter([(1, "revised")])))
+    assert cache.pages("doc1", "aaa") is None
+    assert list(cache.pages("doc1")) == [(1, "revised")]
+
+
+def test_interrupted_extraction_is_not_cached(cache):
+    def failing_pages():
+        yield 1, "first page"
+        raise RuntimeError("corrupt page")
+
+    with pytest.raises(RuntimeError):
+        list(cache.write_through("doc1", "aaa", failing_pages()))
+    assert cache.pages("doc1") is None
+    assert os.listdir(os.path.join(cache.directory, "doc1")) == []
+    with pytest.raises(ValueError):
+        cache.pages("../doc1")
+
+
+def test_reindexing_reads_cached_text_instead_of_the_pdf(tmp_path, cache, monkeypatch):
+    pipeline = ProcessPdfDocument(
+        client=chromadb.PersistentClient(path=str(tmp_path / "chroma")),
+        embedding_function=FixedEmbeddingFunction(),
+        text_cache=cache,
+    )
+    parses = []
+    parse_pdf = ProcessPdfDocument.parse_pdf
+    monkeypatch.setattr(pipeline, "parse_pdf", lambda path: parses.append(path) or parse_pdf(path))
+    pdf = make_synthetic_pdf(str(tmp_path / "doc.pdf"), pages=3, words_per_page=300)
+    metadata = {"source": "doc.pdf", "user_id": "u1", "id": "doc1"}
+
+    first = pipeline.load_pdf(pdf, metadata, cleanup=False)
+    assert pipeline.load_pdf(pdf, metadata, cleanup=True, replace=True) == first
+    assert len(parses) == 1 and not os.path.exists(pdf)
+
+    smaller = pipeline.reindex_document("u1", "doc.pdf", "doc1", chunk_size=100, chunk_overlap=10)
+    larger = pipeline.reindex_document("u1", "doc.pdf", "doc1", chunk_size=400, chunk_overlap=10)
+    assert len(parses) == 1
+    assert smaller > first > larger
+    stored = pipeline.get_or_create_collection().get(where={"id": "doc1"})
+    assert len(stored["ids"]) == larger
+    assert cache.stats()["hits"] == 3
@@ -0,0 +1,146 @@
+import io
+import os
+
+import boto3
+import pytest
+
+from app.models.models import Document
+from app.routes import document
+from app.setting import current_config
+from app.utils.process_pdf import AWSHelper
+from app.utils.storage import DiskCache, DocumentStore, S3Backend
+
+moto = pytest.importorskip("moto")
+
+BUCKET = "cleary-test-uploads"
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def s3(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setattr(current_config, "S3_UPLOADS_ENABLED", True)
+    monkeypatch.setattr(current_config, "S3_BUCKET_NAME", BUCKET)
+    monkeypatch.setattr(current_config, "S3_MULTIPART_THRESHOLD_MB", 5)
+    monkeypatch.setattr(current_config, "S3_MULTIPART_CHUNK_MB", 5)
+    with moto.mock_aws():
+        boto3.client("s3", region_name=current_config.AWS_REGION).create_bucket(
+            Bucket=BUCKET, CreateBucketConfiguration={"LocationConstraint": current_config.AWS_REGION}
+        )
+        helper = AWSHelper()
+        yield helper
+        helper.executor.shutdown()
+
+
+@pytest.fixture
+def s3_store(s3, tmp_path, monkeypatch):
+    """Document store on the mocked bucket, used by the upload routes."""
+    store = DocumentStore(
+        S3Backend(s3.s3_client, BUCKET, s3.transfer_config),
+        DiskCache(str(tmp_path / "cache"), 50 * MB),
+        executor=s3.executor,
+    )
+    monkeypatch.setattr(document, "save_pdf", s3)
+    monkeypatch.setattr(document, "document_store", store)
+    return store
+
+
+def test_large_files_use_multipart_upload(s3, s3_store):
+    payload = os.urandom(12 * MB)
+    s3_store.put_many([("u1/d1/big.pdf", io.BytesIO(payload), "application/pdf")])
+
+    head = s3.s3_client.head_object(Bucket=BUCKET, Key="u1/d1/big.pdf")
+    assert head["ContentLength"] == len(payload)
+    assert head["ETag"].strip('"').endswith("-3")
+
+
+def test_put_many_stores_every_file(s3, s3_store):
+    s3_store.put_many([(f"u2/d{i}/doc.pdf", io.BytesIO(f"file {i}".encode()), "application/pdf") for i in range(20)])
+
+    keys = [obj["Key"] for obj in s3.s3_client.list_objects_v2(Bucket=BUCKET)["Contents"]]
+    assert sorted(keys) == sorted(f"u2/d{i}/doc.pdf" for i in range(20))
+    body = s3.s3_client.get_object(Bucket=BUCKET, Key="u2/d7/doc.pdf")["Body"].read()
+    assert body == b"file 7"
+
+
+def test_upload_endpoint_stores_every_file(s3, s3_store, client, db_session, monkeypatch):
+    processed = []
+    monkeypatch.setattr(document.precess_pdf, "process_pdf", lambda **kwargs: processed.append(kwargs["file_name"]))
+
+    files = [("files", (f"doc{i}.pdf", f"%PDF {i}".encode(), "application/pdf")) for i in range(5)]
+    response = client.post("/chatbots/upload", files=files)
+
+    assert response.status_code == 200
+    assert sorted(processed) == [f"doc{i}.pdf" for i in range(5)]
+    assert db_session.query(Document).count() == 5
+    keys = [obj["Key"] for obj in s3.s3_client.list_objects_v2(Bucket=BUCKET)["Contents"]]
+    assert sorted(keys) == sorted(doc.storage_key for doc in db_session.query(Document))
+
+
+def test_non_pdf_rejects_whole_upload(s3, s3_store, client):
+    files = [("files", ("ok.pdf", b"%PDF", "application/pdf")), ("files", ("notes.txt", b"hi", "text/plain"))]
+
+    assert client.post("/chatbots/upload", files=files).status_code == 400
+    assert "Contents" not in s3.s3_client.list_objects_v2(Bucket=BUCKET)
+
+
+def upload_with_presigned_post(presigned, payload: bytes):
+    import requests
+
+    return requests.post(presigned["url"], data=presigned["fields"], files={"file": ("doc.pdf", payload)})
+
+
+def test_presigned_upload_end_to_end(s3, s3_store, client, db_session, tmp_path, monkeypatch):
+    import chromadb
+
+    from app.utils.process_pdf import ProcessPdfDocument
+    from benchmarks._common import make_synthetic_pdf
+    from tests.test_embeddings import FixedEmbeddingFunction
+
+    pipeline = ProcessPdfDocument(
+        client=chromadb.PersistentClient(path=str(tmp_path / "chroma")),
+        embedding_function=FixedEmbeddingFunction(),
+        document_store=s3_store,
+    )
+    monkeypatch.setattr(document, "precess_pdf", pipeline)
+    with open(make_synthetic_pdf(str(tmp_path / "source.pdf"), pages=3, words_per_page=200), "rb") as f:
+        payload = f.read()
+
+    response = client.post("/chatbots/uploads/presign", json={"filename": "report.pdf", "size": len(payload)})
+    assert response.status_code == 200
+    presigned = response.json()
+    document_id = presigned["document_id"]
+    assert db_session.get(Document, document_id).status == "pending_upload"
+
+    # Completing before the browser uploaded anything is refused
+    assert client.post(f"/chatbots/uploads/{document_id}/complete").status_code == 400
+
+    assert upload_with_presigned_post(presigned, payload).status_code in (200, 204)
+    response = client.post(f"/chatbots/uploads/{document_id}/complete")
+    assert response.json() == {"document_id": document_id, "status": "processing"}
+
+    db_session.expire_all()
+    doc = db_session.get(Document, document_id)
+    assert doc.status == "ready"
+    stored = pipeline.get_or_create_collection().get(where={"id": document_id})
+    assert stored["ids"] and {meta["source"] for meta in stored["metadatas"]} == {"report.pdf"}
+    assert s3_store.cache.stats()["misses"] == 1
+
+    # Retrying the completion does not queue a second ingestion
+    assert client.post(f"/chatbots/uploads/{document_id}/complete").json()["status"] == "ready"
+
+
+def test_presigned_upload_rejects_non_pdf_content(s3, s3_store, client, db_session):
+    presigned = client.post("/chatbots/uploads/presign", json={"filename": "x.pdf", "size": 10}).json()
+    upload_with_presigned_post(presigned, b"not a pdf!")
+
+    assert client.post(f"/chatbots/uploads/{presigned['document_id']}/complete").status_code == 400
+    assert s3.head_object(f"{db_session.get(Document, presigned['document_id']).storage_key}") is None
+
+
+def test_presign_validates_request(s3, s3_store, client):
+    assert client.post("/chatbots/uploads/presign", json={"filename": "x.txt", "size": 10}).status_code == 400
+    too_big = (current_config.DIRECT_UPLOAD_MAX_MB + 1) * MB
+    assert client.post("/chatbots/uploads/presign", json={"filename": "x.pdf", "size": too_big}).status_code == 400
@@ -0,0 +1,117 @@
+import threading
+from uuid import UUID
+
+from app.models.models import UsageRecord, User
+from app.routes import document
+from app.utils.llm_scheduler import llm_scheduler
+from sqlalchemy.exc import IntegrityError
+
+from app.db.upsert import increment_rows
+from app.utils import usage as usage_module
+from app.utils.metrics import metrics
+from app.utils.usage import UsageMeter, usage_summary
+
+USER_ID = UUID("946cc9ce-4fc0-4a32-bf27-62287f31b995")
+
+
+def add_user(db_session):
+    db_session.add(User(id=USER_ID, email="owner@example.com", hashed_password="x"))
+    db_session.commit()
+
+
+def test_record_buffers_until_flush(db_session, usage):
+    add_user(db_session)
+
+    usage.record(USER_ID, "bot-a", llm_calls=1, prompt_tokens=100, completion_tokens=20)
+    usage.record(str(USER_ID), "bot-a", llm_calls=1, prompt_tokens=50, completion_tokens=5)
+    usage.record(USER_ID, embedding_tokens=300)
+    usage.record("default", llm_calls=1)  # not a user, not metered
+
+    assert db_session.query(UsageRecord).count() == 0
+    assert usage.flush() == 2
+    usage.record(USER_ID, "bot-a", llm_calls=1, prompt_tokens=10)
+    usage.flush()
+
+    summary = usage_summary(db_session, USER_ID)
+    assert summary["totals"]["llm_calls"] == 3
+    assert summary["totals"]["prompt_tokens"] == 160
+    assert summary["totals"]["embedding_tokens"] == 300
+    assert [c["chatbot_id"] for c in summary["chatbots"]] == [None, "bot-a"]
+
+
+def test_failed_flush_keeps_counters(db_session, usage, monkeypatch):
+    add_user(db_session)
+    session_factory = usage.session_factory
+    usage.record(USER_ID, "bot-a", requests=1, latency_ms=120)
+
+    def broken():
+        raise RuntimeError("database down")
+
+    monkeypatch.setattr(usage, "session_factory", broken)
+    assert usage.flush() == 0
+    assert usage.pending() == 1
+
+    monkeypatch.setattr(usage, "session_factory", session_factory)
+    usage.flush()
+    assert usage_summary(db_session, USER_ID)["totals"]["avg_latency_ms"] == 120
+
+
+def test_rejected_rows_are_dropped_and_the_rest_written(db_session, usage, monkeypatch):
+    add_user(db_session)
+
+    def reject_bad_rows(db, model, rows, **kwargs):
+        if any(row["chatbot_id"] == "deleted-bot" for row in rows):
+            raise IntegrityError("INSERT INTO usage_records", {}, Exception("FOREIGN KEY constraint failed"))
+        increment_rows(db, model, rows, **kwargs)
+
+    monkeypatch.setattr(usage_module, "increment_rows", reject_bad_rows)
+    dropped = metrics.get("usage_rows_dropped_total")
+    usage.record(USER_ID, "bot-a", requests=1)
+    usage.record(USER_ID, "deleted-bot", requests=1)
+    usage.record(USER_ID, requests=1)
+
+    assert usage.flush() == 2
+    assert usage.pending() == 0
+    assert metrics.get("usage_rows_dropped_total") == dropped + 1
+    assert usage_summary(db_session, USER_ID)["totals"]["requests"] == 2
+
+
+def test_concurrent_records_are_not_lost(db_session, usage):
+    add_user(db_session)
+    meter = UsageMeter(usage.session_factory, flush_interval=0.01)
+    meter.start()
+
+    def worker():
+        for _ in range(500):
+            meter.record(USER_ID, "bot-a", requests=1)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    meter.stop()
+
+    assert meter.pending() == 0
+    assert usage_summary(db_session, USER_ID)["totals"]["requests"] == 4000
+
+
+def test_chat_is_metered(client, db_session, monkeypatch):
+    add_user(db_session)
+
+    class Reply:
+        content = " answer "
+        usage_metadata = {"input_tokens": 42, "output_tokens": 7}
+
+    monkeypatch.setattr(document.precess_pdf, "query_collection", lambda **kwargs: ["context"])
+    monkeypatch.setattr(llm_scheduler, "invoke", lambda *args, **kwargs: Reply())
+
+    response = client.post("/chatbots/chat", json={"query": "hello", "document_id": ["d1"], "chatbot_id": "bot-a"})
+    assert response.status_code == 200
+
+    usage = client.get("/users/usage").json()
+    assert usage["chatbots"][0]["chatbot_id"] == "bot-a"
+    assert usage["totals"]["requests"] == 1
+    assert usage["totals"]["prompt_tokens"] == 42
+    assert usage["totals"]["completion_tokens"] == 7
+    assert usage["totals"]["embedding_tokens"] == 2
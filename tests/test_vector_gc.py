@@ -0,0 +1,97 @@
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import chromadb
+import pytest
+from chromadb.api.types import EmbeddingFunction
+
+from app.models.models import Document, User
+from app.utils import vector_gc as vector_gc_module
+from app.utils.process_pdf import HandleChromadb
+from app.utils.vector_gc import VectorGarbageCollector
+
+
+class LengthEmbeddingFunction(EmbeddingFunction):
+    def __call__(self, input):
+        return [[float(len(text)), 1.0] for text in input]
+
+    @staticmethod
+    def name() -> str:
+        return "length-test"
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HandleChromadb(
+        client=chromadb.PersistentClient(path=str(tmp_path / "chroma")),
+        embedding_function=LengthEmbeddingFunction(),
+    )
+
+
+@pytest.fixture
+def collector(store, session_factory, db_session, tmp_path):
+    user = User(id=uuid.uuid4(), email="gc@example.com", hashed_password="x")
+    db_session.add(user)
+    now = datetime.now(timezone.utc)
+    long_ago = now - timedelta(days=2)
+    # "indexing" is being re-indexed long after its upload
+    for document_id, status, uploaded_at, started_at in (("live", "ready", now, None),
+                                                         ("indexing", "processing", long_ago, now),
+                                                         ("broken", "failed", now, None),
+                                                         ("abandoned", "processing", long_ago, long_ago)):
+        db_session.add(Document(id=document_id, user_id=user.id, filename="a.pdf", filepath="a.pdf",
+                                file_type="pdf", status=status, uploaded_at=uploaded_at,
+                                processing_started_at=started_at))
+    db_session.commit()
+    # Interleave live and orphaned chunks, so deletions happen in the middle of pages
+    for document_id in ("live", "gone", "indexing", "broken", "abandoned"):
+        store.save_vector([f"{document_id} chunk {i}" for i in range(3)], {"id": document_id, "user_id": "u"})
+    store.client.create_collection("unrelated").add(ids=["x"], embeddings=[[1.0, 2.0]])
+    return VectorGarbageCollector(store.client, session_factory, interval_hours=0, page_size=2, delete_batch_size=1,
+                                  lock_path=str(tmp_path / "vector_gc.lock"), stale_processing_hours=6)
+
+
+def remaining_documents(store) -> list:
+    metadatas = store.get_or_create_collection().get(include=["metadatas"])["metadatas"]
+    return sorted(metadata["id"] for metadata in metadatas)
+
+
+def test_dry_run_reports_orphans_without_deleting(collector, store):
+    report = collector.collect(dry_run=True)
+
+    assert (report["scanned"], report["orphans"], report["deleted"]) == (15, 9, 0)
+    assert report["collections"][store.collection_name]["documents"] == {"gone": 3, "broken": 3, "abandoned": 3}
+    assert len(remaining_documents(store)) == 15
+
+
+def test_orphans_are_deleted_across_pages(collector, store):
+    report = collector.collect()
+
+    assert (report["scanned"], report["orphans"], report["deleted"]) == (15, 9, 9)
+    assert remaining_documents(store) == ["indexing"] * 3 + ["live"] * 3
+    assert store.client.get_collection("unrelated").count() == 1
+    assert collector.collect()["orphans"] == 0
+    assert collector.stats()["scanned"] == 6
+
+
+def test_scheduled_runs_happen_in_one_process_per_interval(collector, store, session_factory):
+    other_worker = VectorGarbageCollector(store.client, session_factory, interval_hours=1,
+                                          lock_path=collector.lock_path)
+    collector.interval_hours = 1
+
+    assert collector.collect_scheduled()["deleted"] == 9
+    assert other_worker.collect_scheduled() is None  # ran within the interval
+
+    with open(collector.lock_path, "w") as f:
+        f.write(str(time.time() - 3600))
+    assert other_worker.collect_scheduled()["deleted"] == 0
+
+
+def test_reset_schedules_garbage_collection(client, monkeypatch):
+    runs = []
+    monkeypatch.setattr(vector_gc_module.vector_gc, "collect", lambda: runs.append(True))
+
+    assert client.delete("/reset").status_code == 200
+    assert client.delete("/reset/all").status_code == 200
+    assert runs == [True, True]
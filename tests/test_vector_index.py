@@ -0,0 +1,110 @@
+import time
+
+import chromadb
+import numpy as np
+import pytest
+
+from app.setting import current_config
+from app.utils.process_pdf import HandleChromadb
+from app.utils.vector_index import CompactIndexCache, CompactVectorIndex, UnsupportedFilter
+from tests.test_embeddings import FixedEmbeddingFunction
+
+
+def clustered_vectors(n, dimension=64, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension))
+    return (centers[rng.integers(0, clusters, n)] + 0.3 * rng.normal(size=(n, dimension))).astype(np.float32)
+
+
+@pytest.mark.parametrize("mode", ["float16", "int8", "pq"])
+def test_compact_search_with_rescoring_matches_exact_search(mode):
+    vectors = clustered_vectors(3000)
+    ids = [f"v{i}" for i in range(len(vectors))]
+    index = CompactVectorIndex(mode, pq_subvectors=16)
+    for start in range(0, len(ids), 1000):  # the row arrays grow past the rows in use
+        index.add(ids[start:start + 1000], vectors[start:start + 1000], [{"user_id": "u"}] * 1000)
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    hits = 0
+    for query in clustered_vectors(20, seed=1):
+        exact = set(np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:10])
+        # PQ is coarser, so it needs a wider candidate pool before exact re-scoring
+        candidates = index.search(query, 100 if mode == "pq" else 40)
+        rows = [int(vector_id[1:]) for vector_id, _ in candidates]
+        ranked = index.rescore(query, [f"v{r}" for r in rows], vectors[rows], 10)
+        hits += len(exact & {int(vector_id[1:]) for vector_id, _ in ranked})
+
+    assert hits / 200 >= 0.9
+    assert index.vector_bytes() <= vectors.nbytes / 2
+    assert index.memory_bytes() > index.vector_bytes()  # ids, row map and postings come on top
+
+
+def test_where_filter_limits_candidates():
+    index = CompactVectorIndex("int8")
+    vectors = clustered_vectors(6)
+    metadatas = [{"user_id": u, "id": d} for u, d in
+                 [("a", "d1"), ("a", "d2"), ("b", "d1"), ("a", "d3"), ("b", "d2"), ("a", "d1")]]
+    index.add([f"v{i}" for i in range(6)], vectors, metadatas)
+
+    where = {"$and": [{"user_id": {"$eq": "a"}}, {"id": {"$in": ["d1", "d2"]}}]}
+    found = {vector_id for vector_id, _ in index.search(vectors[0], 10, where=where)}
+
+    assert found == {"v0", "v1", "v5"}
+    index.remove(["v5"])
+    assert {vector_id for vector_id, _ in index.search(vectors[0], 10, where=where)} == {"v0", "v1"}
+    with pytest.raises(UnsupportedFilter):
+        index.search(vectors[0], 10, where={"id": {"$ne": "d1"}})
+
+
+def test_query_collection_uses_compact_index_without_reading_chroma(tmp_path, monkeypatch):
+    monkeypatch.setattr(current_config, "VECTOR_STORAGE_MODE", "int8")
+    monkeypatch.setattr(current_config, "VECTOR_LOG_DIR", str(tmp_path / "vector_log"))
+    client = chromadb.PersistentClient(path=str(tmp_path / "chroma"))
+    store = HandleChromadb(client=client, embedding_function=FixedEmbeddingFunction())
+    # Written before compact storage was enabled: exported from Chroma once, by the first query
+    client.get_or_create_collection(store.collection_name, embedding_function=None).add(
+        ids=["old_0"], documents=["old"], embeddings=FixedEmbeddingFunction()(["old"]),
+        metadatas=[{"id": "old", "user_id": "u1"}],
+    )
+    store.save_vector(["a", "bb", "ccc"], {"id": "doc1", "user_id": "u1"},
+                      metadatas=[{"id": "doc1", "user_id": "u1", "chunk_index": i} for i in range(3)])
+    assert sorted(store.query_collection("bb", filter={"user_id": {"$eq": "u1"}})[0]) == ["a", "bb", "ccc", "old"]
+
+    def unavailable(*args, **kwargs):
+        raise AssertionError("read Chroma")
+
+    monkeypatch.setattr(chromadb.api.models.Collection.Collection, "get", unavailable)
+    monkeypatch.setattr(chromadb.api.models.Collection.Collection, "query", unavailable)
+    store.save_vector(["dddd"], {"id": "doc2", "user_id": "u2"})
+    store.save_vector(["a2"], {"id": "doc1", "user_id": "u1"}, replace=True,
+                      metadatas=[{"id": "doc1", "user_id": "u1", "chunk_index": 0}])
+    store.delete_chunks_from({"id": "doc1", "user_id": "u1"}, 2)
+
+    result = store.query_collection("bb", filter={"user_id": {"$eq": "u1"}})
+    assert sorted(result[0]) == ["a2", "bb", "old"]
+
+
+def test_workers_apply_each_others_writes_from_the_log(tmp_path):
+    collection = chromadb.EphemeralClient().get_or_create_collection("shared", embedding_function=None)
+    vectors = clustered_vectors(6)
+    writer = CompactIndexCache("int8", str(tmp_path), refresh_seconds=0)
+    reader = CompactIndexCache("int8", str(tmp_path), refresh_seconds=0.02)
+    writer.added("shared", ["a", "b", "c"], vectors[:3], ["A", "B", "C"],
+                 [{"id": "doc1", "chunk_index": i} for i in range(3)])
+    index = reader.get(collection)
+    assert len(index) == 3
+
+    writer.added("shared", ["d"], vectors[[3]], ["D"], [{"id": "doc2", "chunk_index": 0}])
+    writer.added("shared", ["a"], vectors[[5]], ["A2"], [{"id": "doc1", "chunk_index": 0}])  # rewritten in place
+    writer.deleted("shared", ids=["b"])
+    writer.deleted("shared", where={"$and": [{"id": "doc1"}, {"chunk_index": {"$gte": 2}}]})
+
+    deadline = time.monotonic() + 5
+    while len(index) != 2 and time.monotonic() < deadline:
+        time.sleep(0.01)  # applied by the reader's refresh thread
+    reader.stop()
+    assert set(index.rows) == {"a", "d"}
+    stored, documents = index.stored(["a", "d"])
+    assert documents == ["A2", "D"]
+    assert np.allclose(stored[0], vectors[5] / np.linalg.norm(vectors[5]))
+    assert index.search(vectors[5], 1)[0][0] == "a"
@@ -0,0 +1,69 @@
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.models.models import ChatBot
+from app.routes.widget import widget_cache
+
+CURRENT_USER = uuid.UUID("946cc9ce-4fc0-4a32-bf27-62287f31b995")
+
+
+@pytest.fixture
+def chatbot(db_session: Session):
+    widget_cache.clear()
+    bot = ChatBot(
+        name="Helper",
+        system_prompt="Be nice",
+        welcome_message="Hi there!",
+        theme="light",
+        primary_color="#123456",
+        user_id=CURRENT_USER,
+    )
+    db_session.add(bot)
+    db_session.commit()
+    yield bot
+    widget_cache.clear()
+
+
+def test_widget_config_is_public_and_cacheable(client: TestClient, chatbot: ChatBot):
+    response = client.get(f"/widget/{chatbot.embed_code}/config")
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "embed_code": chatbot.embed_code,
+        "name": "Helper",
+        "welcome_message": "Hi there!",
+        "theme": "light",
+        "primary_color": "#123456",
+    }
+    assert response.headers["etag"].startswith('"')
+    assert "max-age=" in response.headers["cache-control"]
+    assert "system_prompt" not in response.text
+
+
+def test_matching_if_none_match_returns_304(client: TestClient, chatbot: ChatBot):
+    etag = client.get(f"/widget/{chatbot.embed_code}/config").headers["etag"]
+
+    response = client.get(f"/widget/{chatbot.embed_code}/config", headers={"If-None-Match": f'"other", W/{etag}'})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+
+def test_update_changes_etag(client: TestClient, chatbot: ChatBot):
+    etag = client.get(f"/widget/{chatbot.embed_code}/config").headers["etag"]
+
+    client.put(f"/chatbots/chatbot/{chatbot.id}/update", data={"welcomeMessage": "Welcome back!"})
+    response = client.get(f"/widget/{chatbot.embed_code}/config", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert response.json()["welcome_message"] == "Welcome back!"
+
+
+def test_unknown_embed_code_is_404(client: TestClient, db_session: Session):
+    widget_cache.clear()
+    assert client.get("/widget/does-not-exist/config").status_code == 404